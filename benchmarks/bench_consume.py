@@ -0,0 +1,75 @@
+"""Benchmark `GenaiMarkdown.consume` over a long stream of deltas.
+
+Compares the chunk list `GenaiMarkdown` appends to against the original approach of concatenating
+every delta onto the message, which copies the whole text each time.
+
+Run with:
+
+    python benchmarks/bench_consume.py
+"""
+import timeit
+from unittest import mock
+
+from genai.display import GenaiMarkdown
+
+DELTAS = 10_000
+
+
+class ConcatenatingMarkdown(GenaiMarkdown):
+    """The original quadratic implementation, kept here as a reference point."""
+
+    def __init__(self, message="", **kwargs):
+        super().__init__(message, **kwargs)
+        self._text = message
+
+    def append(self, delta):
+        self._text += delta
+        self._pending = True
+        if self._update_due():
+            self.update_displays()
+
+    @property
+    def message(self):
+        return self._text
+
+    @message.setter
+    def message(self, value):
+        self._text = value
+        self.update_displays()
+
+
+def make_deltas(n, size):
+    return [f"{i % 10}" * size for i in range(n)]
+
+
+def consume(cls, deltas, max_updates_per_second):
+    gm = cls(max_updates_per_second=max_updates_per_second)
+    gm.consume(iter(deltas))
+    return gm.message
+
+
+def main():
+    print(f"{'deltas':>7} {'size':>5} {'updates/s':>9} {'concatenating':>14} {'chunks':>10}")
+    with mock.patch("IPython.core.display_functions.display"):
+        for size in (4, 64):
+            deltas = make_deltas(DELTAS, size)
+            assert consume(ConcatenatingMarkdown, deltas, None) == consume(
+                GenaiMarkdown, deltas, None
+            )
+            for rate in (None, 10.0):
+                concatenating = min(
+                    timeit.repeat(
+                        lambda: consume(ConcatenatingMarkdown, deltas, rate), number=1, repeat=5
+                    )
+                )
+                chunks = min(
+                    timeit.repeat(lambda: consume(GenaiMarkdown, deltas, rate), number=1, repeat=5)
+                )
+                print(
+                    f"{DELTAS:>7} {size:>5} {rate or 'every':>9} "
+                    f"{concatenating * 1e3:>12.2f}ms {chunks * 1e3:>8.2f}ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
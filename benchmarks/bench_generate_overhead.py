@@ -0,0 +1,51 @@
+"""Measure genai's own overhead when streaming a suggestion, with no network.
+
+Streams a canned response from `FakeBackend` through `generate_next_from_history` and into a
+`GenaiMarkdown`, comparing the time taken with the latency the fake backend adds by itself.
+
+Run with:
+
+    python benchmarks/bench_generate_overhead.py
+"""
+import time
+from unittest import mock
+
+from genai import generate
+from genai.backends import FakeBackend
+from genai.display import GenaiMarkdown
+
+TEXT = "Here's how to fix it: " * 200
+
+
+def run(backend, n):
+    generate.use_backend(backend)
+    # Every request is identical, so make sure nothing is served from elsewhere
+    generate.coalesce_requests = False
+    try:
+        with mock.patch("IPython.core.display_functions.display"):
+            start = time.perf_counter()
+            for i in range(n):
+                gm = GenaiMarkdown()
+                gm.consume(generate.generate_next_from_history([], f"request {i}", stream=True))
+            return (time.perf_counter() - start) / n
+    finally:
+        generate.use_backend()
+        generate.coalesce_requests = True
+
+
+def main():
+    print(
+        f"{'ttft':>8} {'delay':>8} {'deltas':>7} {'latency':>11} {'measured':>11} {'overhead':>11}"
+    )
+    for ttft, delay in ((0.0, 0.0), (0.1, 0.0), (0.1, 0.001)):
+        backend = FakeBackend(TEXT, time_to_first_token=ttft, inter_token_delay=delay)
+        expected = ttft + delay * (len(backend.deltas) - 1)
+        measured = run(backend, 5)
+        print(
+            f"{ttft * 1e3:>6.0f}ms {delay * 1e3:>6.1f}ms {len(backend.deltas):>7} "
+            f"{expected * 1e3:>9.2f}ms {measured * 1e3:>9.2f}ms {(measured - expected) * 1e3:>9.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Benchmark `trim_messages_to_fit_token_limit` against the original pop-and-recount approach.
+
+Run with:
+
+    python benchmarks/bench_trim_messages.py
+"""
+import timeit
+
+from genai.tokens import (
+    num_tokens_from_messages,
+    token_count_cache,
+    trim_messages_to_fit_token_limit,
+)
+
+MODEL = "gpt-3.5-turbo-0301"
+MAX_TOKENS = 2048
+
+
+def make_messages(n):
+    return [
+        {
+            "role": "user" if i % 2 == 0 else "system",
+            "content": f"df_{i} = df.groupby('column_{i}').agg({{'value': 'sum'}}).head({i})",
+        }
+        for i in range(n)
+    ]
+
+
+def pop_and_recount(messages, model=MODEL, max_tokens=MAX_TOKENS):
+    """The original quadratic implementation, kept here as a reference point."""
+    num_tokens = num_tokens_from_messages(messages, model=model)
+    while num_tokens > max_tokens:
+        messages.pop(0)
+        num_tokens = num_tokens_from_messages(messages, model=model)
+    return messages
+
+
+def bench(trim, n, number):
+    def run():
+        token_count_cache.clear()
+        trim(make_messages(n), model=MODEL, max_tokens=MAX_TOKENS)
+
+    return min(timeit.repeat(run, number=number, repeat=3)) / number
+
+
+def main():
+    # Load the encoding before timing anything
+    num_tokens_from_messages(make_messages(1), model=MODEL)
+
+    print(f"{'messages':>10} {'pop+recount':>14} {'single pass':>14} {'speedup':>9}")
+    for n in (10, 100, 300, 1000):
+        assert pop_and_recount(make_messages(n)) == trim_messages_to_fit_token_limit(
+            make_messages(n), model=MODEL, max_tokens=MAX_TOKENS
+        )
+        number = max(1, 1000 // n)
+        before = bench(pop_and_recount, n, number)
+        after = bench(trim_messages_to_fit_token_limit, n, number)
+        print(f"{n:>10} {before * 1e3:>12.2f}ms {after * 1e3:>12.2f}ms {before / after:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,15 +12,30 @@
 
 
 def load_ipython_extension(ipython):
+    import openai
+
     import genai.suggestions
     from genai.magics import assist, prompt
+    from genai.session import install_session, preconnect
+    from genai.tokens import prewarm_encodings
 
     ipython.register_magic_function(assist, "cell")
     ipython.register_magic_function(prompt, "cell")
 
     genai.suggestions.register()
 
+    # Load tokenizers off the main thread so the first suggestion doesn't pay for it
+    prewarm_encodings()
+
+    # Likewise for connecting to the API, when there's a key to use it with
+    install_session()
+    if openai.api_key:
+        preconnect()
+
 
 def unload_ipython_extension(ipython):
+    import genai.suggestions
+
     # Unload the custom exception handler
     ipython.set_custom_exc((Exception,), None)
+    genai.suggestions.unregister(ipython)
@@ -0,0 +1,151 @@
+"""
+Backends that generate chat completions for genai.
+
+`genai.generate` asks its backend for completions instead of calling OpenAI directly. The default
+backend calls OpenAI's chat completions API. `FakeBackend` streams canned text from memory with
+configurable latencies, so benchmarks and CI can measure genai's own overhead without a network:
+
+>>> from genai.backends import FakeBackend
+>>> from genai.generate import use_backend
+>>> use_backend(FakeBackend("Try `df.head()`", time_to_first_token=0.3, inter_token_delay=0.02))
+"""
+import asyncio
+import re
+import threading
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Protocol, Sequence, Union
+
+DEFAULT_FAKE_TEXT = (
+    "It looks like `df` hasn't been defined yet. Load your data first:\n\n"
+    "```python\nimport pandas as pd\n\ndf = pd.read_csv('data.csv')\n```\n"
+)
+
+
+class Backend(Protocol):
+    """Generates the content of chat completions, delta by delta
+
+    Both methods send the request before returning, so that errors such as rate limiting are
+    raised by the call itself (and can be retried) rather than while iterating. If the returned
+    iterator has a `close` method, it may be called from any thread to abort the response.
+    """
+
+    def create(self, model: str, messages: List[Dict[str, str]], stream: bool) -> Iterator[str]:
+        """Request a completion, returning an iterator over its content."""
+        ...
+
+    async def acreate(
+        self, model: str, messages: List[Dict[str, str]], stream: bool
+    ) -> AsyncIterator[str]:
+        """Async version of `create`."""
+        ...
+
+
+class DeltaStream:
+    """Wraps an iterator of deltas so that it can be closed from another thread
+
+    Generators can't be closed while another thread is running them, which is exactly when a
+    blocked read needs aborting. `on_close` aborts the underlying response instead, which makes the
+    blocked read return or raise.
+    """
+
+    def __init__(self, deltas: Iterator[str], on_close: Callable[[], None]) -> None:
+        self._deltas = deltas
+        self._on_close = on_close
+        self.closed = False
+
+    def __iter__(self) -> "DeltaStream":
+        return self
+
+    def __next__(self) -> str:
+        if self.closed:
+            raise StopIteration
+        return next(self._deltas)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self._on_close()
+        # Still running in another thread, that stops once the response is aborted
+        close_stream(self._deltas)
+
+
+def close_stream(deltas: Iterator[str]) -> None:
+    """Close an iterator of deltas if it can be closed, even if another thread is running it."""
+    close = getattr(deltas, "close", None)
+    if close is not None:
+        try:
+            close()
+        except ValueError:
+            # A generator still running in another thread
+            pass
+
+
+def split_deltas(text: str) -> List[str]:
+    """Split text into word sized deltas that join back into the original text."""
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+class FakeBackend:
+    """A deterministic backend that streams the same text for every request
+
+    Attributes:
+        deltas (List[str]): The deltas streamed for every request
+        time_to_first_token (float): Seconds before the first delta
+        inter_token_delay (float): Seconds between deltas
+        requests (List[List[Dict[str, str]]]): The messages of every request made
+    """
+
+    def __init__(
+        self,
+        text: Union[str, Sequence[str]] = DEFAULT_FAKE_TEXT,
+        time_to_first_token: float = 0.0,
+        inter_token_delay: float = 0.0,
+    ) -> None:
+        self.deltas = split_deltas(text) if isinstance(text, str) else list(text)
+        self.time_to_first_token = time_to_first_token
+        self.inter_token_delay = inter_token_delay
+        self.requests: List[List[Dict[str, str]]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def text(self) -> str:
+        return "".join(self.deltas)
+
+    def _delays(self, stream: bool) -> Iterator[float]:
+        if stream:
+            yield self.time_to_first_token
+            for _ in self.deltas[1:]:
+                yield self.inter_token_delay
+        else:
+            # The whole completion arrives at once, after it was generated
+            yield self.time_to_first_token + self.inter_token_delay * max(len(self.deltas) - 1, 0)
+
+    def _record(self, messages: List[Dict[str, str]]) -> None:
+        with self._lock:
+            self.requests.append(messages)
+
+    def create(self, model: str, messages: List[Dict[str, str]], stream: bool) -> Iterator[str]:
+        self._record(messages)
+        closed = threading.Event()
+        return DeltaStream(self._stream(stream, closed), on_close=closed.set)
+
+    def _stream(self, stream: bool, closed: threading.Event) -> Iterator[str]:
+        deltas = self.deltas if stream else [self.text]
+        for delay, delta in zip(self._delays(stream), deltas):
+            # Like a real response, closing the stream interrupts waiting for the next delta
+            if closed.wait(delay) if delay else closed.is_set():
+                return
+            yield delta
+
+    async def acreate(
+        self, model: str, messages: List[Dict[str, str]], stream: bool
+    ) -> AsyncIterator[str]:
+        self._record(messages)
+        return self._astream(stream)
+
+    async def _astream(self, stream: bool) -> AsyncIterator[str]:
+        deltas = self.deltas if stream else [self.text]
+        for delay, delta in zip(self._delays(stream), deltas):
+            if delay:
+                await asyncio.sleep(delay)
+            yield delta
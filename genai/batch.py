@@ -0,0 +1,132 @@
+"""
+Running many assists at once, e.g. to evaluate prompts over a set of notebooks.
+
+Each job is a (context, prompt) pair like the ones `%%assist` sends. Jobs run on a bounded number
+of threads, sharing genai's connection pool and request scheduler, and results are yielded as they
+finish:
+
+>>> from genai.batch import batch_assist
+>>> jobs = [([], "How do I read a CSV with pandas?"), ([], "How do I plot a histogram?")]
+>>> for result in batch_assist(jobs, concurrency=8):
+...     print(result.index, f"{result.latency:.2f}s", result.completion_tokens, result.text[:40])
+
+With more than `genai.session.POOL_MAXSIZE` jobs at once, raise the pool size to match with
+`genai.session.configure_session(pool_maxsize=...)` so connections are kept alive.
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from genai.cancellation import CancellationToken
+from genai.generate import assist_messages, generate
+from genai.models import DEFAULT_MODEL
+from genai.tokens import encoding_for_model, num_tokens_from_messages, num_tokens_from_string
+
+Job = Tuple[List[Dict[str, str]], str]
+
+
+@dataclass
+class BatchResult:
+    """The outcome of one job in a batch
+
+    Attributes:
+        index (int): The position of the job in the batch
+        prompt (str): The job's prompt
+        text (str): The generated text, possibly partial if the job failed
+        error (Optional[Exception]): What went wrong, if the job failed
+        latency (float): Seconds from sending the request to the end of the response
+        time_to_first_token (Optional[float]): Seconds until the first delta arrived
+        prompt_tokens (int): Tokens in the request, counted locally
+        completion_tokens (int): Tokens in the generated text, counted locally
+    """
+
+    index: int
+    prompt: str
+    text: str = ""
+    error: Optional[Exception] = None
+    latency: float = 0.0
+    time_to_first_token: Optional[float] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _run_job(
+    index: int,
+    job: Job,
+    model: str,
+    cancel: CancellationToken,
+) -> BatchResult:
+    context, prompt = job
+    messages = assist_messages(context, prompt)
+    result = BatchResult(index=index, prompt=prompt)
+
+    try:
+        result.prompt_tokens = num_tokens_from_messages(messages, model)
+    except Exception as e:
+        # Counting is local, the request can still go out
+        result.error = e
+
+    deltas = []
+    start = time.perf_counter()
+    try:
+        for delta in generate(messages, model=model, stream=True, cancel=cancel):
+            if result.time_to_first_token is None:
+                result.time_to_first_token = time.perf_counter() - start
+            deltas.append(delta)
+    except Exception as e:
+        result.error = e
+    result.latency = time.perf_counter() - start
+
+    result.text = "".join(deltas)
+    if result.text:
+        try:
+            result.completion_tokens = num_tokens_from_string(
+                result.text, encoding_for_model(model)
+            )
+        except Exception as e:
+            # Only this job's counts are off, the rest of the batch carries on
+            if result.error is None:
+                result.error = e
+    return result
+
+
+def batch_assist(
+    jobs: Iterable[Job],
+    concurrency: int = 4,
+    model: str = DEFAULT_MODEL,
+) -> Iterator[BatchResult]:
+    """Run `jobs` with at most `concurrency` at once, yielding each result as it finishes.
+
+    Jobs are taken from `jobs` lazily, so it can be a generator over a large dataset. A job that
+    fails yields a result with its `error` set instead of stopping the batch. If the iteration is
+    stopped early, jobs still running are cancelled.
+    """
+    pending = enumerate(jobs)
+    running: Dict["Future[BatchResult]", CancellationToken] = {}
+
+    def submit_next(executor: ThreadPoolExecutor) -> bool:
+        for index, job in pending:
+            cancel = CancellationToken()
+            running[executor.submit(_run_job, index, job, model, cancel)] = cancel
+            return True
+        return False
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="genai-batch") as executor:
+        try:
+            while len(running) < concurrency and submit_next(executor):
+                pass
+
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    submit_next(executor)
+                    yield future.result()
+        finally:
+            for cancel in running.values():
+                cancel.cancel()
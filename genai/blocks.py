@@ -0,0 +1,72 @@
+"""
+Splitting streamed markdown into blocks that won't change anymore.
+
+A paragraph is complete once a blank line follows it, and a code block once its closing fence has
+arrived. Everything after the last complete block may still change as more deltas stream in.
+
+>>> from genai.blocks import split_blocks
+>>> split_blocks("Try this:\\n\\n```python\\ndf.head()\\n```\\nThen")
+(['Try this:\\n\\n', '```python\\ndf.head()\\n```\\n'], 'Then')
+"""
+from typing import List, Optional, Tuple
+
+_FENCE_CHARACTERS = "`~"
+
+
+def fence_of(line: str) -> Optional[str]:
+    """The fence a line opens or closes a code block with, if any"""
+    stripped = line.lstrip(" ")
+    if len(line) - len(stripped) > 3:
+        # Indented code, not a fence
+        return None
+    for character in _FENCE_CHARACTERS:
+        if stripped.startswith(character * 3):
+            return character * (len(stripped) - len(stripped.lstrip(character)))
+    return None
+
+
+def closes_fence(fence: str, line_fence: str, line: str) -> bool:
+    """Whether a fenced line closes the code block opened with `fence`"""
+    if line_fence[0] != fence[0] or len(line_fence) < len(fence):
+        return False
+    # Closing fences can't have an info string
+    return not line.strip().strip(fence[0])
+
+
+def split_blocks(text: str) -> Tuple[List[str], str]:
+    """Split `text` into its complete blocks and the trailing text that may still change.
+
+    Joining the blocks and the trailing text gives back `text`.
+    """
+    blocks: List[str] = []
+    start = 0
+    position = 0
+    fence: Optional[str] = None
+
+    # Only whole lines can end a block
+    while True:
+        end = text.find("\n", position) + 1
+        if end == 0:
+            break
+        line = text[position:end]
+        line_fence = fence_of(line)
+
+        if fence is None:
+            if line_fence is not None:
+                # A code block starts, so whatever came before it is complete
+                if text[start:position].strip():
+                    blocks.append(text[start:position])
+                    start = position
+                fence = line_fence
+            elif not line.strip() and text[start:position].strip():
+                # A blank line ends the paragraph
+                blocks.append(text[start:end])
+                start = end
+        elif line_fence is not None and closes_fence(fence, line_fence, line):
+            blocks.append(text[start:end])
+            start = end
+            fence = None
+
+        position = end
+
+    return blocks, text[start:]
@@ -0,0 +1,153 @@
+"""
+A persistent cache of generated responses, so that re-running the same notebook doesn't ask the
+API the same questions again.
+
+Responses are stored in SQLite as the list of deltas they were streamed as, keyed on a canonical
+hash of the request. Entries expire after a TTL, and the least recently used entries are evicted
+once the cache grows past its size limit.
+
+The cache is opt-in:
+
+>>> from genai.generate import enable_response_cache
+>>> enable_response_cache()
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+# 64 MiB of cached responses
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# A week
+DEFAULT_TTL = 7 * 24 * 60 * 60
+
+
+def default_cache_path() -> Path:
+    """Where responses are cached by default, following the XDG base directory spec."""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join("~", ".cache")
+    return Path(cache_home).expanduser() / "genai" / "responses.sqlite3"
+
+
+def cache_key(model: str, messages: List[Dict[str, str]], **params: Any) -> str:
+    """A canonical hash of a chat completion request.
+
+    Key order in messages and parameters doesn't matter. Whether the response is streamed is not
+    part of the request as far as the cache is concerned.
+    """
+    params.pop("stream", None)
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite backed cache of responses with a TTL and size-based LRU eviction
+
+    Attributes:
+        max_bytes (int): Evict least recently used responses past this total size
+        ttl (float): Seconds a response is served from the cache after being stored
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path, None] = None,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl: float = DEFAULT_TTL,
+    ) -> None:
+        if path is None:
+            path = default_cache_path()
+        if str(path) != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                deltas TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """Returns the cached deltas for `key`, or None if they are missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT deltas, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            deltas, created = row
+            if now - created > self.ttl:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+
+            self._connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(deltas)
+
+    def set(self, key: str, deltas: List[str]) -> None:
+        """Store the deltas of a complete response, evicting old responses to make room."""
+        now = time.time()
+        serialized = json.dumps(deltas, ensure_ascii=False)
+        size = len(serialized.encode("utf-8"))
+
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, deltas, size, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, serialized, size, now, now),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        (total,) = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+
+        evicted = []
+        for key, size in self._connection.execute(
+            "SELECT key, size FROM responses ORDER BY accessed ASC, rowid ASC"
+        ):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def clear(self) -> None:
+        """Remove every cached response."""
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()
+        return count
+
+    def close(self) -> None:
+        """Close the underlying database."""
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,68 @@
+"""
+Cancellation tokens for abandoning a generation part way through.
+
+A token is handed to whatever starts the generation (`genai.generate.generate` and friends) and to
+whatever consumes it (`GenaiMarkdown.consume`). Cancelling the token, from any thread, closes the
+streaming response so its connection goes back to the pool, and stops the consumer.
+
+>>> from genai.cancellation import CancellationToken
+>>> cancel = CancellationToken()
+>>> gm.consume(generate_next_from_history([], "Hi!", stream=True, cancel=cancel), cancel=cancel)
+>>> cancel.cancel()  # from another thread
+"""
+import threading
+from typing import Callable, List
+
+
+class GenerationCancelled(Exception):
+    """Raised while iterating over a generation whose token was cancelled"""
+
+
+class CancellationToken:
+    """A one-way switch for cancelling a generation, safe to use from any thread"""
+
+    def __init__(self) -> None:
+        self._cancelled = False
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self) -> None:
+        """Cancel the token, calling every registered callback once."""
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                # Cancelling is best effort, whatever is left is cleaned up when iteration stops
+                pass
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Call `callback` when the token is cancelled, right away if it already is.
+
+        Returns a function that unregisters the callback.
+        """
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+
+        callback()
+        return lambda: None
+
+    def _remove(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self) -> None:
+        if self._cancelled:
+            raise GenerationCancelled()
@@ -3,9 +3,16 @@ Creates user and system messages as context for ChatGPT, using the history of th
 """
 from traceback import TracebackException
 from types import TracebackType
-from typing import Any, Dict, Optional, Type, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union
 
 from genai.display import GenaiMarkdown
+from genai.tokens import (
+    encoding_for_model,
+    num_tokens_bounds,
+    num_tokens_from_message,
+    num_tokens_from_messages,
+    truncate_message,
+)
 
 try:
     import numpy as np
@@ -238,31 +245,107 @@ class Context:
         return [message["message"] for message in self._context]
 
 
-def build_context(history_manager, start=1, stop=None):
+def _history_messages(history_manager, execution_counter: int, cell_text: str):
+    """The (role, text) pairs for a single execution, in conversation order.
+
+    Texts are returned as thunks so that callers can skip computing expensive representations
+    (like DataFrame summaries) of messages they won't use.
+    """
+    entries: List[Tuple[str, Callable[[], str]]] = []
+
+    # User Code `In[*]:`
+    entries.append(("user", lambda: cell_text))
+
+    # System Error Output
+    past_error = PastErrors.get(execution_counter)
+    if past_error is not None:
+        entries.append(("system", lambda: past_error))
+
+    # Assistant Output
+    past_assist = PastAssists.get(execution_counter)
+    if past_assist is not None:
+        entries.append(("assistant", lambda: past_assist.message))
+
+    # System Outputs `Out[*]:`
+    output = history_manager.output_hist.get(execution_counter)
+    if output is not None:
+        entries.append(("system", lambda: repr_genai(output)))
+
+    return entries
+
+
+def build_context(
+    history_manager,
+    start=1,
+    stop=None,
+    max_tokens: Optional[int] = None,
+    model: str = "gpt-3.5-turbo-0301",
+    message_token_limits: Optional[Dict[str, int]] = None,
+):
+    """Build the context for ChatGPT from the session history between `start` and `stop`.
+
+    When `max_tokens` is given, history is walked from the newest execution to the oldest and
+    reading stops as soon as the next message would not fit in the budget. The result is the same
+    as passing the full context through `trim_messages_to_fit_token_limit`, without computing
+    representations of outputs that would be trimmed anyway.
+
+    `message_token_limits` caps the size of individual messages by role (see
+    `genai.tokens.MESSAGE_TOKEN_LIMITS`). Oversized messages keep their head and tail instead of
+    being dropped entirely.
+    """
+    history = [
+        (execution_counter, cell_text)
+        for session, execution_counter, cell_text in history_manager.get_range(
+            session=0, start=start, stop=stop
+        )
+        if not any(cell_text.startswith(token) for token in ignore_tokens)
+    ]
+
     context = Context()
 
-    for session, execution_counter, cell_text in history_manager.get_range(
-        session=0, start=start, stop=stop
-    ):
-        if any(cell_text.startswith(token) for token in ignore_tokens):
-            continue
-
-        # User Code `In[*]:`
-        context.append(cell_text, role="user", execution_count=execution_counter)
-
-        # System Error Output
-        past_error = PastErrors.get(execution_counter)
-        if past_error is not None:
-            context.append(past_error, role="system", execution_count=execution_counter)
-
-        # Assistant Output
-        past_assist = PastAssists.get(execution_counter)
-        if past_assist is not None:
-            context.append(past_assist.message, role="assistant", execution_count=execution_counter)
-
-        # System Outputs `Out[*]:`
-        output = history_manager.output_hist.get(execution_counter)
-        if output is not None:
-            context.append(repr_genai(output), role="system", execution_count=execution_counter)
+    if max_tokens is None and message_token_limits is None:
+        for execution_counter, cell_text in history:
+            for role, text in _history_messages(history_manager, execution_counter, cell_text):
+                context.append(text(), role=role, execution_count=execution_counter)
+        return context
+
+    encoding = encoding_for_model(model)
+
+    def craft(role: str, text: Callable[[], str]) -> Dict[str, str]:
+        message = craft_message(text(), role=role)
+        limit = (message_token_limits or {}).get(role)
+        if limit is not None:
+            message = truncate_message(message, limit, encoding)
+        return message
+
+    if max_tokens is None:
+        for execution_counter, cell_text in history:
+            for role, text in _history_messages(history_manager, execution_counter, cell_text):
+                message = craft(role, text)
+                context.append(message["content"], role=role, execution_count=execution_counter)
+        return context
+
+    num_tokens = num_tokens_from_messages([], model=model)
+
+    def newest_first():
+        for execution_counter, cell_text in reversed(history):
+            entries = _history_messages(history_manager, execution_counter, cell_text)
+            for role, text in reversed(entries):
+                yield execution_counter, role, text
+
+    kept: List[Tuple[str, str, int]] = []
+    for execution_counter, role, text in newest_first():
+        message = craft(role, text)
+        lower, upper = num_tokens_bounds(message["content"], encoding)
+        if num_tokens + lower > max_tokens:
+            # Can't possibly fit, so don't spend time encoding it
+            break
+        num_tokens += num_tokens_from_message(message, model=model)
+        if num_tokens > max_tokens:
+            break
+        kept.append((message["content"], role, execution_counter))
+
+    for content, role, execution_counter in reversed(kept):
+        context.append(content, role=role, execution_count=execution_counter)
 
     return context
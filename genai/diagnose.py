@@ -0,0 +1,228 @@
+"""
+Local diagnosis of trivial exceptions, answered without asking a model.
+
+Most `NameError`s, `ModuleNotFoundError`s and `AttributeError`s are typos. Those are matched against
+the names in scope, the installed modules or the object's attributes, and the closest ones are
+suggested right away:
+
+>>> from genai.diagnose import diagnose
+>>> try:
+...     pirnt("hello")
+... except NameError as e:
+...     diagnose(type(e), e, e.__traceback__).markdown
+"`pirnt` isn't defined. Did you mean `print`? Other close matches: `int`, `input`."
+
+Each diagnosis has a `confidence` between 0 and 1, so callers can still ask a model when the
+closest match is a long shot.
+"""
+import builtins
+import difflib
+import pkgutil
+import re
+import sys
+from dataclasses import dataclass
+from functools import lru_cache
+from types import TracebackType
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple, Type
+
+# Below this similarity, names aren't considered close
+CUTOFF = 0.6
+# At or above this confidence, a diagnosis can be shown without asking a model
+CONFIDENT = 0.8
+# How many close matches to suggest
+MAX_MATCHES = 3
+
+# Names that are almost always an import away
+COMMON_IMPORTS = {
+    "np": "import numpy as np",
+    "pd": "import pandas as pd",
+    "plt": "import matplotlib.pyplot as plt",
+    "sns": "import seaborn as sns",
+    "tf": "import tensorflow as tf",
+    "px": "import plotly.express as px",
+    "sp": "import scipy as sp",
+    "nx": "import networkx as nx",
+}
+
+_NAME = re.compile(r"name '(?P<name>\w+)' is not defined")
+_ATTRIBUTE = re.compile(r"'(?P<owner>[\w.]+)'( object)? has no attribute '(?P<name>\w+)'")
+
+
+@dataclass(frozen=True)
+class Diagnosis:
+    """A locally found explanation of an exception
+
+    Attributes:
+        markdown (str): The suggestion, ready to display
+        confidence (float): How likely the suggestion is right, between 0 and 1
+        matches (List[str]): The closest names found, best first
+    """
+
+    markdown: str
+    confidence: float
+    matches: List[str]
+
+
+def close_matches(name: str, candidates: Iterable[str], n: int = MAX_MATCHES) -> List[str]:
+    """The candidates closest to `name`, best first."""
+    if not name.startswith("_"):
+        # Private and IPython's history names (`_i3`, `__`) are rarely what was meant
+        candidates = (candidate for candidate in candidates if not candidate.startswith("_"))
+    return difflib.get_close_matches(name, set(candidates) - {name}, n=n, cutoff=CUTOFF)
+
+
+def similarity(a: str, b: str) -> float:
+    return difflib.SequenceMatcher(None, a, b).ratio()
+
+
+@lru_cache(maxsize=1)
+def _installed_modules(path: Tuple[str, ...]) -> FrozenSet[str]:
+    names = {module.name for module in pkgutil.iter_modules(list(path))}
+    names.update(sys.builtin_module_names)
+    return frozenset(names)
+
+
+def installed_modules() -> FrozenSet[str]:
+    """Names of the top level modules that can be imported."""
+    # Keyed by the path, so new entries (say, from `%pip install -e`) are picked up
+    return _installed_modules(tuple(sys.path))
+
+
+def _innermost_frame_names(tb: Optional[TracebackType]) -> Dict[str, Any]:
+    if tb is None:
+        return {}
+    while tb.tb_next is not None:
+        tb = tb.tb_next
+    frame = tb.tb_frame
+    return {**frame.f_globals, **frame.f_locals}
+
+
+def _did_you_mean(matches: List[str]) -> str:
+    suggestion = f"Did you mean `{matches[0]}`?"
+    if len(matches) > 1:
+        others = ", ".join(f"`{match}`" for match in matches[1:])
+        suggestion += f" Other close matches: {others}."
+    return suggestion
+
+
+def _diagnosis(prefix: str, name: str, matches: List[str]) -> Optional[Diagnosis]:
+    if not matches:
+        return None
+    return Diagnosis(
+        markdown=f"{prefix} {_did_you_mean(matches)}",
+        confidence=similarity(name, matches[0]),
+        matches=matches,
+    )
+
+
+def diagnose_name_error(
+    evalue: NameError,
+    tb: Optional[TracebackType] = None,
+    user_ns: Optional[Mapping[str, Any]] = None,
+) -> Optional[Diagnosis]:
+    name = getattr(evalue, "name", None)
+    if name is None:
+        match = _NAME.search(str(evalue))
+        if match is None:
+            return None
+        name = match.group("name")
+
+    if name in COMMON_IMPORTS:
+        statement = COMMON_IMPORTS[name]
+        if statement.split()[1].split(".")[0] in installed_modules():
+            return Diagnosis(
+                markdown=f"`{name}` isn't defined. Did you forget to run `{statement}`?",
+                confidence=1.0,
+                matches=[name],
+            )
+
+    candidates = set(dir(builtins))
+    candidates.update(_innermost_frame_names(tb))
+    if user_ns is not None:
+        candidates.update(user_ns)
+
+    diagnosis = _diagnosis(f"`{name}` isn't defined.", name, close_matches(name, candidates))
+    if diagnosis is not None:
+        return diagnosis
+
+    if name in installed_modules():
+        return Diagnosis(
+            markdown=f"`{name}` isn't defined. Did you forget to run `import {name}`?",
+            confidence=CONFIDENT,
+            matches=[name],
+        )
+    return None
+
+
+def diagnose_module_not_found(evalue: ModuleNotFoundError) -> Optional[Diagnosis]:
+    name = evalue.name
+    if not name:
+        return None
+
+    parent, _, child = name.rpartition(".")
+    if parent:
+        # Only look inside packages that are already imported, importing runs their code
+        package = sys.modules.get(parent)
+        path = getattr(package, "__path__", None)
+        if path is None:
+            return None
+        candidates = {module.name for module in pkgutil.iter_modules(path)}
+        matches = [f"{parent}.{match}" for match in close_matches(child, candidates)]
+        return _diagnosis(f"There's no module named `{name}`.", name, matches)
+
+    return _diagnosis(
+        f"There's no module named `{name}`.", name, close_matches(name, installed_modules())
+    )
+
+
+def diagnose_attribute_error(evalue: AttributeError) -> Optional[Diagnosis]:
+    name = getattr(evalue, "name", None)
+    obj = getattr(evalue, "obj", None)
+
+    # Before Python 3.10, the name and object are only in the message (and modules in sys.modules)
+    match = _ATTRIBUTE.search(str(evalue))
+    if name is None:
+        if match is None:
+            return None
+        name = match.group("name")
+    if obj is None:
+        if match is None or not str(evalue).startswith("module "):
+            return None
+        obj = sys.modules.get(match.group("owner"))
+        if obj is None:
+            return None
+
+    try:
+        candidates = dir(obj)
+    except Exception:
+        return None
+
+    owner = match.group("owner") if match is not None else type(obj).__name__
+    return _diagnosis(
+        f"`{owner}` has no attribute `{name}`.", name, close_matches(name, candidates)
+    )
+
+
+def diagnose(
+    etype: Type[BaseException],
+    evalue: BaseException,
+    tb: Optional[TracebackType] = None,
+    user_ns: Optional[Mapping[str, Any]] = None,
+) -> Optional[Diagnosis]:
+    """Explain a trivial exception locally, or return None when it takes a model to explain.
+
+    `user_ns` adds the names defined by the user (IPython's `shell.user_ns`) to those in scope
+    where the exception was raised.
+    """
+    try:
+        if isinstance(evalue, ModuleNotFoundError):
+            return diagnose_module_not_found(evalue)
+        # A local used before it's assigned is spelled right, so there's nothing to match
+        if isinstance(evalue, NameError) and not isinstance(evalue, UnboundLocalError):
+            return diagnose_name_error(evalue, tb, user_ns)
+        if isinstance(evalue, AttributeError):
+            return diagnose_attribute_error(evalue)
+    except Exception:
+        # Diagnosing is best effort, the model can still take a look
+        return None
+    return None
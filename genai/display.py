@@ -1,10 +1,21 @@
 import os
+import time
 from binascii import hexlify
 from enum import Enum
-from typing import Any, Dict, Iterator, Optional, Tuple, Union
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
 
 from IPython.core import display_functions
 
+from genai import incremental
+from genai.blocks import split_blocks
+from genai.cancellation import CancellationToken, GenerationCancelled
+
+# Streamed deltas are rendered at most this many times a second, see `GenaiMarkdown`
+MAX_UPDATES_PER_SECOND = 10.0
+
+# Display each complete block of markdown as its own output, see `GenaiMarkdown`
+segment_blocks_by_default = False
+
 
 def can_handle_display_updates():
     """Determine (roughly) if the client can handle display updates."""
@@ -45,9 +56,21 @@ class GenaiMarkdown:
     supports real-time updates of Markdown content which is useful for emitting ChatGPT suggestions
     as they are generated.
 
+    Appended deltas are coalesced: displays are updated at most `max_updates_per_second` times a
+    second, and whatever is left is flushed when the stage changes or consuming ends. Setting
+    `message` or `stage` always updates the displays right away. With
+    `genai.incremental.enable_incremental_updates`, updates for appends only send the new text.
+
+    With `segment_blocks` (or `genai.display.segment_blocks_by_default` set), each paragraph or code block is
+    shown as its own output once it's complete (see `genai.blocks`) and never updated again. Only
+    the trailing block is updated, so each update stays small however long the message gets.
+
     Attributes:
         message (str): The Markdown string to display
         stage (Optional[Stage]): The current stage of feedback generation
+        max_updates_per_second (Optional[float]): How often appends may update the displays, or
+            None to update on every append
+        segment_blocks (bool): Whether complete blocks are displayed as outputs of their own
 
     Example:
         >>> from genai.display import GenaiMarkdown, Stage
@@ -68,36 +91,177 @@ class GenaiMarkdown:
         ...
         >>> markdown.consume(text_generator())
         # Displays "Hello world! This is an update! 1 2 3" in the notebook
+        ...
+        >>> from genai.generate import agenerate_next_from_history
+        >>> await markdown.aconsume(agenerate_next_from_history([], "Hi!", stream=True))
+        # Streams the suggestion in while the kernel keeps running other tasks
     """
 
-    def __init__(self, message: str = "", stage: Optional[Stage] = None) -> None:
-        self._message: str = message
+    def __init__(
+        self,
+        message: str = "",
+        stage: Optional[Stage] = None,
+        max_updates_per_second: Optional[float] = MAX_UPDATES_PER_SECOND,
+        segment_blocks: Optional[bool] = None,
+    ) -> None:
+        # Appended deltas, joined only when the message is read
+        self._chunks: List[str] = [message]
         self._display_id: str = hexlify(os.urandom(8)).decode('ascii')
         self._stage: Optional[Stage] = stage
+        self.max_updates_per_second = max_updates_per_second
+        self._last_update: Optional[float] = None
+        # Appended since the displays were last updated
+        self._pending: List[str] = []
+
+        self.segment_blocks = (
+            segment_blocks_by_default if segment_blocks is None else segment_blocks
+        )
+        # With segmented blocks: the display ID of each block shown so far, which of them is the
+        # trailing block, where in the message it starts, and whether the message was replaced
+        self._displayed = False
+        self._segment_ids: List[str] = []
+        self._tail_index = 0
+        self._tail_start = 0
+        self._resegment = False
 
     def append(self, delta: str) -> None:
-        self.message += delta
+        self._chunks.append(delta)
+        self._pending.append(delta)
+        if self._update_due():
+            self._update_appended()
+
+    def flush(self) -> None:
+        '''Update the displays with any appends that haven't been shown yet'''
+        if self._pending:
+            self._update_appended()
+
+    def _update_appended(self) -> None:
+        channel = incremental.active_channel()
+        # Segmented updates are small already, and appends can span several blocks
+        if channel is None or self.segment_blocks:
+            self.update_displays()
+            return
+
+        # Only send what's new, see `genai.incremental`
+        appended = "".join(self._pending)
+        try:
+            channel.append(self._display_id, appended)
+        except Exception:
+            incremental.disable_incremental_updates()
+            self.update_displays()
+            return
+        self._pending = []
+        self._last_update = time.monotonic()
+
+    def _update_due(self) -> bool:
+        if self.max_updates_per_second is None or self._last_update is None:
+            return True
+        return time.monotonic() - self._last_update >= 1 / self.max_updates_per_second
 
-    def consume(self, delta_generator: Iterator[str]) -> None:
-        for delta in delta_generator:
-            self.append(delta)
+    def consume(
+        self, delta_generator: Iterator[str], cancel: Optional[CancellationToken] = None
+    ) -> None:
+        '''Append deltas from a generator until it is exhausted or `cancel` is cancelled
+
+        If consuming stops early for any reason, including an interrupt, the generator is closed so
+        that its request is released right away.
+        '''
+        finished = False
+        try:
+            for delta in delta_generator:
+                if cancel is not None and cancel.cancelled:
+                    break
+                self.append(delta)
+            else:
+                finished = True
+        except GenerationCancelled:
+            pass
+        finally:
+            close = getattr(delta_generator, "close", None)
+            if not finished and close is not None:
+                close()
+            self.flush()
+
+    async def aconsume(
+        self, delta_generator: AsyncIterator[str], cancel: Optional[CancellationToken] = None
+    ) -> None:
+        '''Append deltas from an async generator, letting the event loop run between them'''
+        finished = False
+        try:
+            async for delta in delta_generator:
+                if cancel is not None and cancel.cancelled:
+                    break
+                self.append(delta)
+            else:
+                finished = True
+        except GenerationCancelled:
+            pass
+        finally:
+            aclose = getattr(delta_generator, "aclose", None)
+            if not finished and aclose is not None:
+                await aclose()
+            self.flush()
 
     def display(self) -> None:
         '''Display the `UpdatingMarkdown` with a display ID for receiving updates'''
+        if self.segment_blocks:
+            self._displayed = True
+            self._resegment = True
+            self._update_segments()
+            return
         display_functions.display(self, display_id=self._display_id)
 
     def update_displays(self) -> None:
         '''Force an update to all displays'''
+        self._pending = []
+        self._last_update = time.monotonic()
+        if self.segment_blocks:
+            self._update_segments()
+            return
         display_functions.display(self, display_id=self._display_id, update=True)
 
+    def _update_segments(self) -> None:
+        message = self.message
+        resegment, self._resegment = self._resegment, False
+        if resegment:
+            # The message was replaced, so lay it out again over the outputs already shown
+            self._tail_index = 0
+            self._tail_start = 0
+
+        blocks, trailing = split_blocks(message[self._tail_start :])
+        for block in blocks:
+            self._show_segment(_Segment(block))
+            self._tail_start += len(block)
+            self._tail_index += 1
+        self._show_segment(_Segment(trailing, self._stage))
+
+        if resegment:
+            # Blank out outputs left over from a longer message
+            for display_id in self._segment_ids[self._tail_index + 1 :]:
+                display_functions.display(_Segment(""), display_id=display_id, update=True)
+
+    def _show_segment(self, segment: "_Segment") -> None:
+        if self._tail_index < len(self._segment_ids):
+            display_id = self._segment_ids[self._tail_index]
+            display_functions.display(segment, display_id=display_id, update=True)
+        elif self._displayed:
+            # The first output keeps the ID of the markdown as a whole
+            display_id = (
+                self._display_id
+                if not self._segment_ids
+                else hexlify(os.urandom(8)).decode('ascii')
+            )
+            self._segment_ids.append(display_id)
+            display_functions.display(segment, display_id=display_id)
+
     def __repr__(self) -> str:
-        message = self._message
+        message = self.message
         if message is None or message == "":
             message = " "
         return message
 
     def _repr_markdown_(self) -> Union[str, Tuple[str, Dict[str, Any]]]:
-        message = self._message
+        message = self.message
         # Handle some platforms that don't support empty Markdown
         if message is None or message == "":
             message = " "
@@ -115,11 +279,16 @@ class GenaiMarkdown:
 
     @property
     def message(self) -> str:
-        return self._message
+        chunks = self._chunks
+        if len(chunks) != 1:
+            # Keep the joined text, so the next read only joins what was appended since
+            chunks[:] = ["".join(chunks)]
+        return chunks[0]
 
     @message.setter
     def message(self, value: str) -> None:
-        self._message = value
+        self._chunks = [value]
+        self._resegment = True
         self.update_displays()
 
     @property
@@ -127,6 +296,20 @@ class GenaiMarkdown:
         return self._stage
 
     @stage.setter
-    def stage(self, stage: Stage) -> None:
+    def stage(self, stage: Optional[Stage]) -> None:
         self._stage = stage
         self.update_displays()
+
+
+class _Segment:
+    """One block of a segmented `GenaiMarkdown`, with the stage shown on the trailing block"""
+
+    def __init__(self, text: str, stage: Optional[Stage] = None) -> None:
+        self.text = text
+        self.stage = stage
+
+    def _repr_markdown_(self) -> Union[str, Tuple[str, Dict[str, Any]]]:
+        text = self.text or " "
+        if self.stage is None:
+            return text
+        return text, {"genai": {"stage": self.stage}}
@@ -0,0 +1,103 @@
+"""
+Fingerprints of exceptions, so that recurring errors can reuse an earlier suggestion.
+
+Two exceptions get the same fingerprint when they have the same type, the same message once object
+addresses and numbers are taken out, and the same code in their innermost frames. Line numbers,
+execution counts and cell filenames don't count. Whatever else the suggestion depends on (like the
+prompt and the model) can be passed as `context`.
+
+>>> from genai.fingerprint import fingerprint
+>>> try:
+...     df.head()
+... except NameError as e:
+...     fingerprint(type(e), e, e.__traceback__)
+"""
+import hashlib
+import json
+import re
+import threading
+import traceback
+from collections import OrderedDict
+from types import TracebackType
+from typing import List, Optional, Sequence, Tuple, Type
+
+# How many of the innermost frames identify where an error comes from
+FRAMES = 3
+
+_ADDRESS = re.compile(r"0x[0-9a-fA-F]+")
+_NUMBER = re.compile(r"(?<![\w.])\d+(\.\d+)?(?!\w)")
+
+
+def message_template(message: str) -> str:
+    """The message of an exception with object addresses and numbers replaced by placeholders.
+
+    Quoted names are kept, as they're usually what the suggestion is about.
+    """
+    template = _ADDRESS.sub("0x…", message)
+    return _NUMBER.sub("…", template)
+
+
+def innermost_code(tb: Optional[TracebackType], frames: int = FRAMES) -> List[Tuple[str, str]]:
+    """The function name and source line of the innermost frames of a traceback."""
+    if tb is None:
+        return []
+    summary = traceback.extract_tb(tb)[-frames:]
+    return [(frame.name, (frame.line or "").strip()) for frame in summary]
+
+
+def fingerprint(
+    etype: Type[BaseException],
+    evalue: BaseException,
+    tb: Optional[TracebackType],
+    frames: int = FRAMES,
+    context: Sequence[str] = (),
+) -> str:
+    """A stable hash identifying an exception, ignoring incidental details.
+
+    Exceptions only share a fingerprint when they were seen with the same `context`.
+    """
+    payload = json.dumps(
+        [
+            f"{etype.__module__}.{etype.__qualname__}",
+            message_template(str(evalue)),
+            innermost_code(tb, frames),
+            list(context),
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SuggestionStore:
+    """Remembers the suggestion made for each fingerprint, evicting the least recently used
+
+    Attributes:
+        max_entries (int): How many suggestions to remember
+    """
+
+    def __init__(self, max_entries: int = 256) -> None:
+        self.max_entries = max_entries
+        self._suggestions: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            suggestion = self._suggestions.get(key)
+            if suggestion is not None:
+                self._suggestions.move_to_end(key)
+            return suggestion
+
+    def set(self, key: str, suggestion: str) -> None:
+        with self._lock:
+            self._suggestions[key] = suggestion
+            self._suggestions.move_to_end(key)
+            while len(self._suggestions) > self.max_entries:
+                self._suggestions.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._suggestions.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._suggestions)
@@ -1,8 +1,20 @@
-from typing import Any, Dict, Iterator, List, TypedDict
+import threading
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, TypedDict, Union
 
 import openai
 
+from genai import metrics
+from genai.backends import Backend, DeltaStream, close_stream
+from genai.cache import DEFAULT_MAX_BYTES, DEFAULT_TTL, ResponseCache, cache_key
+from genai.cancellation import CancellationToken
+from genai.hedging import INITIAL_DELAY, HedgedStream, HedgingPolicy
+from genai.models import DEFAULT_MODEL
 from genai.prompts import PromptStore
+from genai.scheduler import BASE_DELAY, MAX_DELAY, MAX_RETRIES, RequestScheduler
+from genai.session import abort_response, capture_responses, install_session
+from genai.singleflight import SharedStream, SingleFlight
+from genai.tokens import num_tokens_from_messages
 
 Completion = TypedDict(
     "Completion",
@@ -46,43 +58,309 @@ def deltas(completion: Iterator[StreamCompletion]) -> Iterator[str]:
             yield delta["content"]
 
 
-def generate_next_from_history(
-    context: List[Dict[str, str]],
-    text: str,
+def create_chat_completion(**kwargs):
+    """Call `openai.ChatCompletion.create` over genai's pooled session."""
+    install_session()
+    return openai.ChatCompletion.create(**kwargs)
+
+
+class OpenAIBackend:
+    """Generates with OpenAI's chat completions API, the default backend"""
+
+    def create(self, model: str, messages: List[Dict[str, str]], stream: bool) -> Iterator[str]:
+        with capture_responses() as responses:
+            response = create_chat_completion(model=model, messages=messages, stream=stream)
+        if not stream:
+            return iter([content(response)])
+
+        def abort():
+            # Closing the HTTP response releases its pooled connection right away
+            for http_response in responses:
+                abort_response(http_response)
+
+        return DeltaStream(deltas(response), on_close=abort)
+
+    async def acreate(
+        self, model: str, messages: List[Dict[str, str]], stream: bool
+    ) -> AsyncIterator[str]:
+        response = await acreate_chat_completion(model=model, messages=messages, stream=stream)
+        if stream:
+            return adeltas(response)
+        return _aiter_one(content(response))
+
+
+async def _aiter_one(item: str) -> AsyncIterator[str]:
+    yield item
+
+
+# Where completions come from, see `use_backend`
+backend: Backend = OpenAIBackend()
+
+
+def use_backend(new_backend: Optional[Backend] = None) -> Backend:
+    """Generate completions with `new_backend`, or go back to OpenAI when None.
+
+    See `genai.backends` for the protocol and a fake backend for benchmarks and tests.
+    """
+    global backend
+    backend = new_backend if new_backend is not None else OpenAIBackend()
+    return backend
+
+
+# Opt-in cache of complete responses, see `enable_response_cache`
+response_cache: Optional[ResponseCache] = None
+
+
+def enable_response_cache(
+    path: Union[str, Path, None] = None,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+    ttl: float = DEFAULT_TTL,
+) -> ResponseCache:
+    """Serve identical requests from an on-disk cache of previous responses.
+
+    See `genai.cache.ResponseCache` for the parameters.
+    """
+    global response_cache
+    response_cache = ResponseCache(path, max_bytes=max_bytes, ttl=ttl)
+    return response_cache
+
+
+def disable_response_cache() -> None:
+    """Stop using the response cache."""
+    global response_cache
+    if response_cache is not None:
+        response_cache.close()
+    response_cache = None
+
+
+# Paces requests within rate limits and retries rate limited ones, see `configure_scheduler`
+scheduler = RequestScheduler()
+
+
+def configure_scheduler(
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+    max_retries: int = MAX_RETRIES,
+    base_delay: float = BASE_DELAY,
+    max_delay: float = MAX_DELAY,
+) -> RequestScheduler:
+    """Pace requests to stay within the API key's rate limits.
+
+    See `genai.scheduler.RequestScheduler` for the parameters.
+    """
+    global scheduler
+    scheduler = RequestScheduler(
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+        max_retries=max_retries,
+        base_delay=base_delay,
+        max_delay=max_delay,
+    )
+    return scheduler
+
+
+def _prompt_tokens(current: RequestScheduler, messages: List[Dict[str, str]], model: str) -> int:
+    """The size of a request's prompt, if the scheduler budgets tokens."""
+    if not current.counts_tokens:
+        return 0
+    return num_tokens_from_messages(messages, model)
+
+
+# Opt-in hedging of slow streams, see `enable_hedging`
+hedging: Optional[HedgingPolicy] = None
+
+
+def enable_hedging(
+    percentile: float = 95,
+    hedge_model: Optional[str] = None,
+    initial_delay: float = INITIAL_DELAY,
+    min_delay: float = 0.5,
+) -> HedgingPolicy:
+    """Race streams that are slow to start with a second request.
+
+    See `genai.hedging.HedgingPolicy` for the parameters.
+    """
+    global hedging
+    hedging = HedgingPolicy(
+        percentile=percentile,
+        hedge_model=hedge_model,
+        initial_delay=initial_delay,
+        min_delay=min_delay,
+    )
+    return hedging
+
+
+def disable_hedging() -> None:
+    """Stop hedging requests."""
+    global hedging
+    hedging = None
+
+
+# Identical requests made while one is already streaming share its response
+coalesce_requests = True
+in_flight = SingleFlight()
+
+
+def generate(
+    messages: List[Dict[str, str]],
+    model: str = DEFAULT_MODEL,
     stream: bool = False,
+    cancel: Optional[CancellationToken] = None,
+    context_time: Optional[float] = None,
 ) -> Iterator[str]:
-    response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            # Establish the context of the conversation
-            {
-                "role": "system",
-                "content": PromptStore.assist_prompt,
-            },
-            # Presumably In, Out
-            *context,
-            # The user's code or request
-            {
-                "role": "user",
-                "content": text,
-            },
-        ],
-        stream=stream,
-    )
+    """Generate a chat completion for `messages`, yielding its content as it arrives.
+
+    When the response cache is enabled a cached response is replayed delta by delta, and a
+    response that was consumed in full is stored for next time. While `coalesce_requests` is set,
+    an identical request that is already in flight is joined rather than sent again.
+
+    Cancelling `cancel` raises `GenerationCancelled` from the iterator, closing the response (unless
+    it is shared with another caller). So does closing the iterator, e.g. on a `KeyboardInterrupt`.
+
+    `context_time` is how long the caller spent building `messages`, for the metrics record.
+    """
+    if cancel is not None:
+        cancel.raise_if_cancelled()
+
+    key = cache_key(model, messages)
+
+    cache = response_cache
+    cached = cache.get(key) if cache is not None else None
+
+    def start() -> Iterator[str]:
+        return _Upstream(key, messages, model, stream)
 
-    if stream:
-        yield from deltas(response)
+    generated: Optional[Iterator[str]]
+    if cached is not None:
+        generated = _replay(cached, cancel)
+    elif coalesce_requests:
+        generated = in_flight.stream(key, start, cancel=cancel)
     else:
-        yield content(response)
+        generated = SharedStream(start()).subscribe(cancel=cancel)
+    assert generated is not None
 
+    if metrics.sinks:
+        generated = metrics.measure(
+            generated,
+            model,
+            messages,
+            cache_hit=cached is not None,
+            context_time=context_time,
+        )
 
-def generate_exception_suggestion(
-    code: str,
+    yield from generated
+
+
+def _replay(cached: List[str], cancel: Optional[CancellationToken]) -> Iterator[str]:
+    for delta in cached:
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        yield delta
+
+
+class _Upstream:
+    """The deltas of one request, stored in the response cache once read to the end
+
+    The request is only sent on the first `next`. Closing aborts the response, from any thread.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        messages: List[Dict[str, str]],
+        model: str,
+        stream: bool,
+    ) -> None:
+        self._key = key
+        self._messages = messages
+        self._model = model
+        self._stream = stream
+        self._deltas: Optional[Iterator[str]] = None
+        self._collected: List[str] = []
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def __iter__(self) -> "_Upstream":
+        return self
+
+    def _start(self) -> Iterator[str]:
+        current, generator, policy = scheduler, backend, hedging
+
+        def create(model: str, sending: Optional[Callable[[], None]] = None) -> Iterator[str]:
+            def request() -> Iterator[str]:
+                if sending is not None:
+                    sending()
+                return generator.create(model, self._messages, self._stream)
+
+            return current.call(request, tokens=_prompt_tokens(current, self._messages, model))
+
+        generated: Iterator[str]
+        if policy is not None and self._stream:
+            generated = HedgedStream(create, self._model, policy)
+        else:
+            generated = create(self._model)
+
+        with self._lock:
+            self._deltas = generated
+            closed = self._closed
+        if closed:
+            # Closed while the request was being made
+            close_stream(generated)
+        return generated
+
+    def __next__(self) -> str:
+        generated = self._deltas
+        if generated is None:
+            if self._closed:
+                raise StopIteration
+            generated = self._start()
+
+        try:
+            delta = next(generated)
+        except StopIteration:
+            cache = response_cache
+            # A hedge to another model answered, which isn't what this key asked for
+            model = getattr(generated, "winning_model", None) or self._model
+            if cache is not None and not self._closed and model == self._model:
+                cache.set(self._key, self._collected)
+            raise
+
+        self._collected.append(delta)
+        return delta
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            generated = self._deltas
+        if generated is not None:
+            close_stream(generated)
+
+
+def assist_messages(context: List[Dict[str, str]], text: str) -> List[Dict[str, str]]:
+    """The messages sent to ChatGPT to assist with `text`, given the session's `context`."""
+    return [
+        # Establish the context of the conversation
+        {
+            "role": "system",
+            "content": PromptStore.assist_prompt,
+        },
+        # Presumably In, Out
+        *context,
+        # The user's code or request
+        {
+            "role": "user",
+            "content": text,
+        },
+    ]
+
+
+def exception_messages(
+    code: Optional[str],
     etype: type,
     evalue: BaseException,
     plaintext_traceback: str,
-    stream: bool = False,
-) -> Iterator[str]:
+) -> List[Dict[str, str]]:
+    """The messages sent to ChatGPT to diagnose an exception raised by `code`."""
     error_report = f"{etype.__name__}: {evalue}\n{plaintext_traceback}"
 
     # Just in case, cap the error report
@@ -111,13 +389,168 @@ def generate_exception_suggestion(
         },
     )
 
-    response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        messages=messages,
+    return messages
+
+
+def generate_next_from_history(
+    context: List[Dict[str, str]],
+    text: str,
+    stream: bool = False,
+    model: str = DEFAULT_MODEL,
+    cancel: Optional[CancellationToken] = None,
+    context_time: Optional[float] = None,
+) -> Iterator[str]:
+    yield from generate(
+        model=model,
+        messages=assist_messages(context, text),
+        stream=stream,
+        cancel=cancel,
+        context_time=context_time,
+    )
+
+
+def generate_exception_suggestion(
+    code: Optional[str],
+    etype: type,
+    evalue: BaseException,
+    plaintext_traceback: str,
+    stream: bool = False,
+    model: str = DEFAULT_MODEL,
+    cancel: Optional[CancellationToken] = None,
+) -> Iterator[str]:
+    yield from generate(
+        model=model,
+        messages=exception_messages(code, etype, evalue, plaintext_traceback),
         stream=stream,
+        cancel=cancel,
     )
 
-    if stream:
-        yield from deltas(response)
+
+# Async versions of the above, for use with top level `await` in IPython and async kernels
+
+
+async def adeltas(completion: AsyncIterator[StreamCompletion]) -> AsyncIterator[str]:
+    async for chunk in completion:
+        delta = chunk["choices"][0]["delta"]
+        if "content" in delta:
+            yield delta["content"]
+
+
+async def acreate_chat_completion(**kwargs):
+    """Call `openai.ChatCompletion.acreate`."""
+    return await openai.ChatCompletion.acreate(**kwargs)
+
+
+async def agenerate(
+    messages: List[Dict[str, str]],
+    model: str = DEFAULT_MODEL,
+    stream: bool = False,
+    cancel: Optional[CancellationToken] = None,
+    context_time: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """Async version of `generate`, yielding content without blocking the event loop.
+
+    `cancel` is checked between deltas. Cancelling the task works too, and closes the response.
+    """
+    if cancel is not None:
+        cancel.raise_if_cancelled()
+
+    key = cache_key(model, messages)
+
+    cache = response_cache
+    cached = cache.get(key) if cache is not None else None
+
+    if cached is not None:
+        generated = _areplay(cached, cancel)
     else:
-        yield content(response)
+        generated = _agenerate_upstream(key, messages, model, stream, cancel)
+
+    if metrics.sinks:
+        generated = metrics.ameasure(
+            generated,
+            model,
+            messages,
+            cache_hit=cached is not None,
+            context_time=context_time,
+        )
+
+    try:
+        async for delta in generated:
+            yield delta
+    finally:
+        aclose = getattr(generated, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+async def _areplay(cached: List[str], cancel: Optional[CancellationToken]) -> AsyncIterator[str]:
+    for delta in _replay(cached, cancel):
+        yield delta
+
+
+async def _agenerate_upstream(
+    key: str,
+    messages: List[Dict[str, str]],
+    model: str,
+    stream: bool,
+    cancel: Optional[CancellationToken],
+) -> AsyncIterator[str]:
+    current, generator = scheduler, backend
+    generated = await current.acall(
+        lambda: generator.acreate(model, messages, stream),
+        tokens=_prompt_tokens(current, messages, model),
+    )
+
+    collected = []
+    try:
+        async for delta in generated:
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            collected.append(delta)
+            yield delta
+    finally:
+        aclose = getattr(generated, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+    cache = response_cache
+    if cache is not None:
+        cache.set(key, collected)
+
+
+async def agenerate_next_from_history(
+    context: List[Dict[str, str]],
+    text: str,
+    stream: bool = False,
+    model: str = DEFAULT_MODEL,
+    cancel: Optional[CancellationToken] = None,
+    context_time: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """Async version of `generate_next_from_history`."""
+    async for delta in agenerate(
+        model=model,
+        messages=assist_messages(context, text),
+        stream=stream,
+        cancel=cancel,
+        context_time=context_time,
+    ):
+        yield delta
+
+
+async def agenerate_exception_suggestion(
+    code: Optional[str],
+    etype: type,
+    evalue: BaseException,
+    plaintext_traceback: str,
+    stream: bool = False,
+    model: str = DEFAULT_MODEL,
+    cancel: Optional[CancellationToken] = None,
+) -> AsyncIterator[str]:
+    """Async version of `generate_exception_suggestion`."""
+    async for delta in agenerate(
+        model=model,
+        messages=exception_messages(code, etype, evalue, plaintext_traceback),
+        stream=stream,
+        cancel=cancel,
+    ):
+        yield delta
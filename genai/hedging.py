@@ -0,0 +1,238 @@
+"""
+Hedged requests, to cut the long tail of time to first token.
+
+When the first delta of a stream takes longer than most recent ones did, a second identical request
+is sent (optionally to another model). Whichever starts streaming first is used and the other is
+closed. Hedging is opt-in, as a hedge costs a second request:
+
+>>> from genai.generate import enable_hedging
+>>> enable_hedging(percentile=95, hedge_model="gpt-3.5-turbo-16k")
+"""
+import math
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Iterator, List, Optional, Tuple
+
+from genai.backends import close_stream
+
+# Until enough streams have been timed, hedge after this many seconds
+INITIAL_DELAY = 5.0
+
+
+class HedgingPolicy:
+    """When to send a hedge request, based on the time to first token of recent streams
+
+    Attributes:
+        percentile (float): Hedge when the first token takes longer than this percentile of recent
+            times to first token
+        hedge_model (Optional[str]): Send hedges to this model instead of the original one
+        window (int): How many recent times to first token to keep
+        min_samples (int): How many times to first token are needed before using the percentile
+        initial_delay (float): Seconds to wait before hedging until there are enough samples
+        min_delay (float): Never hedge sooner than this many seconds
+        hedges (int): How many hedge requests were sent
+        hedge_wins (int): How many hedges responded before the original request
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        hedge_model: Optional[str] = None,
+        window: int = 100,
+        min_samples: int = 10,
+        initial_delay: float = INITIAL_DELAY,
+        min_delay: float = 0.5,
+    ) -> None:
+        self.percentile = percentile
+        self.hedge_model = hedge_model
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        """Seconds to wait for the first token before sending a hedge."""
+        with self._lock:
+            samples = sorted(self._samples)
+            if len(samples) < self.min_samples:
+                return self.initial_delay
+
+        # Nearest rank
+        rank = max(math.ceil(self.percentile / 100 * len(samples)), 1)
+        return max(self.min_delay, samples[rank - 1])
+
+    def record(self, time_to_first_token: Optional[float], hedge: bool = False) -> None:
+        """Record the time to first token of an original request, and whether a hedge won.
+
+        When a hedge wins, the original request's time so far is a lower bound of its time to first
+        token. None records a hedge win without a time, like when the original request failed.
+        """
+        with self._lock:
+            if time_to_first_token is not None:
+                self._samples.append(time_to_first_token)
+            if hedge:
+                self.hedge_wins += 1
+
+    def _hedged(self) -> None:
+        with self._lock:
+            self.hedges += 1
+
+
+class _Attempt:
+    __slots__ = ("model", "hedge", "stream", "lost", "sent", "failed")
+
+    def __init__(self, model: str, hedge: bool) -> None:
+        self.model = model
+        self.hedge = hedge
+        self.stream: Optional[Iterator[str]] = None
+        self.lost = False
+        # When the request was last sent, after being admitted
+        self.sent: Optional[float] = None
+        self.failed = False
+
+
+class HedgedStream:
+    """Streams the deltas of whichever request responds first
+
+    The original request is started right away on a background thread. The first `next` waits for
+    its first delta, and sends a hedge if that takes longer than the policy's delay. Closing the
+    stream closes every request, from any thread.
+
+    `start(model, sending)` makes a request to `model`, calling `sending()` right before the
+    request is actually sent (each time, if it's retried). The time to first token is counted from
+    then, so time spent waiting to be admitted by the request scheduler doesn't trigger hedges.
+
+    Attributes:
+        winning_model (Optional[str]): The model of the request being streamed, once there is one
+    """
+
+    def __init__(
+        self,
+        start: Callable[[str, Callable[[], None]], Iterator[str]],
+        model: str,
+        policy: HedgingPolicy,
+    ) -> None:
+        self._start = start
+        self._policy = policy
+        self._attempts: List[_Attempt] = []
+        # (attempt, kind, value, when)
+        self._results: "queue.Queue[Tuple[_Attempt, str, Any, float]]" = queue.Queue()
+        self._winner: Optional[Iterator[str]] = None
+        self.winning_model: Optional[str] = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+        self._launch(model, hedge=False)
+
+    def _launch(self, model: str, hedge: bool) -> None:
+        attempt = _Attempt(model, hedge)
+        self._attempts.append(attempt)
+        name = "genai-hedge" if hedge else "genai-request"
+        threading.Thread(target=self._race, args=(attempt,), name=name, daemon=True).start()
+
+    def _race(self, attempt: _Attempt) -> None:
+        def sending() -> None:
+            now = time.perf_counter()
+            attempt.sent = now
+            self._results.put((attempt, "sent", None, now))
+
+        try:
+            stream = self._start(attempt.model, sending)
+            with self._lock:
+                attempt.stream = stream
+                lost = attempt.lost or self._closed
+            if lost:
+                close_stream(stream)
+                return
+
+            first = next(stream)
+        except StopIteration:
+            self._results.put((attempt, "empty", None, time.perf_counter()))
+        except Exception as e:
+            self._results.put((attempt, "error", e, time.perf_counter()))
+        else:
+            self._results.put((attempt, "delta", first, time.perf_counter()))
+
+    def __iter__(self) -> "HedgedStream":
+        return self
+
+    def __next__(self) -> str:
+        if self._winner is None:
+            return self._first()
+        return next(self._winner)
+
+    def _first(self) -> str:
+        policy = self._policy
+        original = self._attempts[0]
+        # When to send a hedge, timed from when the original request is sent
+        deadline: Optional[float] = None
+        hedged = False
+        errors: List[Exception] = []
+
+        while True:
+            timeout = None if deadline is None else max(deadline - time.perf_counter(), 0)
+            try:
+                attempt, kind, value, when = self._results.get(timeout=timeout)
+            except queue.Empty:
+                # Too slow, so race it with a hedge
+                deadline = None
+                hedged = True
+                policy._hedged()
+                self._launch(policy.hedge_model or original.model, hedge=True)
+                continue
+
+            if self._closed:
+                raise StopIteration
+
+            if kind == "sent":
+                if attempt is original and not hedged:
+                    deadline = when + policy.delay()
+                continue
+
+            if kind == "error":
+                attempt.failed = True
+                errors.append(value)
+                if len(errors) == len(self._attempts):
+                    raise errors[0]
+                # The other request may still come through
+                continue
+
+            self._lose(attempt)
+            # Only the original request's times say how long requests take. If a hedge won, the
+            # original had been waiting at least this long.
+            waited = None
+            if original.sent is not None and not original.failed:
+                waited = when - original.sent
+            policy.record(waited, hedge=attempt.hedge)
+
+            assert attempt.stream is not None
+            self._winner = attempt.stream
+            self.winning_model = attempt.model
+            if kind == "empty":
+                raise StopIteration
+            return value
+
+    def _lose(self, winner: _Attempt) -> None:
+        """Close every request but the winner"""
+        for attempt in self._attempts:
+            if attempt is winner:
+                continue
+            with self._lock:
+                attempt.lost = True
+                stream = attempt.stream
+            if stream is not None:
+                close_stream(stream)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            streams = [attempt.stream for attempt in self._attempts if attempt.stream is not None]
+        for stream in streams:
+            close_stream(stream)
+        # Wake up a `next` waiting for the first delta
+        self._results.put((self._attempts[0], "closed", None, 0.0))
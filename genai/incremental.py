@@ -0,0 +1,137 @@
+"""
+Incremental display updates, sending only the text appended since the last update.
+
+Every update of a `GenaiMarkdown` normally resends the whole document, so streaming a response
+sends O(n²) bytes to the frontend. With incremental updates enabled, genai opens a comm on the
+`genai.stream` target. Frontends that understand it reply with `{"ready": true}`, and from then on
+streamed appends are sent over the comm as
+
+    {"display_id": "...", "append": "..."}
+
+to be added to the end of the display with that ID. Everything else (setting the message or the
+stage, like when a suggestion finishes) is still a full display update, so saved notebooks get the
+complete output. Frontends that don't know the target never reply and keep getting full updates.
+
+>>> from genai.incremental import enable_incremental_updates
+>>> enable_incremental_updates()
+
+The kernel handles the frontend's reply between cells, so appends go over the comm from the next
+cell on. `StreamAssembler` is a reference consumer of the protocol.
+"""
+import threading
+from typing import Any, Dict, Optional
+
+TARGET_NAME = "genai.stream"
+PROTOCOL_VERSION = 1
+
+
+def _create_comm(target_name: str, data: Dict[str, Any]) -> Any:
+    # The comm package comes with ipykernel 6.18 and later, older versions have their own
+    try:
+        from comm import create_comm
+
+        return create_comm(target_name=target_name, data=data)
+    except ImportError:
+        pass
+
+    try:
+        from ipykernel.comm import Comm
+
+        return Comm(target_name=target_name, data=data)
+    except ImportError:
+        # Not in a kernel, so there's no frontend to talk to
+        return None
+
+
+class IncrementalChannel:
+    """A comm to the frontend that appends can be sent over once the frontend is ready
+
+    Attributes:
+        ready (bool): Whether the frontend replied that it handles appends
+        closed (bool): Whether the comm was closed, by either side
+    """
+
+    def __init__(self, comm: Any) -> None:
+        self.comm = comm
+        self.ready = False
+        self.closed = False
+        self._lock = threading.Lock()
+        comm.on_msg(self._on_msg)
+        comm.on_close(self._on_close)
+
+    def _on_msg(self, msg: Dict[str, Any]) -> None:
+        data = msg["content"]["data"]
+        if data.get("ready") and data.get("version", PROTOCOL_VERSION) == PROTOCOL_VERSION:
+            self.ready = True
+
+    def _on_close(self, msg: Optional[Dict[str, Any]] = None) -> None:
+        self.ready = False
+        self.closed = True
+
+    def append(self, display_id: str, text: str) -> None:
+        """Append `text` to the display with ID `display_id`."""
+        with self._lock:
+            self.comm.send({"display_id": display_id, "append": text})
+
+    def close(self) -> None:
+        if not self.closed:
+            self._on_close()
+            self.comm.close()
+
+
+_channel: Optional[IncrementalChannel] = None
+
+
+def enable_incremental_updates() -> Optional[IncrementalChannel]:
+    """Offer the frontend incremental updates, returning the channel or None outside a kernel."""
+    global _channel
+    disable_incremental_updates()
+
+    comm = _create_comm(TARGET_NAME, {"version": PROTOCOL_VERSION})
+    if comm is None:
+        return None
+    _channel = IncrementalChannel(comm)
+    return _channel
+
+
+def disable_incremental_updates() -> None:
+    """Go back to full display updates for everything."""
+    global _channel
+    channel, _channel = _channel, None
+    if channel is not None:
+        channel.close()
+
+
+def active_channel() -> Optional[IncrementalChannel]:
+    """The channel to send appends over, or None when they need to be full updates."""
+    channel = _channel
+    if channel is None or not channel.ready or channel.closed:
+        return None
+    return channel
+
+
+class StreamAssembler:
+    """Reassembles displayed documents from full updates and appends, as a frontend would
+
+    Full updates arrive as display data, appends as comm messages. Both come over the same IOPub
+    channel, so applying them in the order they arrive gives the document the kernel has.
+
+    Attributes:
+        documents (Dict[str, str]): The markdown of each display, by display ID
+    """
+
+    def __init__(self) -> None:
+        self.documents: Dict[str, str] = {}
+
+    def ready(self) -> Dict[str, Any]:
+        """The reply to send when the comm opens."""
+        return {"ready": True, "version": PROTOCOL_VERSION}
+
+    def update(self, display_id: str, markdown: str) -> None:
+        """Handle a full display or display update."""
+        self.documents[display_id] = markdown
+
+    def receive(self, data: Dict[str, Any]) -> None:
+        """Handle the data of a comm message."""
+        display_id = data["display_id"]
+        self.documents[display_id] = self.documents.get(display_id, "") + data["append"]
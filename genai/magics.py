@@ -1,5 +1,7 @@
 """Magic to generate code cells for notebooks using OpenAI's API."""
 
+import time
+
 from IPython import get_ipython
 from IPython.core.magic import cell_magic
 from IPython.core.magic_arguments import argument, magic_arguments, parse_argstring
@@ -7,8 +9,10 @@ from IPython.core.magic_arguments import argument, magic_arguments, parse_argstr
 from genai.context import PastAssists, build_context
 from genai.display import GenaiMarkdown, Stage, can_handle_display_updates
 from genai.generate import generate_next_from_history
+from genai.models import DEFAULT_MODEL
 from genai.prompts import PromptStore
-from genai.tokens import trim_messages_to_fit_token_limit
+from genai.terminal import TerminalMarkdown, is_terminal
+from genai.tokens import MESSAGE_TOKEN_LIMITS, context_token_budget
 
 
 @magic_arguments()
@@ -20,7 +24,7 @@ from genai.tokens import trim_messages_to_fit_token_limit
 )
 @argument(
     "--model",
-    default="gpt-3.5-turbo-0301",
+    default=DEFAULT_MODEL,
     help="the model to use",
 )
 @cell_magic
@@ -88,7 +92,8 @@ def assist(line, cell):
 
     Caveats:
 
-    - Only the last 5 cell executions are provided as context.
+    - Only the most recent cell executions that fit in the model's context window are provided.
+    - Long inputs and outputs are cut down to their beginning and end.
     - The generated code is not guaranteed to be correct, idiomatic, efficient, readable, or useful.
     - The generated code is not guaranteed to be syntactically correct or even something to write home about.
 
@@ -109,7 +114,9 @@ def assist(line, cell):
 
     args = parse_argstring(assist, line)
 
-    gm = GenaiMarkdown(
+    # Terminals can't update displays, so stream into them instead
+    terminal = is_terminal()
+    gm = (TerminalMarkdown if terminal else GenaiMarkdown)(
         stage=Stage.STARTING,
     )
     gm.display()
@@ -119,24 +126,49 @@ def assist(line, cell):
 
     model = args.model
 
-    stream = can_handle_display_updates()
+    stream = terminal or can_handle_display_updates()
 
     messages = []
+    # Time spent building (and truncating) the context, for `genai.metrics`
+    context_time = None
     if not args.fresh:
-        # Start at 5 before the current execution to get the last 5 executions
-        start = max(ip.execution_count - 5, 1)
+        started = time.perf_counter()
+        # Consider the whole session, the token budget decides how far back to go
+        start = 1
         # Do not include the current execution
         stop = ip.execution_count
 
-        context = build_context(ip.history_manager, start=start, stop=stop)
-        messages = trim_messages_to_fit_token_limit(context.messages, model=model)
+        # Whatever is left of the model's window after the prompt, the request, and the reply
+        max_tokens = context_token_budget(
+            model,
+            [
+                {"role": "system", "content": PromptStore.assist_prompt},
+                {"role": "user", "content": cell_text},
+            ],
+        )
+
+        # Walk back from the most recent execution, only reading as much history as fits
+        context = build_context(
+            ip.history_manager,
+            start=start,
+            stop=stop,
+            max_tokens=max_tokens,
+            model=model,
+            message_token_limits=MESSAGE_TOKEN_LIMITS,
+        )
+        messages = context.messages
+        context_time = time.perf_counter() - started
 
     if args.verbose:
         print("magic arguments:", line)
         print("submission:", cell)
         print("messages:", messages)
 
-    gm.consume(generate_next_from_history(messages, cell_text, stream=stream))
+    gm.consume(
+        generate_next_from_history(
+            messages, cell_text, stream=stream, model=model, context_time=context_time
+        )
+    )
 
     gm.stage = Stage.FINISHED
 
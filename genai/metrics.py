@@ -0,0 +1,279 @@
+"""
+Timing and token records for every generation.
+
+Each generation emits a `GenerationRecord` to the registered sinks once it ends, whether it
+finished, failed or was cancelled. Nothing is measured until a sink is added:
+
+>>> from genai.metrics import JSONLSink, RingBufferSink, add_sink
+>>> recent = add_sink(RingBufferSink(maxlen=100))
+>>> add_sink(JSONLSink("genai-metrics.jsonl"))
+>>> ...
+>>> recent.records[-1].time_to_first_token
+
+`consumer_time` is the time spent between deltas by whatever reads the generation (rendering, for
+`GenaiMarkdown.consume`), so slow rendering can be told apart from a slow network. `context_time`
+is the time spent building the context beforehand, for the callers that do (like `%%assist`).
+"""
+import json
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import (
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    TypeVar,
+    Union,
+)
+
+from genai.cancellation import GenerationCancelled
+from genai.tokens import encoding_for_model, num_tokens_from_messages, num_tokens_from_string
+
+# How a generation ended
+OK = "ok"
+ERROR = "error"
+CANCELLED = "cancelled"
+# The consumer stopped reading before the end
+CLOSED = "closed"
+
+
+@dataclass(frozen=True)
+class GenerationRecord:
+    """Timings and token counts for one generation
+
+    Attributes:
+        model (str): The model asked
+        prompt_tokens (int): Tokens in the request
+        completion_tokens (int): Tokens generated (or replayed from the cache)
+        time_to_first_token (Optional[float]): Seconds until the first delta, None if there was none
+        tokens_per_second (Optional[float]): Completion tokens per second after the first one
+        wall_time (float): Seconds from the start of the generation to its end
+        consumer_time (float): Seconds the consumer spent between deltas
+        cache_hit (bool): Whether the response was replayed from the response cache
+        status (str): How the generation ended: "ok", "error", "cancelled" or "closed"
+        timestamp (float): When the generation started, in seconds since the epoch
+        context_time (Optional[float]): Seconds spent building the context before the
+            generation, None if the caller didn't build or time one
+    """
+
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    time_to_first_token: Optional[float]
+    tokens_per_second: Optional[float]
+    wall_time: float
+    consumer_time: float
+    cache_hit: bool
+    status: str
+    timestamp: float
+    context_time: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Union[str, int, float, bool, None]]:
+        return asdict(self)
+
+
+class Sink(Protocol):
+    """Receives generation records"""
+
+    def emit(self, record: GenerationRecord) -> None:
+        ...
+
+
+class RingBufferSink:
+    """Keeps the most recent records in memory
+
+    Attributes:
+        records (Deque[GenerationRecord]): The records, oldest first
+    """
+
+    def __init__(self, maxlen: int = 1000) -> None:
+        self.records: Deque[GenerationRecord] = deque(maxlen=maxlen)
+
+    def emit(self, record: GenerationRecord) -> None:
+        self.records.append(record)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
+class JSONLSink:
+    """Appends each record to a file as a line of JSON"""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def emit(self, record: GenerationRecord) -> None:
+        line = json.dumps(record.to_dict(), sort_keys=True)
+        with self._lock:
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class CallbackSink:
+    """Calls a function with each record"""
+
+    def __init__(self, callback: Callable[[GenerationRecord], None]) -> None:
+        self.callback = callback
+
+    def emit(self, record: GenerationRecord) -> None:
+        self.callback(record)
+
+
+S = TypeVar("S", bound=Sink)
+
+sinks: List[Sink] = []
+_sinks_lock = threading.Lock()
+
+
+def add_sink(sink: S) -> S:
+    """Start emitting generation records to `sink`, which is returned."""
+    with _sinks_lock:
+        sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink: Sink) -> None:
+    """Stop emitting generation records to `sink`."""
+    with _sinks_lock:
+        if sink in sinks:
+            sinks.remove(sink)
+
+
+def emit(record: GenerationRecord) -> None:
+    """Send `record` to every sink. A failing sink doesn't affect the others (or generation)."""
+    with _sinks_lock:
+        current = list(sinks)
+
+    for sink in current:
+        try:
+            sink.emit(record)
+        except Exception:
+            pass
+
+
+class _Measurement:
+    def __init__(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        cache_hit: bool,
+        context_time: Optional[float],
+    ) -> None:
+        self.model = model
+        self.messages = messages
+        self.cache_hit = cache_hit
+        self.context_time = context_time
+        self.timestamp = time.time()
+        self.started = time.perf_counter()
+        self.first: Optional[float] = None
+        self.consumer_time = 0.0
+        self.deltas: List[str] = []
+        self.status = CLOSED
+
+    def delta(self, delta: str) -> None:
+        if self.first is None:
+            self.first = time.perf_counter()
+        self.deltas.append(delta)
+
+    def finish(self) -> None:
+        ended = time.perf_counter()
+        text = "".join(self.deltas)
+
+        try:
+            prompt_tokens = num_tokens_from_messages(self.messages, self.model)
+            completion_tokens = (
+                num_tokens_from_string(text, encoding_for_model(self.model)) if text else 0
+            )
+        except Exception:
+            # No tokenizer to count with
+            prompt_tokens = completion_tokens = 0
+
+        time_to_first_token = None
+        tokens_per_second = None
+        if self.first is not None:
+            time_to_first_token = self.first - self.started
+            streaming = ended - self.first - self.consumer_time
+            if completion_tokens > 1 and streaming > 0:
+                tokens_per_second = (completion_tokens - 1) / streaming
+
+        emit(
+            GenerationRecord(
+                model=self.model,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                time_to_first_token=time_to_first_token,
+                tokens_per_second=tokens_per_second,
+                wall_time=ended - self.started,
+                consumer_time=self.consumer_time,
+                cache_hit=self.cache_hit,
+                status=self.status,
+                timestamp=self.timestamp,
+                context_time=self.context_time,
+            )
+        )
+
+
+def measure(
+    deltas: Iterator[str],
+    model: str,
+    messages: List[Dict[str, str]],
+    cache_hit: bool = False,
+    context_time: Optional[float] = None,
+) -> Iterator[str]:
+    """Yield from `deltas`, emitting a record for the generation once it ends."""
+    measurement = _Measurement(model, messages, cache_hit, context_time)
+    try:
+        for delta in deltas:
+            measurement.delta(delta)
+            yielded = time.perf_counter()
+            yield delta
+            measurement.consumer_time += time.perf_counter() - yielded
+        measurement.status = OK
+    except GenerationCancelled:
+        measurement.status = CANCELLED
+        raise
+    except Exception:
+        measurement.status = ERROR
+        raise
+    finally:
+        close = getattr(deltas, "close", None)
+        if close is not None:
+            close()
+        measurement.finish()
+
+
+async def ameasure(
+    deltas: AsyncIterator[str],
+    model: str,
+    messages: List[Dict[str, str]],
+    cache_hit: bool = False,
+    context_time: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """Async version of `measure`."""
+    measurement = _Measurement(model, messages, cache_hit, context_time)
+    try:
+        async for delta in deltas:
+            measurement.delta(delta)
+            yielded = time.perf_counter()
+            yield delta
+            measurement.consumer_time += time.perf_counter() - yielded
+        measurement.status = OK
+    except GenerationCancelled:
+        measurement.status = CANCELLED
+        raise
+    except Exception:
+        measurement.status = ERROR
+        raise
+    finally:
+        aclose = getattr(deltas, "aclose", None)
+        if aclose is not None:
+            await aclose()
+        measurement.finish()
@@ -0,0 +1,88 @@
+"""
+Known chat models and what genai needs to know about them: how big their context window is, how
+much of it to keep free for the reply, and how to count the tokens of a prompt.
+
+>>> from genai.models import get_model
+>>> get_model("gpt-4").context_window
+8192
+"""
+from dataclasses import dataclass, replace
+from typing import Dict
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+
+@dataclass(frozen=True)
+class ModelInfo:
+    """Token accounting for a single chat model
+
+    Attributes:
+        name (str): The model name as sent to the API
+        context_window (int): Total tokens the model accepts, prompt and reply combined
+        reply_reserve (int): Tokens of the context window kept free for the reply
+        tokens_per_message (int): Overhead for every message in the prompt
+        tokens_per_name (int): Adjustment for messages that carry a `name`
+        reply_priming (int): Tokens every reply is primed with
+        encoding (str): The tiktoken encoding used by the model
+    """
+
+    name: str
+    context_window: int
+    reply_reserve: int
+    tokens_per_message: int = 3
+    tokens_per_name: int = 1
+    reply_priming: int = 3
+    encoding: str = "cl100k_base"
+
+    @property
+    def prompt_budget(self) -> int:
+        """The number of tokens available for the prompt"""
+        return self.context_window - self.reply_reserve
+
+
+def _legacy(name: str, context_window: int, reply_reserve: int) -> ModelInfo:
+    # Original ChatML accounting: <im_start>{role/name}\n{content}<im_end>\n per message, the role is
+    # omitted when there's a name, and every reply is primed with <im_start>assistant
+    return ModelInfo(
+        name,
+        context_window,
+        reply_reserve,
+        tokens_per_message=4,
+        tokens_per_name=-1,
+        reply_priming=2,
+    )
+
+
+MODELS: Dict[str, ModelInfo] = {
+    model.name: model
+    for model in [
+        _legacy("gpt-3.5-turbo", 4096, 512),
+        _legacy("gpt-3.5-turbo-0301", 4096, 512),
+        ModelInfo("gpt-3.5-turbo-0613", 4096, 512),
+        ModelInfo("gpt-3.5-turbo-16k", 16384, 1024),
+        ModelInfo("gpt-3.5-turbo-16k-0613", 16384, 1024),
+        _legacy("gpt-4", 8192, 1024),
+        _legacy("gpt-4-0314", 8192, 1024),
+        ModelInfo("gpt-4-0613", 8192, 1024),
+        _legacy("gpt-4-32k", 32768, 2048),
+        _legacy("gpt-4-32k-0314", 32768, 2048),
+        ModelInfo("gpt-4-32k-0613", 32768, 2048),
+    ]
+}
+
+
+def get_model(name: str) -> ModelInfo:
+    """Look up a model by name.
+
+    Unknown snapshots of a known model (e.g. `gpt-4-1106`) resolve to the longest known name they
+    start with. Anything else gets a conservative 4k window with the current accounting.
+    """
+    model = MODELS.get(name)
+    if model is not None:
+        return model
+
+    prefixes = [known for known in MODELS if name.startswith(known)]
+    if prefixes:
+        return replace(MODELS[max(prefixes, key=len)], name=name)
+
+    return ModelInfo(name, context_window=4096, reply_reserve=512)
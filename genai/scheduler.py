@@ -0,0 +1,286 @@
+"""
+Pacing and retrying API requests so a shared API key stays within its rate limits.
+
+Requests are admitted through token buckets for requests per minute and (prompt) tokens per minute,
+so bursts of suggestions queue up here instead of failing with a 429. Requests that are rate
+limited anyway are retried with jittered exponential backoff, waiting at least as long as the API's
+`Retry-After` header asks for.
+
+By default there are no budgets and only retries are enabled. To pace requests as well:
+
+>>> from genai.generate import configure_scheduler
+>>> configure_scheduler(requests_per_minute=60, tokens_per_minute=40_000)
+"""
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass, replace
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional, Tuple, Type, TypeVar
+
+import openai
+
+T = TypeVar("T")
+
+# Errors worth trying again after a pause
+RETRYABLE_ERRORS: Tuple[Type[Exception], ...] = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+)
+
+MAX_RETRIES = 3
+# Seconds to back off after the first failure, doubling after each one
+BASE_DELAY = 1.0
+MAX_DELAY = 30.0
+
+
+class TokenBucket:
+    """Admits up to `rate` units per minute, in bursts of up to `capacity` units
+
+    Attributes:
+        rate (float): Units added to the bucket per minute
+        capacity (float): The most units the bucket holds, defaulting to a minute's worth
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = rate
+        self.capacity = rate if capacity is None else capacity
+        self._clock = clock
+        self._level = self.capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate / 60)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available. Larger requests than the bucket holds only
+        wait for a full bucket."""
+        self._refill()
+        missing = min(amount, self.capacity) - self._level
+        return max(0.0, missing * 60 / self.rate)
+
+    def take(self, amount: float) -> None:
+        """Remove `amount` units, which should be available (see `wait_time`)."""
+        self._refill()
+        self._level -= min(amount, self.capacity)
+
+
+@dataclass(frozen=True)
+class SchedulerStats:
+    """A snapshot of the scheduler's metrics
+
+    Attributes:
+        queue_depth (int): Requests waiting to be admitted right now
+        admitted (int): Requests admitted, counting each retry
+        retries (int): Requests retried after a retryable error
+        total_wait (float): Seconds spent waiting for admission, across all requests
+        max_wait (float): The longest any request waited for admission
+    """
+
+    queue_depth: int = 0
+    admitted: int = 0
+    retries: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    @property
+    def mean_wait(self) -> float:
+        """The mean seconds a request waited for admission"""
+        return self.total_wait / self.admitted if self.admitted else 0.0
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """The seconds to wait before retrying, according to the error's `Retry-After` header."""
+    headers = getattr(error, "headers", None) or {}
+    value = None
+    for name, header in headers.items():
+        if name.lower() == "retry-after":
+            value = header
+            break
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    """Admits requests within per-minute budgets and retries failed ones
+
+    Attributes:
+        requests_per_minute (float): Budget of requests, or None for no limit
+        tokens_per_minute (float): Budget of prompt tokens, or None for no limit
+        max_retries (int): Retries after a retryable error before giving up
+        base_delay (float): Seconds to back off after the first failure, doubling each time
+        max_delay (float): The most seconds to back off, unless `Retry-After` asks for longer
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_retries: int = MAX_RETRIES,
+        base_delay: float = BASE_DELAY,
+        max_delay: float = MAX_DELAY,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._clock = clock
+        self._sleep = sleep
+        self._requests = (
+            TokenBucket(requests_per_minute, clock=clock) if requests_per_minute else None
+        )
+        self._tokens = TokenBucket(tokens_per_minute, clock=clock) if tokens_per_minute else None
+        # Set from `Retry-After`, holding back every request rather than just the one that failed
+        self._paused_until = 0.0
+
+        self._lock = threading.Lock()
+        # Admit one request at a time, so waiting requests are admitted roughly in order
+        self._admission = threading.Lock()
+        self._stats = SchedulerStats()
+
+    @property
+    def counts_tokens(self) -> bool:
+        """Whether requests need to be sized in tokens to be admitted"""
+        return self._tokens is not None
+
+    def stats(self) -> SchedulerStats:
+        """Returns a snapshot of the scheduler's metrics."""
+        with self._lock:
+            return self._stats
+
+    def _update(self, **changes: Any) -> None:
+        with self._lock:
+            stats = self._stats
+            self._stats = replace(
+                stats, **{name: getattr(stats, name) + change for name, change in changes.items()}
+            )
+
+    def _admitted(self, waited: float) -> None:
+        with self._lock:
+            stats = self._stats
+            self._stats = replace(
+                stats,
+                queue_depth=stats.queue_depth - 1,
+                admitted=stats.admitted + 1,
+                total_wait=stats.total_wait + waited,
+                max_wait=max(stats.max_wait, waited),
+            )
+
+    def _reserve(self, tokens: int) -> float:
+        """Take a request's share of the budgets, or return the seconds to wait until it fits."""
+        with self._lock:
+            wait = self._paused_until - self._clock()
+            if self._requests is not None:
+                wait = max(wait, self._requests.wait_time(1))
+            if self._tokens is not None:
+                wait = max(wait, self._tokens.wait_time(tokens))
+            if wait > 0:
+                return wait
+
+            if self._requests is not None:
+                self._requests.take(1)
+            if self._tokens is not None:
+                self._tokens.take(tokens)
+            return 0.0
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Block until a request of `tokens` prompt tokens fits the budgets. Returns the wait."""
+        start = self._clock()
+        self._update(queue_depth=1)
+        try:
+            with self._admission:
+                while True:
+                    wait = self._reserve(tokens)
+                    if wait <= 0:
+                        break
+                    self._sleep(wait)
+        except BaseException:
+            self._update(queue_depth=-1)
+            raise
+
+        waited = self._clock() - start
+        self._admitted(waited)
+        return waited
+
+    async def aacquire(self, tokens: int = 0) -> float:
+        """Async version of `acquire`, waiting without blocking the event loop."""
+        start = self._clock()
+        self._update(queue_depth=1)
+        try:
+            while True:
+                wait = self._reserve(tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+        except BaseException:
+            self._update(queue_depth=-1)
+            raise
+
+        waited = self._clock() - start
+        self._admitted(waited)
+        return waited
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """Seconds to wait before retry number `attempt` (from 0) after `error`."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        requested = retry_after(error)
+        if requested is not None:
+            delay = max(delay, requested)
+            with self._lock:
+                self._paused_until = max(self._paused_until, self._clock() + requested)
+        return delay
+
+    def call(self, request: Callable[[], T], tokens: int = 0) -> T:
+        """Call `request` once it is admitted, retrying it after retryable errors."""
+        attempt = 0
+        while True:
+            self.acquire(tokens)
+            try:
+                return request()
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt, e)
+
+            attempt += 1
+            self._update(retries=1)
+            self._sleep(delay)
+
+    async def acall(self, request: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        """Async version of `call`."""
+        attempt = 0
+        while True:
+            await self.aacquire(tokens)
+            try:
+                return await request()
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt, e)
+
+            attempt += 1
+            self._update(retries=1)
+            await asyncio.sleep(delay)
@@ -0,0 +1,188 @@
+"""
+A shared, pooled HTTP session for talking to the OpenAI API.
+
+By default the `openai` library creates a session per thread, so suggestions generated from
+different threads (or after the library recycles its session) pay for TCP and TLS setup again. genai
+installs one keep-alive session with a connection pool for every request instead, and can open a
+connection ahead of the first suggestion with `preconnect`.
+
+>>> from genai.session import configure_session
+>>> configure_session(pool_maxsize=16)
+"""
+import socket
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Optional
+
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+
+# Number of hosts to keep connection pools for
+POOL_CONNECTIONS = 4
+# Number of connections kept alive per host
+POOL_MAXSIZE = 8
+# Retries for failed connections (not for failed requests)
+MAX_RETRIES = 2
+
+_session: Optional["PooledSession"] = None
+_session_lock = threading.Lock()
+
+# Responses received on each thread while `capture_responses` is active
+_captured = threading.local()
+
+
+def _proxies():
+    proxy = openai.proxy
+    if isinstance(proxy, str):
+        return {"http": proxy, "https": proxy}
+    if isinstance(proxy, dict):
+        return dict(proxy)
+    return {}
+
+
+class PooledSession(requests.Session):
+    """A session whose pool outlives `close`
+
+    `openai` recycles the session of each thread every few minutes by closing it, which would
+    close every pooled connection of the shared session along with it. `shutdown` really closes it.
+
+    `openai` also reads `openai.proxy` into every session it makes. The shared session lives on, so
+    it reads the proxy again before each request instead.
+    """
+
+    def merge_environment_settings(self, url, proxies, stream, verify, cert):
+        # Called for every request, before the session's proxies are merged in
+        latest = _proxies()
+        if latest != self.proxies:
+            # In place, as `openai` passes this very dict along with the request
+            self.proxies.clear()
+            self.proxies.update(latest)
+        return super().merge_environment_settings(url, proxies, stream, verify, cert)
+
+    def close(self) -> None:
+        # Keep the pooled connections for the other threads, and for the next request
+        pass
+
+    def shutdown(self) -> None:
+        """Close the pooled connections."""
+        super().close()
+
+
+def _mount_adapter(
+    session: requests.Session, pool_connections: int, pool_maxsize: int, max_retries: int
+) -> None:
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=max_retries,
+    )
+    previous = session.adapters.get("https://")
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if previous is not None:
+        previous.close()
+
+
+def get_session() -> PooledSession:
+    """Returns the shared session, creating it with the default pool settings if needed."""
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            _session = PooledSession()
+            _session.hooks["response"].append(_capture_response)
+            _mount_adapter(_session, POOL_CONNECTIONS, POOL_MAXSIZE, MAX_RETRIES)
+        return _session
+
+
+def _capture_response(response: requests.Response, *args: Any, **kwargs: Any) -> None:
+    responses = getattr(_captured, "responses", None)
+    if responses is not None:
+        responses.append(response)
+
+
+@contextmanager
+def capture_responses() -> Iterator[List[requests.Response]]:
+    """Collect the responses the shared session receives on this thread within the block.
+
+    `openai` doesn't hand out the HTTP response behind a stream, and closing the response is the only
+    way to release its connection before the stream is read to the end.
+    """
+    previous = getattr(_captured, "responses", None)
+    responses: List[requests.Response] = []
+    _captured.responses = responses
+    try:
+        yield responses
+    finally:
+        _captured.responses = previous
+
+
+def abort_response(response: requests.Response) -> None:
+    """Close a streaming response, even while another thread is blocked reading it.
+
+    Closing alone doesn't wake up a blocked read, so the socket is shut down first. The connection
+    can't be reused with the rest of the body unread; closing it frees its place in the pool.
+    """
+    connection = getattr(response.raw, "_connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            # Already closed
+            pass
+
+    try:
+        response.close()
+    except Exception:
+        # The reading thread closes whatever is left once its read fails
+        pass
+
+
+def configure_session(
+    pool_connections: int = POOL_CONNECTIONS,
+    pool_maxsize: int = POOL_MAXSIZE,
+    max_retries: int = MAX_RETRIES,
+) -> PooledSession:
+    """Change the pool settings of the shared session.
+
+    The session object stays the same (the `openai` library holds on to it per thread), but its
+    pooled connections are closed and replaced with a pool of the new size.
+    """
+    session = get_session()
+    with _session_lock:
+        _mount_adapter(session, pool_connections, pool_maxsize, max_retries)
+    return session
+
+
+def install_session() -> None:
+    """Have `openai` send every request through the shared session.
+
+    A session the user already gave to `openai.requestssession` is left alone.
+    """
+    if openai.requestssession is None:
+        openai.requestssession = get_session()
+
+
+def preconnect(background: bool = True, timeout: float = 5) -> Optional[threading.Thread]:
+    """Open a pooled connection to `openai.api_base` before it's needed.
+
+    The response doesn't matter; the point is to leave a warm (TCP and TLS) connection in the pool.
+    When `background` is set this happens on a daemon thread, which is returned.
+    """
+    install_session()
+
+    def connect():
+        try:
+            get_session().head(openai.api_base, timeout=timeout)
+        except requests.RequestException:
+            pass
+
+    if not background:
+        connect()
+        return None
+
+    thread = threading.Thread(target=connect, name="genai-preconnect", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,221 @@
+"""
+Single-flight deduplication of identical generations.
+
+When the same request is made again while the first one is still streaming (a cell in a loop raising
+the same error, say), the second caller subscribes to the first caller's stream instead of starting
+another request. Every subscriber sees every delta, from the beginning.
+"""
+import threading
+from typing import Callable, Dict, Iterator, List, Optional
+
+from genai.cancellation import CancellationToken, GenerationCancelled
+
+
+class _Subscription:
+    __slots__ = ("cancelled", "left")
+
+    def __init__(self) -> None:
+        self.cancelled = False
+        self.left = False
+
+
+class SharedStream:
+    """Fans a single upstream iterator out to any number of subscribers
+
+    A helper thread pulls the next item from upstream whenever a subscriber needs it, while the
+    subscribers wait for it. That way a cancelled subscriber leaves right away, instead of being
+    stuck until the next item arrives. Items are kept so that late subscribers can replay them.
+    """
+
+    def __init__(
+        self, upstream: Iterator[str], on_finish: Optional[Callable[[], None]] = None
+    ) -> None:
+        self._upstream = upstream
+        self._on_finish = on_finish
+        self._items: List[str] = []
+        self._done = False
+        self._abandoned = False
+        self._error: Optional[Exception] = None
+        # Whether a subscriber is waiting for the next item
+        self._wanted = False
+        self._puller: Optional[threading.Thread] = None
+        self._subscribers = 0
+        self._condition = threading.Condition()
+
+    @property
+    def subscribers(self) -> int:
+        """The number of subscribers still reading from the stream"""
+        with self._condition:
+            return self._subscribers
+
+    def subscribe(self, cancel: Optional[CancellationToken] = None) -> Optional[Iterator[str]]:
+        """Returns a new iterator over every item of the stream.
+
+        Returns None if every earlier subscriber left before the stream finished, as the upstream
+        has been closed and the rest of the items will never arrive.
+
+        Cancelling `cancel` makes the iterator raise `GenerationCancelled`, and leaves the stream.
+        """
+        with self._condition:
+            if self._abandoned:
+                return None
+            self._subscribers += 1
+        return self._iterate(_Subscription(), cancel)
+
+    def _iterate(
+        self, subscription: _Subscription, cancel: Optional[CancellationToken]
+    ) -> Iterator[str]:
+        unregister = (
+            cancel.on_cancel(lambda: self._cancel(subscription))
+            if cancel is not None
+            else lambda: None
+        )
+
+        index = 0
+        try:
+            while True:
+                has_item, item = self._next(index, subscription)
+                if not has_item:
+                    return
+                index += 1
+                yield item
+        finally:
+            unregister()
+            self._unsubscribe(subscription)
+
+    def _cancel(self, subscription: _Subscription) -> None:
+        with self._condition:
+            subscription.cancelled = True
+            self._condition.notify_all()
+        # Leave now rather than at the next item, so that a blocked read is aborted
+        self._unsubscribe(subscription)
+
+    def _next(self, index: int, subscription: _Subscription):
+        with self._condition:
+            while True:
+                if subscription.cancelled:
+                    raise GenerationCancelled()
+                if index < len(self._items):
+                    return True, self._items[index]
+                if self._done:
+                    if self._error is not None:
+                        raise self._error
+                    return False, None
+                if not self._wanted:
+                    self._wanted = True
+                    if self._puller is None:
+                        self._puller = threading.Thread(
+                            target=self._pull, name="genai-shared-stream", daemon=True
+                        )
+                        self._puller.start()
+                    self._condition.notify_all()
+                self._condition.wait()
+
+    def _pull(self) -> None:
+        while True:
+            with self._condition:
+                while not self._wanted and not self._done:
+                    self._condition.wait()
+                if self._done:
+                    # Abandoned, and the upstream was closed when it was
+                    return
+
+            try:
+                item = next(self._upstream)
+            except StopIteration:
+                self._end()
+                return
+            except Exception as e:
+                self._end(e)
+                return
+
+            with self._condition:
+                abandoned = self._abandoned
+                if not abandoned:
+                    self._items.append(item)
+                    self._wanted = False
+                    self._condition.notify_all()
+
+            if abandoned:
+                # Everyone left while the item was on its way, so stop the request now
+                _close(self._upstream)
+                return
+
+    def _end(self, error: Optional[Exception] = None) -> None:
+        with self._condition:
+            if self._abandoned:
+                return
+            self._done = True
+            self._error = error
+            self._condition.notify_all()
+        self._finish()
+
+    def _unsubscribe(self, subscription: _Subscription) -> None:
+        with self._condition:
+            if subscription.left:
+                return
+            subscription.left = True
+            self._subscribers -= 1
+            abandoned = self._subscribers == 0 and not self._done
+            if abandoned:
+                self._done = True
+                self._abandoned = True
+                self._condition.notify_all()
+
+        if abandoned:
+            # Nobody is left to read the rest, so stop the upstream request
+            _close(self._upstream)
+            self._finish()
+
+    def _finish(self) -> None:
+        if self._on_finish is not None:
+            self._on_finish()
+
+
+def _close(upstream: Iterator[str]) -> None:
+    close = getattr(upstream, "close", None)
+    if close is not None:
+        try:
+            close()
+        except ValueError:
+            # Still executing in the helper thread, which closes it once the item arrives
+            pass
+
+
+class SingleFlight:
+    """Deduplicates concurrent streams by key"""
+
+    def __init__(self) -> None:
+        self._flights: Dict[str, SharedStream] = {}
+        self._lock = threading.Lock()
+
+    def stream(
+        self,
+        key: str,
+        start: Callable[[], Iterator[str]],
+        cancel: Optional[CancellationToken] = None,
+    ) -> Iterator[str]:
+        """Subscribe to the stream in flight for `key`, calling `start` to begin one if needed.
+
+        `start` is called with a lock held, so it should only create the (lazy) iterator.
+        """
+        with self._lock:
+            shared = self._flights.get(key)
+            subscription = shared.subscribe(cancel) if shared is not None else None
+
+            if subscription is None:
+                shared = SharedStream(start(), on_finish=lambda: self._forget(key, shared))
+                self._flights[key] = shared
+                subscription = shared.subscribe(cancel)
+
+            assert subscription is not None
+            return subscription
+
+    def _forget(self, key: str, shared: Optional[SharedStream]) -> None:
+        with self._lock:
+            if self._flights.get(key) is shared:
+                del self._flights[key]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._flights)
@@ -4,15 +4,132 @@ ChatGPT in order to help debug the code. It will also display the error in the
 notebook as usual.
 """
 
+import threading
 from traceback import TracebackException
 from types import TracebackType
-from typing import Type
+from typing import Iterator, Optional, Set, Type
 
 from IPython import InteractiveShell, get_ipython
 
+from genai.backends import close_stream
+from genai.cancellation import CancellationToken
 from genai.context import PastAssists, PastErrors
+from genai.diagnose import CONFIDENT, diagnose
 from genai.display import GenaiMarkdown, Stage, can_handle_display_updates
+from genai.fingerprint import SuggestionStore, fingerprint
 from genai.generate import generate_exception_suggestion
+from genai.models import DEFAULT_MODEL
+from genai.prompts import PromptStore
+from genai.terminal import TerminalMarkdown, is_terminal
+from genai.worker import BackgroundWorker, QueuePolicy
+
+# The model asked for exception suggestions. Set with `register`.
+exception_model = DEFAULT_MODEL
+
+SUGGESTION_HEADING = "## 💡 Suggestion\n"
+
+# Explain typos in names, modules and attributes locally instead of asking, see `genai.diagnose`
+local_diagnosis = True
+# Ask the model anyway when a local diagnosis is less confident than this. None to never ask.
+escalate_below: Optional[float] = CONFIDENT
+
+# Suggestions by error fingerprint, so that recurring errors are answered right away. Set to None
+# to always ask for a new suggestion.
+suggestion_store: Optional[SuggestionStore] = SuggestionStore()
+
+# Generates suggestions off the main thread when set, see `enable_background_suggestions`
+worker: Optional[BackgroundWorker] = None
+
+# Cancel suggestions still in progress when the next cell runs, see `enable_background_suggestions`
+cancel_on_new_cell = False
+# Tokens for the suggestions still in progress
+_in_progress: Set[CancellationToken] = set()
+_in_progress_lock = threading.Lock()
+
+
+def stream_suggestion(
+    gm: GenaiMarkdown, suggestion: Iterator[str], cancel: Optional[CancellationToken] = None
+) -> None:
+    """Stream a suggestion into an already displayed `GenaiMarkdown`.
+
+    If `cancel` is cancelled part way, the suggestion is cleared instead.
+    """
+    if cancel is not None and cancel.cancelled:
+        _drop_suggestion(gm)
+        return
+
+    gm.stage = Stage.GENERATING
+
+    gm.message = SUGGESTION_HEADING
+    gm.consume(suggestion, cancel=cancel)
+
+    if cancel is not None and cancel.cancelled:
+        _drop_suggestion(gm)
+        return
+    gm.stage = Stage.FINISHED
+
+
+def _stream_suggestion_in_background(
+    gm: GenaiMarkdown, suggestion: Iterator[str], cancel: CancellationToken
+) -> None:
+    try:
+        stream_suggestion(gm, suggestion, cancel=cancel)
+    except Exception as e:
+        # There's no cell to print to anymore, so report the error in place of the suggestion
+        gm.message = f"Error while trying to provide a suggestion: {e}"
+        gm.stage = None
+    finally:
+        _finish(cancel)
+
+
+def _remember(store: SuggestionStore, key: str, suggestion: Iterator[str]) -> Iterator[str]:
+    # Only complete suggestions are worth repeating
+    deltas = []
+    try:
+        for delta in suggestion:
+            deltas.append(delta)
+            yield delta
+    finally:
+        # Release the request when the suggestion is abandoned part way
+        close_stream(suggestion)
+    store.set(key, "".join(deltas))
+
+
+def _drop_suggestion(gm: GenaiMarkdown) -> None:
+    # Nothing (more) is coming, so take the heading and any stage information out
+    gm.message = " "
+    gm.stage = None
+
+
+def _drop_queued_suggestion(gm: GenaiMarkdown, cancel: CancellationToken) -> None:
+    # The suggestion generator was never started, so nothing was requested
+    _finish(cancel)
+    _drop_suggestion(gm)
+
+
+def _start(cancel: CancellationToken) -> None:
+    with _in_progress_lock:
+        _in_progress.add(cancel)
+
+
+def _finish(cancel: CancellationToken) -> None:
+    with _in_progress_lock:
+        _in_progress.discard(cancel)
+
+
+def cancel_suggestions() -> None:
+    """Cancel every suggestion that is still being generated, releasing its request."""
+    with _in_progress_lock:
+        tokens = list(_in_progress)
+        _in_progress.clear()
+
+    for token in tokens:
+        token.cancel()
+
+
+def _on_pre_run_cell(info=None) -> None:
+    if cancel_on_new_cell:
+        cancel_suggestions()
 
 
 # this function will be called on exceptions in any cell
@@ -55,7 +172,9 @@ def custom_exc(
         else:
             code = None
 
-        gm = GenaiMarkdown(
+        # Terminals can't update displays, so stream into them instead
+        terminal = is_terminal()
+        gm = (TerminalMarkdown if terminal else GenaiMarkdown)(
             "Let's see how we can fix this... 🔧",
             stage=Stage.STARTING,
         )
@@ -69,21 +188,53 @@ def custom_exc(
         PastErrors.add(execution_count, etype, evalue, tb)
         PastAssists.add(execution_count, gm)
 
-        stream = can_handle_display_updates()
+        # Typos don't need a model to spot them
+        if local_diagnosis:
+            diagnosis = diagnose(etype, evalue, tb, user_ns=shell.user_ns)
+            if diagnosis is not None and (
+                escalate_below is None or diagnosis.confidence >= escalate_below
+            ):
+                gm.message = SUGGESTION_HEADING + diagnosis.markdown
+                gm.stage = Stage.FINISHED
+                return
+
+        # Seen this one before (with the same prompt and model), so there's no need to ask again
+        store = suggestion_store
+        key = fingerprint(
+            etype, evalue, tb, context=(PromptStore.exception_prompt, exception_model)
+        )
+        remembered = store.get(key) if store is not None else None
+        if remembered is not None:
+            gm.message = SUGGESTION_HEADING + remembered
+            gm.stage = Stage.FINISHED
+            return
+
+        stream = terminal or can_handle_display_updates()
 
+        cancel = CancellationToken()
         suggestion = generate_exception_suggestion(
             code=code,
             etype=etype,
             evalue=evalue,
             plaintext_traceback=plaintext_traceback,
             stream=stream,
+            model=exception_model,
+            cancel=cancel,
         )
+        if store is not None:
+            suggestion = _remember(store, key, suggestion)
 
-        gm.stage = Stage.GENERATING
+        # Streaming into the terminal in the background would write over the next prompt
+        if worker is not None and not terminal:
+            # Let the user carry on while the suggestion streams in through its display ID
+            _start(cancel)
+            worker.submit(
+                lambda: _stream_suggestion_in_background(gm, suggestion, cancel),
+                on_drop=lambda: _drop_queued_suggestion(gm, cancel),
+            )
+            return
 
-        gm.message = "## 💡 Suggestion\n"
-        gm.consume(suggestion)
-        gm.stage = Stage.FINISHED
+        stream_suggestion(gm, suggestion, cancel=cancel)
 
     except Exception as e:
         print("Error while trying to provide a suggestion: ", e)
@@ -94,9 +245,54 @@ def custom_exc(
             gm.stage = None
 
 
-def register(ipython=None):
-    """Register the exception handler with the given IPython instance."""
+def register(ipython=None, model=None):
+    """Register the exception handler with the given IPython instance.
+
+    `model` picks the model asked for suggestions (see `genai.models`).
+    """
+    global exception_model
+
     if ipython is None:
         ipython = get_ipython()
 
+    if model is not None:
+        exception_model = model
+
     ipython.set_custom_exc((Exception,), custom_exc)
+
+    if _on_pre_run_cell not in ipython.events.callbacks["pre_run_cell"]:
+        ipython.events.register("pre_run_cell", _on_pre_run_cell)
+
+
+def unregister(ipython) -> None:
+    """Stop listening for new cells, as set up by `register`."""
+    if _on_pre_run_cell in ipython.events.callbacks["pre_run_cell"]:
+        ipython.events.unregister("pre_run_cell", _on_pre_run_cell)
+
+
+def enable_background_suggestions(
+    max_pending: int = 4,
+    policy: QueuePolicy = QueuePolicy.QUEUE,
+    max_workers: int = 2,
+    cancel_stale: bool = False,
+) -> BackgroundWorker:
+    """Generate exception suggestions in the background instead of blocking the next cell.
+
+    The exception handler returns as soon as the traceback is shown, and the suggestion streams
+    into its display afterwards. Up to `max_workers` suggestions are generated at once (identical
+    ones share a single request). At most `max_pending` suggestions wait on top of those; `policy`
+    decides which ones are dropped when more errors come in (see `genai.worker.QueuePolicy`).
+
+    With `cancel_stale`, suggestions still in progress are cancelled when the next cell starts.
+    """
+    global worker, cancel_on_new_cell
+    worker = BackgroundWorker(max_pending=max_pending, policy=policy, max_workers=max_workers)
+    cancel_on_new_cell = cancel_stale
+    return worker
+
+
+def disable_background_suggestions() -> None:
+    """Go back to generating exception suggestions inline."""
+    global worker, cancel_on_new_cell
+    worker = None
+    cancel_on_new_cell = False
@@ -0,0 +1,258 @@
+"""
+Streaming suggestions into terminal IPython.
+
+Terminals can't update displays in place, so `GenaiMarkdown` can only show a finished response
+there. `TerminalMarkdown` writes deltas to stdout as they arrive instead. Output is flushed at the
+end of every line, and at most `max_updates_per_second` times a second within long lines, so the
+first tokens show up as soon as they would in a notebook.
+
+When stdout is a color terminal, headings, code blocks and inline code are highlighted as they
+stream by (see `MarkdownHighlighter`). Set `NO_COLOR` to turn highlighting off.
+
+`%%assist` and exception suggestions use it in `TerminalInteractiveShell` when stdout is a terminal.
+Set `genai.terminal.stream_in_terminal` to True or False to decide for yourself.
+"""
+import os
+import re
+import sys
+import time
+from typing import List, Optional, TextIO
+
+from genai.blocks import closes_fence, fence_of
+from genai.display import MAX_UPDATES_PER_SECOND, GenaiMarkdown, Stage
+
+# Whether to stream into the terminal: None to decide from the shell and stdout
+stream_in_terminal: Optional[bool] = None
+
+BOLD = "\x1b[1m"
+CODE = "\x1b[36m"
+FENCE = "\x1b[2m"
+RESET = "\x1b[0m"
+
+_HEADING = re.compile(r" {0,3}#{1,6}(\s|$)")
+
+
+def is_terminal() -> bool:
+    """Whether suggestions should be streamed with `TerminalMarkdown`."""
+    if stream_in_terminal is not None:
+        return stream_in_terminal
+
+    try:
+        from IPython import get_ipython
+    except ImportError:
+        return False
+
+    ipython = get_ipython()
+    if ipython is None or ipython.__class__.__name__ != "TerminalInteractiveShell":
+        return False
+    return _isatty(sys.stdout)
+
+
+def _isatty(stream: TextIO) -> bool:
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+
+def _use_color(stream: TextIO) -> bool:
+    return "NO_COLOR" not in os.environ and _isatty(stream)
+
+
+class MarkdownHighlighter:
+    """Adds ANSI styles to markdown as it streams in
+
+    Each line is styled by how it starts, so only the first few characters of a line are held
+    back, until it's clear whether they open a heading or a code fence.
+    """
+
+    def __init__(self) -> None:
+        # The start of the current line, until its style is known
+        self._undecided = ""
+        self._style: Optional[str] = None
+        # The current line, when it may open or close a code block
+        self._fence_line = ""
+        self._fence: Optional[str] = None
+        self._inline_code = False
+
+    def feed(self, text: str) -> str:
+        """Styled text for `text`, holding back the start of a line while it's ambiguous."""
+        out: List[str] = []
+        lines = text.split("\n")
+        for i, body in enumerate(lines):
+            ended = i < len(lines) - 1
+            if not body and not ended:
+                continue
+
+            if self._style is None:
+                self._undecided += body
+                if not ended and not self._decidable(self._undecided):
+                    continue
+                self._style = self._decide(self._undecided)
+                body, self._undecided = self._undecided, ""
+                out.append(self._style)
+
+            if self._style == FENCE:
+                self._fence_line += body
+            out.append(self._render(body))
+
+            if ended:
+                out.append(RESET + "\n")
+                self._end_line()
+        return "".join(out)
+
+    def finish(self) -> str:
+        """Whatever was held back, with styles reset."""
+        out = ""
+        if self._style is None and self._undecided:
+            self._style = self._decide(self._undecided)
+            out = self._style + self._render(self._undecided)
+            self._undecided = ""
+        if self._style is not None:
+            out += RESET
+        self._style = None
+        self._inline_code = False
+        return out
+
+    def _decidable(self, start: str) -> bool:
+        stripped = start.lstrip(" ")
+        if len(start) - len(stripped) > 3:
+            return True
+        if not stripped:
+            return False
+        if stripped[0] in "`~":
+            # Could still become a fence
+            return len(stripped) >= 3 or stripped != stripped[0] * len(stripped)
+        if self._fence is None and stripped[0] == "#":
+            # Could still become a heading
+            return stripped != "#" * len(stripped) or len(stripped) > 6
+        return True
+
+    def _decide(self, start: str) -> str:
+        line_fence = fence_of(start)
+        if self._fence is not None:
+            return FENCE if line_fence is not None and line_fence[0] == self._fence[0] else CODE
+        if line_fence is not None:
+            return FENCE
+        if _HEADING.match(start):
+            return BOLD
+        return ""
+
+    def _render(self, body: str) -> str:
+        if self._style != "" or "`" not in body:
+            return body
+
+        # Inline code, between backticks
+        out: List[str] = []
+        for i, part in enumerate(body.split("`")):
+            if i > 0:
+                self._inline_code = not self._inline_code
+                out.append(CODE + "`" if self._inline_code else "`" + RESET)
+            out.append(part)
+        return "".join(out)
+
+    def _end_line(self) -> None:
+        if self._style == FENCE:
+            line, line_fence = self._fence_line, fence_of(self._fence_line)
+            if self._fence is None:
+                self._fence = line_fence
+            elif line_fence is not None and closes_fence(self._fence, line_fence, line):
+                self._fence = None
+        self._fence_line = ""
+        self._style = None
+        self._inline_code = False
+
+
+class TerminalMarkdown(GenaiMarkdown):
+    """A `GenaiMarkdown` that streams into a terminal instead of updating displays
+
+    Text is only ever written once: appends are written as they arrive, and a new message that
+    extends the old one writes the difference. Any other new message starts on a new line.
+
+    Attributes:
+        stream (Optional[TextIO]): Where to write, `sys.stdout` at the time of writing if None
+        highlight (bool): Whether to style markdown with ANSI codes
+    """
+
+    def __init__(
+        self,
+        message: str = "",
+        stage: Optional[Stage] = None,
+        max_updates_per_second: Optional[float] = MAX_UPDATES_PER_SECOND,
+        stream: Optional[TextIO] = None,
+        highlight: Optional[bool] = None,
+    ) -> None:
+        super().__init__(message, stage, max_updates_per_second, segment_blocks=False)
+        self.stream = stream
+        self.highlight = _use_color(self._stream()) if highlight is None else highlight
+        self._highlighter = MarkdownHighlighter()
+        # Whether the last character written ended a line
+        self._at_line_start = True
+
+    def _stream(self) -> TextIO:
+        return self.stream if self.stream is not None else sys.stdout
+
+    def _write(self, text: str) -> None:
+        if not text:
+            return
+        self._at_line_start = text.endswith("\n")
+        if self.highlight:
+            text = self._highlighter.feed(text)
+        stream = self._stream()
+        stream.write(text)
+        if "\n" in text or self._update_due():
+            stream.flush()
+            self._last_update = time.monotonic()
+
+    def _end(self) -> None:
+        stream = self._stream()
+        if self.highlight:
+            stream.write(self._highlighter.finish())
+        if not self._at_line_start:
+            stream.write("\n")
+            self._at_line_start = True
+        stream.flush()
+
+    def display(self) -> None:
+        '''Start writing to the terminal, beginning with the message so far'''
+        self._displayed = True
+        self._write(self.message)
+
+    def append(self, delta: str) -> None:
+        self._chunks.append(delta)
+        if self._displayed:
+            self._write(delta)
+
+    def flush(self) -> None:
+        if self._displayed:
+            self._stream().flush()
+
+    def update_displays(self) -> None:
+        # Nothing to redraw, everything is written as it comes
+        self.flush()
+
+    @property
+    def message(self) -> str:
+        return super().message
+
+    @message.setter
+    def message(self, value: str) -> None:
+        previous = self.message
+        self._chunks = [value]
+        if not self._displayed:
+            return
+        if value.startswith(previous):
+            self._write(value[len(previous) :])
+            return
+        self._end()
+        self._write(value)
+
+    @property
+    def stage(self) -> Optional[Stage]:
+        return self._stage
+
+    @stage.setter
+    def stage(self, stage: Optional[Stage]) -> None:
+        self._stage = stage
+        if self._displayed and stage in (Stage.FINISHED, None):
+            self._end()
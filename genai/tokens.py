@@ -1,57 +1,289 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
 import tiktoken
 
-MAX_TOKENS = {
-    "gpt-3.5-turbo-0301": 2048,
-    "gpt-3.5-turbo": 2048,
-    "gpt-4": 8192,
-    "gpt-4-0314": 8192,
+from genai.models import MODELS, get_model
+
+# Context window of each known model. See `genai.models` for the full picture.
+MAX_TOKENS = {name: model.context_window for name, model in MODELS.items()}
+
+# Per-role caps on the size of a single context message. Messages over their cap are cut down to
+# their head and tail so that one huge output can't push every other message out of the window.
+MESSAGE_TOKEN_LIMITS = {
+    "user": 1024,  # code the user ran
+    "system": 512,  # outputs and errors
+    "assistant": 1024,  # past suggestions
 }
 
+# Placed where tokens were cut out of a message
+ELISION_MARKER = "\n...\n"
 
-# Copied from https://platform.openai.com/docs/guides/chat/introduction on 3/17/2023
-# Modified to support gpt-4 as a best guess
-def num_tokens_from_messages(messages, model="gpt-3.5-turbo-0301"):
-    """Returns the number of tokens used by a list of messages."""
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        encoding = tiktoken.get_encoding("cl100k_base")
-    if model == "gpt-3.5-turbo-0301":  # note: future models may deviate from this
-        num_tokens = 0
-        for message in messages:
-            num_tokens += 4  # every message follows <im_start>{role/name}\n{content}<im_end>\n
-            for key, value in message.items():
-                num_tokens += len(encoding.encode(value))
-                if key == "name":  # if there's a name, the role is omitted
-                    num_tokens += -1  # role is always required and always 1 token
-        num_tokens += 2  # every reply is primed with <im_start>assistant
-        return num_tokens
-    # TODO: Watch for when the new models are released and update this
-    if model == "gpt-3.5-turbo" or model == "gpt-4" or model == "gpt-4-0314":
-        num_tokens = 0
-        for message in messages:
-            num_tokens += 4  # every message follows <im_start>{role/name}\n{content}<im_end>\n
-            for key, value in message.items():
-                num_tokens += len(encoding.encode(value))
-                if key == "name":  # if there's a name, the role is omitted
-                    num_tokens += -1  # role is always required and always 1 token
-        num_tokens += 2  # every reply is primed with <im_start>assistant
+
+class TokenCountCache:
+    """A bounded LRU cache of token counts for individual strings.
+
+    Entries are keyed on the encoding name and a digest of the text, so the cache never holds on
+    to the (potentially large) contents of a message. `hits` and `misses` can be inspected to see
+    how effective the cache is.
+    """
+
+    def __init__(self, maxsize: int = 4096) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._counts: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, text: str, encoding: tiktoken.Encoding) -> int:
+        """Returns the number of tokens in `text`, encoding it only on a cache miss."""
+        key = self._key(text, encoding)
+        num_tokens = self._lookup(key)
+        if num_tokens is None:
+            num_tokens = len(encoding.encode(text))
+            self._store(key, num_tokens)
         return num_tokens
+
+    def get(self, text: str, encoding: tiktoken.Encoding) -> Optional[int]:
+        """Returns the cached number of tokens in `text`, or None without encoding it."""
+        return self._lookup(self._key(text, encoding))
+
+    def set(self, text: str, encoding: tiktoken.Encoding, num_tokens: int) -> None:
+        """Cache a count that was found by encoding `text` elsewhere."""
+        self._store(self._key(text, encoding), num_tokens)
+
+    def _key(self, text: str, encoding: tiktoken.Encoding) -> Tuple[str, bytes]:
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        return (encoding.name, digest)
+
+    def _lookup(self, key: Tuple[str, bytes]) -> Optional[int]:
+        with self._lock:
+            num_tokens = self._counts.get(key)
+            if num_tokens is not None:
+                self._counts.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return num_tokens
+
+    def _store(self, key: Tuple[str, bytes], num_tokens: int) -> None:
+        with self._lock:
+            self._counts[key] = num_tokens
+            while len(self._counts) > self.maxsize:
+                self._counts.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop all cached counts and reset the hit/miss counters."""
+        with self._lock:
+            self._counts.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+
+token_count_cache = TokenCountCache()
+
+
+def num_tokens_from_string(text: str, encoding: tiktoken.Encoding) -> int:
+    """Returns the number of tokens in a single string, using the shared token count cache."""
+    return token_count_cache.count(text, encoding)
+
+
+def num_tokens_from_message(message, model: str = "gpt-3.5-turbo-0301") -> int:
+    """Returns the number of tokens used by a single message, excluding the reply priming."""
+    info = get_model(model)
+    encoding = encoding_for_model(model)
+
+    num_tokens = info.tokens_per_message
+    for key, value in message.items():
+        num_tokens += num_tokens_from_string(value, encoding)
+        if key == "name":
+            num_tokens += info.tokens_per_name
+    return num_tokens
+
+
+_max_token_bytes: Dict[str, Optional[int]] = {}
+
+
+def max_token_bytes(encoding: tiktoken.Encoding) -> Optional[int]:
+    """The length in bytes of the longest token of `encoding`, or None if it can't be told.
+
+    Computed once per encoding, from its vocabulary.
+    """
+    if encoding.name in _max_token_bytes:
+        return _max_token_bytes[encoding.name]
+
+    token_byte_values = getattr(encoding, "token_byte_values", None)
+    if token_byte_values is not None:
+        values: Iterable[bytes] = token_byte_values()
     else:
-        raise NotImplementedError(
-            f"""num_tokens_from_messages() is not presently implemented for model {model}.
-  See https://github.com/openai/openai-python/blob/main/chatml.md for information on how messages are converted to tokens."""  # noqa: E501
-        )
+        # tiktoken before 0.4 only has the ranks
+        values = getattr(encoding, "_mergeable_ranks", {})
+    longest = max((len(value) for value in values), default=None)
+
+    _max_token_bytes[encoding.name] = longest
+    return longest
+
+
+def num_tokens_bounds(text: str, encoding: tiktoken.Encoding) -> Tuple[int, int]:
+    """Cheap (lower, upper) bounds on the number of tokens `encoding` splits `text` into.
+
+    Both bounds always hold. Every token covers at least one UTF-8 byte, and a character is at
+    most four bytes. No token covers more bytes than the longest in the encoding's vocabulary, and
+    a character is at least one byte. When the longest token isn't known, the lower bound is 0.
+    """
+    n = len(text)
+    upper = n if text.isascii() else 4 * n
+    longest = max_token_bytes(encoding)
+    lower = -(-n // longest) if longest else 0
+    return lower, upper
+
+
+def truncate_text(text: str, max_tokens: int, encoding: tiktoken.Encoding) -> str:
+    """Cut `text` down to about `max_tokens` tokens, keeping its head and tail.
+
+    The removed middle is replaced with `ELISION_MARKER`. Text already within the limit is
+    returned unchanged, without being encoded again if its count is cached. Otherwise the text is
+    encoded once, and the head and tail are cut from those same tokens.
+
+    Text far longer than the limit is first cut by characters so that only its head and tail are
+    ever encoded.
+    """
+    lower, upper = num_tokens_bounds(text, encoding)
+    if upper <= max_tokens:
+        return text
+
+    # The first and last `window` characters hold at least `max_tokens` tokens each
+    longest = max_token_bytes(encoding)
+    window = max_tokens * longest if longest else len(text)
+    cut = len(text) > 2 * window
+    if cut:
+        # The middle gets cut regardless, so there's no need to encode it
+        text = text[:window] + text[-window:]
+    else:
+        num_tokens = token_count_cache.get(text, encoding)
+        if num_tokens is not None and num_tokens <= max_tokens:
+            return text
+
+    tokens = encoding.encode(text)
+    if not cut:
+        token_count_cache.set(text, encoding, len(tokens))
+        if len(tokens) <= max_tokens:
+            return text
+
+    keep = max(max_tokens - num_tokens_from_string(ELISION_MARKER, encoding), 0)
+    head = (keep + 1) // 2
+    tail = keep - head
+
+    # Token boundaries can fall inside a character, so drop the partial characters at the cuts
+    head_text = encoding.decode_bytes(tokens[:head]).decode("utf-8", errors="ignore")
+    tail_text = (
+        encoding.decode_bytes(tokens[-tail:]).decode("utf-8", errors="ignore") if tail else ""
+    )
+    return head_text + ELISION_MARKER + tail_text
+
+
+def truncate_message(message, max_tokens: int, encoding: tiktoken.Encoding):
+    """Returns a copy of `message` with its content cut down to about `max_tokens` tokens."""
+    return {**message, "content": truncate_text(message["content"], max_tokens, encoding)}
+
+
+_encodings: Dict[str, tiktoken.Encoding] = {}
+_encodings_lock = threading.Lock()
+
+
+def encoding_for_model(model: str) -> tiktoken.Encoding:
+    """Returns the tiktoken encoding for a model, as listed in `genai.models`.
+
+    Encodings are resolved once per model and kept for the lifetime of the process. The first
+    resolution loads the BPE ranks from disk (or the network), which is why the extension warms
+    them up in the background with `prewarm_encodings`.
+    """
+    encoding = _encodings.get(model)
+    if encoding is not None:
+        return encoding
+
+    with _encodings_lock:
+        # Another thread (likely the prewarmer) may have finished loading while we waited
+        encoding = _encodings.get(model)
+        if encoding is None:
+            encoding = tiktoken.get_encoding(get_model(model).encoding)
+            _encodings[model] = encoding
+    return encoding
+
+
+def prewarm_encodings(
+    models: Optional[Iterable[str]] = None, background: bool = True
+) -> Optional[threading.Thread]:
+    """Load the encodings for `models` (all models in `genai.models` by default) ahead of first use.
+
+    When `background` is set, loading happens on a daemon thread, which is returned. Failures are
+    ignored here; they will surface again on first real use.
+    """
+    models = list(MODELS if models is None else models)
+
+    def warm():
+        for model in models:
+            try:
+                encoding_for_model(model)
+            except Exception:
+                pass
+
+    if not background:
+        warm()
+        return None
+
+    thread = threading.Thread(target=warm, name="genai-prewarm-encodings", daemon=True)
+    thread.start()
+    return thread
+
+
+# Adapted from https://platform.openai.com/docs/guides/chat/introduction on 3/17/2023
+# Per-model overheads live in `genai.models`
+def num_tokens_from_messages(messages, model="gpt-3.5-turbo-0301"):
+    """Returns the number of tokens used by a list of messages."""
+    num_tokens = 0
+    for message in messages:
+        num_tokens += num_tokens_from_message(message, model=model)
+    num_tokens += get_model(model).reply_priming
+    return num_tokens
+
+
+def context_token_budget(model: str, messages=()) -> int:
+    """Tokens left for context once `messages` are in the prompt and the reply is reserved.
+
+    `messages` are the parts of the prompt that always get sent, like the system prompt and the
+    user's request. The result can be passed as `max_tokens` to `trim_messages_to_fit_token_limit`
+    or `genai.context.build_context`.
+    """
+    info = get_model(model)
+    fixed = sum(num_tokens_from_message(message, model=model) for message in messages)
+    return info.prompt_budget - fixed
 
 
 def trim_messages_to_fit_token_limit(messages, model="gpt-3.5-turbo-0301", max_tokens=None):
-    """Reduce the number of messages until they are below the max token limit."""
-    num_tokens = num_tokens_from_messages(messages, model=model)
+    """Reduce the number of messages until they are below the max token limit.
 
+    Messages are dropped from the front of the list (oldest first). Each message is only counted
+    once: the running total is decreased by the cost of each dropped message rather than
+    recounting the remaining messages. `max_tokens` defaults to the model's prompt budget.
+    """
     if max_tokens is None:
-        max_tokens = MAX_TOKENS[model]
+        max_tokens = get_model(model).prompt_budget
+
+    costs = [num_tokens_from_message(message, model=model) for message in messages]
+
+    # The empty list still costs the reply priming
+    num_tokens = num_tokens_from_messages([], model=model) + sum(costs)
+
+    cut = 0
+    while num_tokens > max_tokens and cut < len(costs):
+        num_tokens -= costs[cut]
+        cut += 1
 
-    while num_tokens > max_tokens:
-        messages.pop(0)
-        num_tokens = num_tokens_from_messages(messages, model=model)
+    del messages[:cut]
     return messages
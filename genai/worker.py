@@ -0,0 +1,116 @@
+"""
+A background worker for streaming suggestions without holding up the kernel.
+
+Jobs start in the order they were submitted, on up to `max_workers` daemon threads. The queue of
+jobs waiting to run is bounded; what happens when more arrive is decided by the `QueuePolicy`.
+"""
+import contextvars
+import threading
+from collections import deque
+from enum import Enum
+from typing import Callable, Deque, List, NamedTuple, Optional
+
+
+class QueuePolicy(str, Enum):
+    """What to do with waiting jobs when a new one is submitted"""
+
+    # Run jobs in order. When the queue is full, drop the oldest waiting job.
+    QUEUE = "queue"
+    # Only the newest job matters. Drop every job that is still waiting.
+    LATEST = "latest"
+
+
+class _Job(NamedTuple):
+    run: Callable[[], None]
+    on_drop: Optional[Callable[[], None]]
+    # The context of the submitter, so display messages are attributed to the right cell
+    context: contextvars.Context
+
+
+class BackgroundWorker:
+    """Runs submitted jobs on daemon threads
+
+    Attributes:
+        max_pending (int): How many jobs may wait while others run
+        policy (QueuePolicy): What to do with waiting jobs when a new one is submitted
+        max_workers (int): How many jobs may run at once
+    """
+
+    def __init__(
+        self,
+        max_pending: int = 4,
+        policy: QueuePolicy = QueuePolicy.QUEUE,
+        max_workers: int = 1,
+    ) -> None:
+        self.max_pending = max_pending
+        self.policy = QueuePolicy(policy)
+        self.max_workers = max_workers
+        self._pending: Deque[_Job] = deque()
+        self._running = 0
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+
+    def submit(self, run: Callable[[], None], on_drop: Optional[Callable[[], None]] = None) -> None:
+        """Queue `run` to be called in the background.
+
+        If the job is dropped before it gets to run, `on_drop` is called instead.
+        """
+        job = _Job(run, on_drop, contextvars.copy_context())
+        dropped: List[_Job] = []
+
+        with self._condition:
+            if self.policy == QueuePolicy.LATEST:
+                dropped.extend(self._pending)
+                self._pending.clear()
+            while self._pending and len(self._pending) >= self.max_pending:
+                dropped.append(self._pending.popleft())
+
+            self._pending.append(job)
+
+            idle = len(self._threads) - self._running
+            if idle < len(self._pending) and len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._work, name="genai-suggestions", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._condition.notify_all()
+
+        for job in dropped:
+            if job.on_drop is not None:
+                job.context.run(job.on_drop)
+
+    def _work(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                job = self._pending.popleft()
+                self._running += 1
+
+            try:
+                job.context.run(job.run)
+            except Exception:
+                # Jobs are expected to report their own errors
+                pass
+            finally:
+                with self._condition:
+                    self._running -= 1
+                    self._condition.notify_all()
+
+    @property
+    def pending(self) -> int:
+        """The number of jobs waiting to run"""
+        with self._condition:
+            return len(self._pending)
+
+    @property
+    def busy(self) -> bool:
+        """Whether a job is running or waiting to run"""
+        with self._condition:
+            return bool(self._running or self._pending)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every submitted job has finished. Returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._running and not self._pending, timeout=timeout
+            )
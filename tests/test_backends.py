@@ -0,0 +1,65 @@
+import time
+from unittest import mock
+
+from genai import generate
+from genai.backends import FakeBackend, split_deltas
+
+
+def test_split_deltas_joins_back():
+    text = "  Try this:\n\n```python\ndf.head()\n```\n"
+
+    assert "".join(split_deltas(text)) == text
+    assert split_deltas("Hello world!") == ["Hello ", "world!"]
+
+
+def test_fake_backend_streams_deltas():
+    backend = FakeBackend(["Here's", " Something"])
+    messages = [{"role": "user", "content": "hello"}]
+
+    assert list(backend.create("gpt-4", messages, stream=True)) == ["Here's", " Something"]
+    assert list(backend.create("gpt-4", messages, stream=False)) == ["Here's Something"]
+    assert backend.requests == [messages, messages]
+
+
+def test_fake_backend_latencies():
+    backend = FakeBackend(["a", "b", "c"], time_to_first_token=0.05, inter_token_delay=0.01)
+
+    start = time.perf_counter()
+    response = backend.create("gpt-4", [], stream=True)
+    next(response)
+    first = time.perf_counter() - start
+    list(response)
+    total = time.perf_counter() - start
+
+    assert first >= 0.05
+    assert total >= 0.07
+
+
+async def test_fake_backend_streams_asynchronously():
+    backend = FakeBackend("Hello world!", inter_token_delay=0.001)
+
+    response = await backend.acreate("gpt-4", [], stream=True)
+
+    assert [delta async for delta in response] == ["Hello ", "world!"]
+
+
+def test_generate_uses_the_backend():
+    backend = FakeBackend("Hello world!")
+
+    with mock.patch.object(generate, "backend", backend), mock.patch(
+        "openai.ChatCompletion.create", autospec=True
+    ) as create:
+        response = generate.generate_next_from_history([], "hi", stream=True)
+
+        assert list(response) == ["Hello ", "world!"]
+
+    create.assert_not_called()
+    assert backend.requests[0][-1] == {"role": "user", "content": "hi"}
+
+
+def test_use_backend():
+    backend = FakeBackend()
+
+    with mock.patch.object(generate, "backend", generate.backend):
+        assert generate.use_backend(backend) is generate.backend is backend
+        assert isinstance(generate.use_backend(), generate.OpenAIBackend)
@@ -0,0 +1,119 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from genai import generate
+from genai.backends import FakeBackend
+from genai.batch import batch_assist
+
+
+class ConcurrencyTrackingBackend(FakeBackend):
+    """A fake backend that records how many requests were streaming at once"""
+
+    def __init__(self, *args, fail_on=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail_on = fail_on
+        self.active = 0
+        self.max_active = 0
+        self._active_lock = threading.Lock()
+
+    def create(self, model, messages, stream):
+        if messages[-1]["content"] == self.fail_on:
+            raise RuntimeError("the API is down")
+
+        with self._active_lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+        deltas = super().create(model, messages, stream)
+
+        def tracked():
+            try:
+                yield from deltas
+            finally:
+                with self._active_lock:
+                    self.active -= 1
+
+        return tracked()
+
+
+@pytest.fixture
+def backend():
+    backend = ConcurrencyTrackingBackend("Use pandas.", time_to_first_token=0.02)
+    with mock.patch.object(generate, "backend", backend):
+        yield backend
+
+
+def test_batch_assist_runs_every_job(backend):
+    jobs = [([], f"question {i}") for i in range(10)]
+
+    results = list(batch_assist(jobs, concurrency=3))
+
+    assert sorted(result.index for result in results) == list(range(10))
+    assert len(backend.requests) == 10
+    assert 1 < backend.max_active <= 3
+
+    for result in results:
+        assert result.ok
+        assert result.text == "Use pandas."
+        assert result.prompt == f"question {result.index}"
+        assert result.time_to_first_token >= 0.02
+        assert result.latency >= result.time_to_first_token
+        assert result.prompt_tokens > 0
+        assert result.completion_tokens > 0
+
+
+def test_batch_assist_reports_failed_jobs(backend):
+    backend.fail_on = "question 1"
+    jobs = [([], f"question {i}") for i in range(3)]
+
+    results = {result.index: result for result in batch_assist(jobs)}
+
+    assert not results[1].ok
+    assert str(results[1].error) == "the API is down"
+    assert results[0].ok and results[2].ok
+
+
+def test_batch_assist_takes_jobs_lazily(backend):
+    taken = []
+
+    def jobs():
+        for i in range(100):
+            taken.append(i)
+            yield [], f"question {i}"
+
+    results = batch_assist(jobs(), concurrency=2)
+    next(results)
+    results.close()
+
+    # Only enough to keep two running (and replace the one that finished)
+    assert len(taken) <= 3
+
+
+def test_batch_assist_reports_failed_token_counts(backend):
+    jobs = [([], f"question {i}") for i in range(3)]
+
+    with mock.patch("genai.batch.num_tokens_from_string", side_effect=ValueError("no encoding")):
+        results = list(batch_assist(jobs))
+
+    assert len(results) == 3
+    for result in results:
+        assert result.text == "Use pandas."
+        assert str(result.error) == "no encoding"
+
+
+def test_batch_assist_still_generates_when_prompt_tokens_cannot_be_counted(backend):
+    def slow_failure(messages, model):
+        time.sleep(0.2)
+        raise ValueError("no encoding")
+
+    with mock.patch("genai.batch.num_tokens_from_messages", side_effect=slow_failure):
+        [result] = batch_assist([([], "question")])
+
+    assert result.text == "Use pandas."
+    assert str(result.error) == "no encoding"
+    assert len(backend.requests) == 1
+    # Timed from sending the request, not from counting its tokens
+    assert result.latency < 0.2
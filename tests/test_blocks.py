@@ -0,0 +1,31 @@
+import pytest
+
+from genai.blocks import split_blocks
+
+
+@pytest.mark.parametrize(
+    "text,blocks,trailing",
+    [
+        ("", [], ""),
+        ("Hello", [], "Hello"),
+        ("Hello\nworld\n", [], "Hello\nworld\n"),
+        ("Hello\n\nworld", ["Hello\n\n"], "world"),
+        # Paragraphs end at a code block even without a blank line
+        ("Try:\n```python\ndf.head()\n```\n", ["Try:\n", "```python\ndf.head()\n```\n"], ""),
+        # Until the closing fence arrives, the code block may still change
+        ("```python\ndf.head()\n\ndf.tail()\n", [], "```python\ndf.head()\n\ndf.tail()\n"),
+        ("```python\ndf.head()\n```", [], "```python\ndf.head()\n```"),
+        # Fences only close fences like them, at least as long
+        ("````\n```\n````\nAfter", ["````\n```\n````\n"], "After"),
+        ("~~~\n```\n~~~\n", ["~~~\n```\n~~~\n"], ""),
+        # A fence with an info string doesn't close anything
+        ("```\na\n```python\nb\n```\n", ["```\na\n```python\nb\n```\n"], ""),
+        # Indented fences are code
+        ("    ```\nx\n\n", ["    ```\nx\n\n"], ""),
+        # Extra blank lines go along with the next block
+        ("a\n\n\n\nb\n\n", ["a\n\n", "\n\nb\n\n"], ""),
+    ],
+)
+def test_split_blocks(text, blocks, trailing):
+    assert split_blocks(text) == (blocks, trailing)
+    assert "".join(blocks) + trailing == text
@@ -0,0 +1,70 @@
+from unittest import mock
+
+from genai.cache import ResponseCache, cache_key
+
+
+def test_cache_key_is_canonical():
+    messages = [{"role": "user", "content": "hi"}]
+
+    assert cache_key("gpt-4", messages) == cache_key(
+        "gpt-4", [{"content": "hi", "role": "user"}], stream=True
+    )
+    assert cache_key("gpt-4", messages) != cache_key("gpt-3.5-turbo", messages)
+    assert cache_key("gpt-4", messages) != cache_key("gpt-4", messages, temperature=0)
+
+
+def test_response_cache_get_and_set(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.sqlite3")
+
+    assert cache.get("key") is None
+
+    cache.set("key", ["Here's", " something"])
+    assert cache.get("key") == ["Here's", " something"]
+    assert len(cache) == 1
+
+    cache.clear()
+    assert cache.get("key") is None
+
+
+def test_response_cache_persists(tmp_path):
+    path = tmp_path / "nested" / "responses.sqlite3"
+
+    cache = ResponseCache(path)
+    cache.set("key", ["persisted"])
+    cache.close()
+
+    assert ResponseCache(path).get("key") == ["persisted"]
+
+
+@mock.patch("genai.cache.time")
+def test_response_cache_ttl(time):
+    cache = ResponseCache(":memory:", ttl=60)
+
+    time.time.return_value = 1000
+    cache.set("key", ["fresh"])
+
+    time.time.return_value = 1059
+    assert cache.get("key") == ["fresh"]
+
+    time.time.return_value = 1061
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+@mock.patch("genai.cache.time")
+def test_response_cache_evicts_least_recently_used(time):
+    # Each entry below serializes to 9 bytes, e.g. `["aaaa"]`
+    cache = ResponseCache(":memory:", max_bytes=20)
+
+    time.time.return_value = 1
+    cache.set("a", ["aaaa"])
+    time.time.return_value = 2
+    cache.set("b", ["bbbb"])
+    time.time.return_value = 3
+    cache.get("a")
+    time.time.return_value = 4
+    cache.set("c", ["cccc"])
+
+    assert cache.get("a") == ["aaaa"]
+    assert cache.get("b") is None
+    assert cache.get("c") == ["cccc"]
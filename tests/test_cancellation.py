@@ -0,0 +1,58 @@
+from unittest import mock
+
+import pytest
+
+from genai.cancellation import CancellationToken, GenerationCancelled
+
+
+def test_cancel_calls_callbacks_once():
+    token = CancellationToken()
+    callback = mock.Mock()
+
+    token.on_cancel(callback)
+    token.cancel()
+    token.cancel()
+
+    assert token.cancelled
+    callback.assert_called_once_with()
+
+
+def test_on_cancel_after_cancelling_calls_right_away():
+    token = CancellationToken()
+    token.cancel()
+    callback = mock.Mock()
+
+    token.on_cancel(callback)
+
+    callback.assert_called_once_with()
+
+
+def test_unregistered_callbacks_are_not_called():
+    token = CancellationToken()
+    callback = mock.Mock()
+
+    unregister = token.on_cancel(callback)
+    unregister()
+    token.cancel()
+
+    callback.assert_not_called()
+
+
+def test_failing_callbacks_do_not_stop_cancellation():
+    token = CancellationToken()
+    after = mock.Mock()
+
+    token.on_cancel(mock.Mock(side_effect=RuntimeError("already closed")))
+    token.on_cancel(after)
+    token.cancel()
+
+    after.assert_called_once_with()
+
+
+def test_raise_if_cancelled():
+    token = CancellationToken()
+    token.raise_if_cancelled()
+
+    token.cancel()
+    with pytest.raises(GenerationCancelled):
+        token.raise_if_cancelled()
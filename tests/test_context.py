@@ -1,3 +1,4 @@
+from unittest import mock
 from unittest.mock import patch
 
 import pandas as pd
@@ -12,6 +13,13 @@ from genai.context import (
     summarize_dataframe,
 )
 from genai.display import GenaiMarkdown
+from genai.tokens import (
+    ELISION_MARKER,
+    encoding_for_model,
+    num_tokens_from_messages,
+    num_tokens_from_string,
+    trim_messages_to_fit_token_limit,
+)
 
 
 def test_past_errors():
@@ -93,6 +101,63 @@ def test_build_context_no_output(ip):
     assert context.messages[0] == {"content": "a = 1", "role": "user"}
 
 
+def test_build_context_with_token_budget(ip):
+    for i in range(10):
+        ip.run_cell(f"x = {i}", store_history=True)
+        ip.run_cell(f"'output number {i}'", store_history=True)
+
+    full = build_context(ip.history_manager).messages
+    budget = num_tokens_from_messages(full) // 3
+
+    context = build_context(ip.history_manager, max_tokens=budget)
+
+    assert context.messages == trim_messages_to_fit_token_limit(list(full), max_tokens=budget)
+    assert 0 < len(context.messages) < len(full)
+    assert context.messages[-1] == {"content": "'output number 9'", "role": "system"}
+
+
+def test_build_context_with_token_budget_skips_old_outputs(ip):
+    for i in range(10):
+        ip.run_cell(f"{i} * 100", store_history=True)
+
+    with mock.patch("genai.context.repr_genai", wraps=repr_genai) as wrapped_repr_genai:
+        context = build_context(ip.history_manager, max_tokens=40)
+
+    # Only outputs near the end of the history are summarized
+    assert wrapped_repr_genai.call_count < 10
+    assert context.messages[-1] == {"content": "900", "role": "system"}
+
+
+def test_build_context_with_message_token_limits(ip):
+    ip.run_cell("x = 1", store_history=True)
+    ip.run_cell("list(range(10_000))", store_history=True)
+
+    context = build_context(ip.history_manager, message_token_limits={"system": 50})
+
+    assert len(context.messages) == 3
+    assert context.messages[0] == {"content": "x = 1", "role": "user"}
+    assert context.messages[1] == {"content": "list(range(10_000))", "role": "user"}
+
+    output = context.messages[2]["content"]
+    assert output.startswith("[0, 1, 2")
+    assert ELISION_MARKER in output
+    assert output.endswith("9998, 9999]")
+    # Re-encoding across the cut points can shift the count by a token or two
+    assert num_tokens_from_string(output, encoding_for_model("gpt-3.5-turbo-0301")) <= 55
+
+
+def test_build_context_with_token_budget_rejects_huge_outputs(ip):
+    ip.run_cell("x = 1", store_history=True)
+    ip.run_cell("'x' * 1_000_000", store_history=True)
+
+    with mock.patch("genai.context.num_tokens_from_message") as num_tokens_from_message:
+        context = build_context(ip.history_manager, max_tokens=1000)
+
+    # The output can't possibly fit, so it is never encoded and history stops there
+    num_tokens_from_message.assert_not_called()
+    assert context.messages == []
+
+
 @pytest.mark.parametrize("patched_dataframe_sample", [1], indirect=True)
 def test_build_context_pandas_dataframe(ip, patched_dataframe_sample):
     # Test build_context with pandas DataFrame
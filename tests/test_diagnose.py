@@ -0,0 +1,102 @@
+import sys
+import types
+from unittest import mock
+
+from genai import diagnose as diagnose_module
+from genai.diagnose import CONFIDENT, close_matches, diagnose
+
+
+def capture(code, namespace=None):
+    try:
+        exec(code, {} if namespace is None else namespace)
+    except Exception:
+        return sys.exc_info()
+    raise AssertionError("expected an exception")
+
+
+def test_close_matches():
+    assert close_matches("lenght", ["length", "width", "weight"])[0] == "length"
+    # Private names are only matched by private names
+    assert close_matches("counter", ["_counter"]) == []
+    assert close_matches("_countr", ["_counter"]) == ["_counter"]
+
+
+def test_name_error_matches_user_namespace():
+    diagnosis = diagnose(*capture("dataframe.head()"), user_ns={"data_frame": object()})
+
+    assert diagnosis is not None
+    assert diagnosis.matches[0] == "data_frame"
+    assert diagnosis.markdown.startswith("`dataframe` isn't defined. Did you mean `data_frame`?")
+    assert diagnosis.confidence >= CONFIDENT
+
+
+def test_name_error_matches_names_in_scope():
+    diagnosis = diagnose(*capture("pirnt('hello')"))
+
+    assert diagnosis is not None
+    assert diagnosis.matches[0] == "print"
+
+    # Locals of the function that raised count too
+    code = "def f():\n    total_count = 1\n    return total_cont\nf()"
+    diagnosis = diagnose(*capture(code))
+    assert diagnosis is not None
+    assert diagnosis.matches == ["total_count"]
+
+
+def test_name_error_for_common_imports():
+    with mock.patch.object(diagnose_module, "installed_modules", return_value={"numpy"}):
+        diagnosis = diagnose(*capture("np.zeros(3)"))
+
+    assert diagnosis is not None
+    assert diagnosis.markdown == "`np` isn't defined. Did you forget to run `import numpy as np`?"
+    assert diagnosis.confidence == 1.0
+
+
+def test_name_error_without_matches():
+    assert diagnose(*capture("zqxjv")) is None
+
+
+def test_unbound_local_is_not_a_typo():
+    code = "def f():\n    if False:\n        value = 1\n    return value\nf()"
+    assert diagnose(*capture(code)) is None
+
+
+def test_module_not_found():
+    with mock.patch.object(
+        diagnose_module, "installed_modules", return_value=frozenset({"pandas", "numpy"})
+    ):
+        diagnosis = diagnose(*capture("import pnadas"))
+
+    assert diagnosis is not None
+    assert diagnosis.markdown == "There's no module named `pnadas`. Did you mean `pandas`?"
+
+
+def test_module_not_found_in_imported_package():
+    diagnosis = diagnose(*capture("import json.decodr"))
+
+    assert diagnosis is not None
+    assert diagnosis.matches[0] == "json.decoder"
+
+
+def test_attribute_error_matches_attributes():
+    diagnosis = diagnose(*capture("'text'.uper()"))
+
+    assert diagnosis is not None
+    assert diagnosis.matches[0] == "upper"
+    assert diagnosis.markdown.startswith("`str` has no attribute `uper`. Did you mean `upper`?")
+
+
+def test_attribute_error_on_module():
+    namespace = {"fake": types.ModuleType("fake")}
+    namespace["fake"].read_csv = lambda: None
+
+    with mock.patch.dict(sys.modules, {"fake": namespace["fake"]}):
+        diagnosis = diagnose(*capture("fake.read_cvs()", namespace))
+
+    assert diagnosis is not None
+    assert diagnosis.markdown == "`fake` has no attribute `read_cvs`. Did you mean `read_csv`?"
+
+
+def test_other_errors_are_left_to_the_model():
+    assert diagnose(*capture("1 / 0")) is None
+    assert diagnose(*capture("raise ValueError('pirnt')")) is None
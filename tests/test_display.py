@@ -3,6 +3,7 @@ from unittest import mock
 import pytest
 from IPython.core import display_functions
 
+from genai.cancellation import CancellationToken
 from genai.display import GenaiMarkdown, Stage
 
 
@@ -39,6 +40,55 @@ def test_genai_markdown_consume(ip):
     assert markdown.message == "Hello world!"
 
 
+async def test_genai_markdown_aconsume(ip):
+    markdown = GenaiMarkdown(message="Hello")
+
+    async def text_generator():
+        yield " world"
+        yield "!"
+
+    await markdown.aconsume(text_generator())
+
+    assert markdown.message == "Hello world!"
+
+
+def test_genai_markdown_consume_stops_when_cancelled(ip):
+    markdown = GenaiMarkdown(message="Hello")
+    cancel = CancellationToken()
+    closed = []
+
+    def text_generator():
+        try:
+            yield " world"
+            cancel.cancel()
+            yield "!"
+            yield "!"
+        finally:
+            closed.append(True)
+
+    markdown.consume(text_generator(), cancel=cancel)
+
+    assert markdown.message == "Hello world"
+    assert closed == [True]
+
+
+def test_genai_markdown_consume_closes_the_generator_on_interrupt(ip):
+    markdown = GenaiMarkdown()
+    closed = []
+
+    def text_generator():
+        try:
+            yield "Hello"
+            raise KeyboardInterrupt()
+        finally:
+            closed.append(True)
+
+    with pytest.raises(KeyboardInterrupt):
+        markdown.consume(text_generator())
+
+    assert closed == [True]
+
+
 def test_genai_markdown_display(ip):
     markdown = GenaiMarkdown(message="Hello world!")
 
@@ -89,3 +139,149 @@ def test_genai_markdown_stage_setter(ip):
     markdown.stage = Stage.GENERATING
 
     assert markdown.stage == Stage.GENERATING
+
+
+def test_genai_markdown_append_throttles_updates(ip):
+    markdown = GenaiMarkdown(max_updates_per_second=4)
+    now = [100.0]
+
+    with mock.patch("genai.display.time.monotonic", side_effect=lambda: now[0]), mock.patch.object(
+        display_functions, 'display'
+    ) as mock_display:
+        # The first delta shows up right away
+        markdown.append("a")
+        assert mock_display.call_count == 1
+
+        # Deltas within the next quarter of a second are held back
+        now[0] += 0.125
+        markdown.append("b")
+        markdown.append("c")
+        assert mock_display.call_count == 1
+
+        # And come through together with the next one after that
+        now[0] += 0.125
+        markdown.append("d")
+        assert mock_display.call_count == 2
+
+        markdown.append("e")
+        markdown.flush()
+        assert mock_display.call_count == 3
+
+        # Nothing left to show
+        markdown.flush()
+        assert mock_display.call_count == 3
+
+    assert markdown.message == "abcde"
+
+
+def test_genai_markdown_consume_coalesces_updates(ip):
+    markdown = GenaiMarkdown(message="Hello")
+
+    with mock.patch.object(display_functions, 'display') as mock_display:
+        markdown.consume(iter(["!"] * 1000))
+
+    # The first delta and the flush at the end, instead of one update per delta
+    assert mock_display.call_count == 2
+    assert markdown.message == "Hello" + "!" * 1000
+    assert mock_display.call_args_list[-1] == mock.call(
+        markdown, display_id=markdown._display_id, update=True
+    )
+
+
+def test_genai_markdown_stage_change_flushes(ip):
+    markdown = GenaiMarkdown()
+
+    with mock.patch.object(display_functions, 'display') as mock_display:
+        markdown.append("Hello")
+        markdown.append(" world!")
+        assert mock_display.call_count == 1
+
+        markdown.stage = Stage.FINISHED
+        assert mock_display.call_count == 2
+        assert not markdown._pending
+
+
+def test_genai_markdown_without_throttling(ip):
+    markdown = GenaiMarkdown(max_updates_per_second=None)
+
+    with mock.patch.object(display_functions, 'display') as mock_display:
+        markdown.consume(iter(["a", "b", "c"]))
+
+    assert mock_display.call_count == 3
+
+
+def test_genai_markdown_joins_appends_lazily(ip):
+    markdown = GenaiMarkdown(message="Hello", max_updates_per_second=None)
+
+    with mock.patch.object(display_functions, 'display'):
+        for delta in [",", " ", "world", "!"]:
+            markdown.append(delta)
+        assert len(markdown._chunks) == 5
+
+        assert markdown.message == "Hello, world!"
+        assert markdown._repr_markdown_() == "Hello, world!"
+        assert markdown._chunks == ["Hello, world!"]
+
+        markdown.append(" Again")
+        assert markdown.message == "Hello, world! Again"
+
+        markdown.message = "Reset"
+        markdown.append("!")
+        assert markdown.message == "Reset!"
+
+
+def segments(mock_display):
+    """The markdown of each output, in order, after replaying the display calls"""
+    outputs = {}
+    for call in mock_display.call_args_list:
+        segment = call.args[0]
+        outputs[call.kwargs["display_id"]] = segment._repr_markdown_()
+    return list(outputs.values())
+
+
+def test_genai_markdown_segments_complete_blocks(ip):
+    markdown = GenaiMarkdown(max_updates_per_second=None, segment_blocks=True)
+    deltas = ["Try", " this:\n", "\n```", "python\n", "df.head()\n", "```\n", "Then", " run it"]
+
+    with mock.patch.object(display_functions, 'display') as mock_display:
+        markdown.display()
+        markdown.consume(iter(deltas))
+        markdown.stage = Stage.FINISHED
+
+    assert markdown.message == "".join(deltas)
+    assert segments(mock_display) == [
+        "Try this:\n\n",
+        "```python\ndf.head()\n```\n",
+        ("Then run it", {"genai": {"stage": Stage.FINISHED}}),
+    ]
+
+    # Complete blocks are shown once and never updated
+    shown = [call.args[0].text for call in mock_display.call_args_list]
+    assert shown.count("Try this:\n\n") == 1
+    assert shown.count("```python\ndf.head()\n```\n") == 1
+    assert markdown._segment_ids[0] == markdown._display_id
+
+
+def test_genai_markdown_segments_replaced_message(ip):
+    markdown = GenaiMarkdown(message="Thinking", max_updates_per_second=None, segment_blocks=True)
+
+    with mock.patch.object(display_functions, 'display') as mock_display:
+        markdown.display()
+        markdown.consume(iter(["\n\nMore", "\n\nAnd more"]))
+        assert segments(mock_display) == ["Thinking\n\n", "More\n\n", "And more"]
+
+        markdown.message = " "
+
+    # Outputs are reused from the start, and the ones left over are blanked
+    assert segments(mock_display) == [" ", " ", " "]
+    assert len(markdown._segment_ids) == 3
+
+    with mock.patch.object(display_functions, 'display') as mock_display:
+        markdown.append("Again\n\n")
+        markdown.append("And again")
+
+    assert [call.kwargs["display_id"] for call in mock_display.call_args_list] == [
+        markdown._segment_ids[0],
+        markdown._segment_ids[1],
+        markdown._segment_ids[1],
+    ]
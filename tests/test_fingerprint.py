@@ -0,0 +1,92 @@
+import sys
+
+from genai.fingerprint import SuggestionStore, fingerprint, innermost_code, message_template
+
+
+def capture(f, *args):
+    try:
+        f(*args)
+    except Exception:
+        return sys.exc_info()
+    raise AssertionError("expected an exception")
+
+
+def call_missing_method(obj):
+    return obj.missing()
+
+
+def repr_with_address(obj):
+    raise ValueError(f"can't use {obj!r}")
+
+
+def index(items, i):
+    return items[i]
+
+
+def test_message_template():
+    assert (
+        message_template("<Foo object at 0x7f3a2b1c> has no attribute 'bar'")
+        == "<Foo object at 0x…> has no attribute 'bar'"
+    )
+    assert (
+        message_template("index 12 is out of bounds for axis 0 with size 3")
+        == "index … is out of bounds for axis … with size …"
+    )
+    # Numbers inside names are part of the name
+    assert message_template("name 'df2' is not defined") == "name 'df2' is not defined"
+
+
+def test_innermost_code():
+    _, _, tb = capture(call_missing_method, object())
+
+    assert innermost_code(tb)[-1] == ("call_missing_method", "return obj.missing()")
+    assert innermost_code(None) == []
+
+
+def test_same_error_same_fingerprint():
+    class Thing:
+        pass
+
+    first = capture(call_missing_method, Thing())
+    second = capture(call_missing_method, Thing())
+
+    assert fingerprint(*first) == fingerprint(*second)
+    # Only the object addresses differ
+    assert fingerprint(*capture(repr_with_address, Thing())) == fingerprint(
+        *capture(repr_with_address, Thing())
+    )
+    assert fingerprint(*capture(index, [1], 5)) == fingerprint(*capture(index, [1, 2], 7))
+
+
+def test_different_errors_different_fingerprints():
+    missing = capture(call_missing_method, object())
+    out_of_range = capture(index, [1], 5)
+    wrong_type = capture(index, [1], "a")
+
+    fingerprints = {fingerprint(*missing), fingerprint(*out_of_range), fingerprint(*wrong_type)}
+    assert len(fingerprints) == 3
+
+
+def test_context_is_part_of_the_fingerprint():
+    error = capture(call_missing_method, object())
+
+    assert fingerprint(*error, context=("prompt", "gpt-4")) == fingerprint(
+        *error, context=("prompt", "gpt-4")
+    )
+    assert fingerprint(*error, context=("prompt", "gpt-4")) != fingerprint(
+        *error, context=("prompt", "gpt-3.5-turbo")
+    )
+    assert fingerprint(*error, context=("prompt", "gpt-4")) != fingerprint(*error)
+
+
+def test_suggestion_store_evicts_least_recently_used():
+    store = SuggestionStore(max_entries=2)
+    store.set("a", "Try this")
+    store.set("b", "Try that")
+    assert store.get("a") == "Try this"
+
+    store.set("c", "Try something else")
+
+    assert store.get("b") is None
+    assert store.get("a") == "Try this"
+    assert len(store) == 2
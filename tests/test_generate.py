@@ -1,7 +1,15 @@
 import sys
+import threading
+import time
 from unittest import mock
 
+import openai
+import pytest
+
 from genai import generate
+from genai.backends import FakeBackend
+from genai.cancellation import CancellationToken, GenerationCancelled
+from genai.scheduler import RequestScheduler
 
 
 def mock_deltas():
@@ -51,3 +59,181 @@ def test_generate_exception_suggestion(create):
 
     for buh in response:
         assert buh in ["Here's", "Something"]
+
+
+def test_generate_with_response_cache(tmp_path):
+    messages = [{"role": "user", "content": "hello"}]
+
+    try:
+        generate.enable_response_cache(tmp_path / "responses.sqlite3")
+
+        with mock.patch(
+            "openai.ChatCompletion.create", return_value=mock_deltas(), autospec=True
+        ) as create:
+            assert list(generate.generate(messages, stream=True)) == ["Here's", "Something"]
+            # Replayed from the cache, delta by delta
+            assert list(generate.generate(messages, stream=True)) == ["Here's", "Something"]
+            # Non-streamed requests are served from the same entry
+            assert list(generate.generate(messages, stream=False)) == ["Here's", "Something"]
+
+        create.assert_called_once()
+    finally:
+        generate.disable_response_cache()
+
+
+def test_generate_does_not_cache_partial_responses(tmp_path):
+    messages = [{"role": "user", "content": "hello"}]
+
+    try:
+        generate.enable_response_cache(tmp_path / "responses.sqlite3")
+
+        with mock.patch(
+            "openai.ChatCompletion.create",
+            side_effect=lambda **kwargs: mock_deltas(),
+            autospec=True,
+        ) as create:
+            partial = generate.generate(messages, stream=True)
+            assert next(partial) == "Here's"
+            partial.close()
+
+            assert list(generate.generate(messages, stream=True)) == ["Here's", "Something"]
+
+        assert create.call_count == 2
+    finally:
+        generate.disable_response_cache()
+
+
+async def amock_deltas():
+    for chunk in mock_deltas():
+        yield chunk
+
+
+async def test_agenerate_exception_suggestion():
+    try:
+        raise Exception("this is just a test")
+    except Exception:
+        (etype, evalue, tb) = sys.exc_info()
+
+    with mock.patch(
+        "openai.ChatCompletion.acreate", return_value=amock_deltas(), autospec=True
+    ) as acreate:
+        response = generate.agenerate_exception_suggestion(
+            code="fancy code",
+            etype=etype,
+            evalue=evalue,
+            plaintext_traceback="Traceback (most recent call last):",
+            stream=True,
+        )
+
+        assert [delta async for delta in response] == ["Here's", "Something"]
+
+    kwargs = acreate.call_args.kwargs
+    assert kwargs["stream"] is True
+    assert kwargs["messages"][1] == {"role": "user", "content": "fancy code"}
+
+
+async def test_agenerate_next_from_history_without_streaming():
+    completion = {"choices": [{"message": {"role": "assistant", "content": "superplot(df)"}}]}
+
+    with mock.patch(
+        "openai.ChatCompletion.acreate", return_value=completion, autospec=True
+    ) as acreate:
+        response = generate.agenerate_next_from_history([], "plot df", model="gpt-4")
+
+        assert [delta async for delta in response] == ["superplot(df)"]
+
+    assert acreate.call_args.kwargs["model"] == "gpt-4"
+    assert acreate.call_args.kwargs["messages"][-1] == {"role": "user", "content": "plot df"}
+
+
+def test_generate_coalesces_identical_requests():
+    messages = [{"role": "user", "content": "hello"}]
+    release = threading.Event()
+
+    def slow_deltas(**kwargs):
+        release.wait(timeout=5)
+        yield from mock_deltas()
+
+    results = []
+
+    def consume():
+        results.append(list(generate.generate(messages, stream=True)))
+
+    with mock.patch("openai.ChatCompletion.create", side_effect=slow_deltas) as create:
+        threads = [threading.Thread(target=consume) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+
+        release.set()
+        for thread in threads:
+            thread.join(timeout=5)
+
+    create.assert_called_once()
+    assert results == [["Here's", "Something"]] * 3
+
+
+def test_generate_without_coalescing():
+    messages = [{"role": "user", "content": "hello"}]
+
+    with mock.patch.object(generate, "coalesce_requests", False), mock.patch(
+        "openai.ChatCompletion.create", side_effect=lambda **kwargs: mock_deltas()
+    ) as create:
+        first = generate.generate(messages, stream=True)
+        second = generate.generate(messages, stream=True)
+
+        assert list(first) == ["Here's", "Something"]
+        assert list(second) == ["Here's", "Something"]
+
+    assert create.call_count == 2
+
+
+def test_generate_retries_rate_limited_requests():
+    messages = [{"role": "user", "content": "hello"}]
+    responses = [openai.error.RateLimitError("Rate limit reached"), mock_deltas()]
+
+    with mock.patch.object(generate, "scheduler", RequestScheduler(base_delay=0)), mock.patch(
+        "openai.ChatCompletion.create", side_effect=responses
+    ) as create:
+        assert list(generate.generate(messages, stream=True)) == ["Here's", "Something"]
+
+    assert create.call_count == 2
+
+
+def test_cancelling_aborts_a_blocked_stream():
+    backend = FakeBackend(["Here's", " Something"], inter_token_delay=5)
+    cancel = CancellationToken()
+
+    with mock.patch.object(generate, "backend", backend):
+        response = generate.generate(
+            [{"role": "user", "content": "hi"}], stream=True, cancel=cancel
+        )
+        assert next(response) == "Here's"
+
+        threading.Timer(0.05, cancel.cancel).start()
+        start = time.perf_counter()
+        with pytest.raises(GenerationCancelled):
+            next(response)
+
+    # Closing the stream interrupted the wait for the next delta
+    assert time.perf_counter() - start < 2
+    assert len(generate.in_flight) == 0
+
+
+def test_cancelling_one_caller_keeps_a_shared_stream_going():
+    backend = FakeBackend(["Here's", " Something"])
+    messages = [{"role": "user", "content": "hi"}]
+    cancel = CancellationToken()
+
+    with mock.patch.object(generate, "backend", backend):
+        cancelled = generate.generate(messages, stream=True, cancel=cancel)
+        assert next(cancelled) == "Here's"
+        shared = generate.generate(messages, stream=True)
+        assert next(shared) == "Here's"
+
+        cancel.cancel()
+        with pytest.raises(GenerationCancelled):
+            next(cancelled)
+
+        assert list(shared) == [" Something"]
+
+    assert len(backend.requests) == 1
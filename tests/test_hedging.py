@@ -0,0 +1,167 @@
+import time
+from unittest import mock
+
+import pytest
+
+from genai import generate
+from genai.backends import FakeBackend
+from genai.cache import ResponseCache, cache_key
+from genai.hedging import HedgedStream, HedgingPolicy
+
+
+class PerModelBackend:
+    """Streams from a different fake backend for each model"""
+
+    def __init__(self, **backends):
+        self.backends = backends
+
+    def create(self, model, messages, stream):
+        return self.backends[model].create(model, messages, stream)
+
+
+def starter(backend):
+    """A `HedgedStream` start function that sends requests right away"""
+
+    def start(model, sending):
+        sending()
+        return backend.create(model, [], True)
+
+    return start
+
+
+def test_policy_waits_for_enough_samples():
+    policy = HedgingPolicy(min_samples=3, initial_delay=4)
+
+    policy.record(1)
+    policy.record(2)
+    assert policy.delay() == 4
+
+    policy.record(3)
+    assert policy.delay() == 3
+
+
+def test_policy_uses_the_percentile_of_recent_samples():
+    policy = HedgingPolicy(percentile=90, min_samples=1, min_delay=0, window=10)
+
+    for i in range(1, 21):
+        policy.record(i / 10)
+
+    # Only the last 10 samples (1.1 to 2.0) count
+    assert policy.delay() == pytest.approx(1.9)
+
+
+def test_policy_min_delay():
+    policy = HedgingPolicy(min_samples=1, min_delay=0.5)
+    policy.record(0.01)
+
+    assert policy.delay() == 0.5
+
+
+def test_hedge_wins_when_the_original_is_slow():
+    slow = FakeBackend(["slow"], time_to_first_token=5)
+    fast = FakeBackend(["fast", " answer"])
+    backend = PerModelBackend(**{"gpt-4": slow, "gpt-3.5-turbo": fast})
+    policy = HedgingPolicy(hedge_model="gpt-3.5-turbo", initial_delay=0.05)
+
+    stream = HedgedStream(starter(backend), "gpt-4", policy)
+
+    assert list(stream) == ["fast", " answer"]
+    assert policy.hedges == 1
+    assert policy.hedge_wins == 1
+
+
+def test_no_hedge_when_the_original_is_fast():
+    backend = FakeBackend(["quick"])
+    policy = HedgingPolicy(initial_delay=5)
+
+    stream = HedgedStream(starter(backend), "gpt-4", policy)
+
+    assert list(stream) == ["quick"]
+    assert policy.hedges == 0
+    assert len(backend.requests) == 1
+
+
+def test_errors_before_hedging_are_raised():
+    def create(model, sending):
+        sending()
+        if model == "gpt-4":
+            raise RuntimeError("overloaded")
+        return iter(["from the hedge"])
+
+    policy = HedgingPolicy(hedge_model="gpt-3.5-turbo", initial_delay=0)
+    stream = HedgedStream(create, "gpt-4", policy)
+
+    # The original fails before the hedge is sent, so there's nothing to fall back on
+    with pytest.raises(RuntimeError, match="overloaded"):
+        list(stream)
+
+
+def test_generate_hedges_streams():
+    slow = FakeBackend(["slow"], time_to_first_token=5)
+    fast = FakeBackend(["fast"])
+    backend = PerModelBackend(**{"gpt-4": slow, "gpt-3.5-turbo": fast})
+
+    with mock.patch.object(generate, "backend", backend), mock.patch.object(
+        generate, "hedging", HedgingPolicy(hedge_model="gpt-3.5-turbo", initial_delay=0.05)
+    ):
+        response = generate.generate([{"role": "user", "content": "hi"}], "gpt-4", stream=True)
+
+        assert list(response) == ["fast"]
+
+
+def test_enable_hedging():
+    with mock.patch.object(generate, "hedging", None):
+        policy = generate.enable_hedging(percentile=99, hedge_model="gpt-3.5-turbo")
+
+        assert generate.hedging is policy
+        assert policy.percentile == 99
+
+        generate.disable_hedging()
+        assert generate.hedging is None
+
+
+def test_hedges_record_how_long_the_original_waited():
+    slow = FakeBackend(["slow"], time_to_first_token=5)
+    fast = FakeBackend(["fast"], time_to_first_token=0.01)
+    backend = PerModelBackend(**{"gpt-4": slow, "gpt-3.5-turbo": fast})
+    policy = HedgingPolicy(hedge_model="gpt-3.5-turbo", initial_delay=0.2)
+
+    stream = HedgedStream(starter(backend), "gpt-4", policy)
+    assert list(stream) == ["fast"]
+    assert stream.winning_model == "gpt-3.5-turbo"
+
+    # The original's wait until the hedge answered, not the hedge's own time to first token
+    [sample] = policy._samples
+    assert sample >= 0.2
+
+
+def test_waiting_for_admission_does_not_hedge():
+    backend = FakeBackend(["admitted"], time_to_first_token=0.05)
+    policy = HedgingPolicy(initial_delay=0.1)
+
+    def start(model, sending):
+        # Held up by the request scheduler for longer than the hedge delay
+        time.sleep(0.3)
+        sending()
+        return backend.create(model, [], True)
+
+    stream = HedgedStream(start, "gpt-4", policy)
+
+    assert list(stream) == ["admitted"]
+    assert policy.hedges == 0
+    [sample] = policy._samples
+    assert sample < 0.3
+
+
+def test_generate_does_not_cache_answers_from_the_hedge_model(tmp_path):
+    slow = FakeBackend(["slow"], time_to_first_token=5)
+    fast = FakeBackend(["fast"])
+    backend = PerModelBackend(**{"gpt-4": slow, "gpt-3.5-turbo": fast})
+    messages = [{"role": "user", "content": "hi"}]
+
+    with mock.patch.object(generate, "backend", backend), mock.patch.object(
+        generate, "hedging", HedgingPolicy(hedge_model="gpt-3.5-turbo", initial_delay=0.05)
+    ), mock.patch.object(generate, "response_cache", ResponseCache(tmp_path / "cache.db")):
+        assert list(generate.generate(messages, "gpt-4", stream=True)) == ["fast"]
+
+        assert generate.response_cache.get(cache_key("gpt-4", messages)) is None
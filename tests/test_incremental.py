@@ -0,0 +1,145 @@
+from unittest import mock
+
+import pytest
+from IPython.core import display_functions
+
+from genai import incremental
+from genai.display import GenaiMarkdown, Stage
+from genai.incremental import (
+    TARGET_NAME,
+    StreamAssembler,
+    active_channel,
+    disable_incremental_updates,
+    enable_incremental_updates,
+)
+
+
+class FakeComm:
+    def __init__(self, target_name, data):
+        self.target_name = target_name
+        self.data = data
+        self.sent = []
+        self.closed = False
+
+    def on_msg(self, callback):
+        self.msg_callback = callback
+
+    def on_close(self, callback):
+        self.close_callback = callback
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def close(self):
+        self.closed = True
+
+    # What the frontend does
+    def reply(self, data):
+        self.msg_callback({"content": {"data": data}})
+
+    def close_from_frontend(self):
+        self.close_callback({"content": {"data": {}}})
+
+
+@pytest.fixture
+def comm():
+    with mock.patch.object(incremental, "_create_comm", side_effect=FakeComm):
+        channel = enable_incremental_updates()
+        yield channel.comm
+    disable_incremental_updates()
+
+
+def test_enable_opens_a_comm(comm):
+    assert comm.target_name == TARGET_NAME
+    assert comm.data == {"version": 1}
+
+    # Until the frontend says it's ready
+    assert active_channel() is None
+    comm.reply(StreamAssembler().ready())
+    assert active_channel() is not None
+
+    disable_incremental_updates()
+    assert comm.closed
+    assert active_channel() is None
+
+
+def test_outside_a_kernel():
+    with mock.patch.object(incremental, "_create_comm", return_value=None):
+        assert enable_incremental_updates() is None
+    assert active_channel() is None
+
+
+def test_appends_go_over_the_comm(comm, ip):
+    comm.reply({"ready": True, "version": 1})
+    assembler = StreamAssembler()
+    markdown = GenaiMarkdown(max_updates_per_second=None)
+
+    def display(obj, display_id, update=False):
+        assembler.update(display_id, obj._repr_markdown_())
+
+    with mock.patch.object(display_functions, 'display', side_effect=display) as mock_display:
+        markdown.display()
+        markdown.message = "## Suggestion\n"
+        markdown.consume(iter(["Use ", "`pd.read_csv`", "!"]))
+
+        # Only the display and the message were full updates
+        assert mock_display.call_count == 2
+        assert [data["append"] for data in comm.sent] == ["Use ", "`pd.read_csv`", "!"]
+
+        for data in comm.sent:
+            assembler.receive(data)
+        assert assembler.documents[markdown._display_id] == markdown.message
+
+        # Stage changes are full updates, so the output is complete without the comm
+        markdown.stage = Stage.FINISHED
+        assert mock_display.call_count == 3
+
+
+def test_appends_are_coalesced(comm, ip):
+    comm.reply({"ready": True, "version": 1})
+    markdown = GenaiMarkdown()
+
+    with mock.patch.object(display_functions, 'display'):
+        markdown.consume(iter(["a"] * 100))
+
+    # The first delta right away and the rest when consuming ends
+    assert [data["append"] for data in comm.sent] == ["a", "a" * 99]
+
+
+def test_full_updates_until_the_frontend_is_ready(comm, ip):
+    markdown = GenaiMarkdown(max_updates_per_second=None)
+
+    with mock.patch.object(display_functions, 'display') as mock_display:
+        markdown.consume(iter(["a", "b"]))
+
+    assert mock_display.call_count == 2
+    assert comm.sent == []
+
+
+def test_falls_back_when_the_comm_closes(comm, ip):
+    comm.reply({"ready": True, "version": 1})
+    comm.close_from_frontend()
+    markdown = GenaiMarkdown(max_updates_per_second=None)
+
+    with mock.patch.object(display_functions, 'display') as mock_display:
+        markdown.append("a")
+
+    assert mock_display.call_count == 1
+    assert comm.sent == []
+
+
+def test_falls_back_when_sending_fails(comm, ip):
+    comm.reply({"ready": True, "version": 1})
+    comm.send = mock.Mock(side_effect=RuntimeError("kernel is shutting down"))
+    markdown = GenaiMarkdown(max_updates_per_second=None)
+
+    with mock.patch.object(display_functions, 'display') as mock_display:
+        markdown.append("a")
+
+    assert mock_display.call_count == 1
+    assert active_channel() is None
+
+
+def test_unknown_protocol_versions_are_ignored(comm):
+    comm.reply({"ready": True, "version": 2})
+    assert active_channel() is None
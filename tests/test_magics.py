@@ -1,6 +1,9 @@
 from unittest import mock
 
+from genai import generate, metrics
+from genai.backends import FakeBackend
 from genai.context import PastAssists
+from genai.metrics import RingBufferSink
 from genai.prompts import PromptStore
 
 
@@ -123,3 +126,61 @@ def test_assist_magic_with_fresh_arg(create, ip):
     assist = PastAssists.get(ip.execution_count)
 
     assert assist.message == "superplot(df)"
+
+
+@mock.patch(
+    "openai.ChatCompletion.create",
+    return_value={
+        "choices": [
+            {
+                "message": {
+                    "role": "assistant",
+                    "content": "superplot(df)",
+                },
+            },
+        ],
+    },
+    autospec=True,
+)
+def test_assist_magic_with_model_arg(create, ip):
+    ip.run_cell_magic(
+        magic_name="assist",
+        line="--fresh --model gpt-4",
+        cell="create a scatterplot from df",
+    )
+
+    create.assert_called_once()
+    assert create.call_args.kwargs["model"] == "gpt-4"
+
+
+@mock.patch(
+    "openai.ChatCompletion.create",
+    return_value={"choices": [{"message": {"role": "assistant", "content": "df.plot()"}}]},
+    autospec=True,
+)
+def test_assist_magic_reaches_back_as_far_as_the_budget_allows(create, ip):
+    ip.run_cell("import pandas as pd", store_history=True)
+    for i in range(8):
+        ip.run_cell(f"x{i} = {i}", store_history=True)
+
+    ip.run_cell_magic(magic_name="assist", line="", cell="plot df")
+
+    messages = create.call_args.kwargs["messages"]
+    # Well over five executions back, as everything fits in the model's window
+    assert messages[1] == {"role": "user", "content": "import pandas as pd"}
+    assert messages[-1] == {"role": "user", "content": "plot df"}
+
+
+def test_assist_magic_records_context_time(ip):
+    recent = RingBufferSink()
+    with mock.patch.object(metrics, "sinks", [recent]), mock.patch.object(
+        generate, "backend", FakeBackend("df.plot()")
+    ):
+        ip.run_cell("x = 1", store_history=True)
+        ip.run_cell_magic(magic_name="assist", line="", cell="plot df")
+        ip.run_cell_magic(magic_name="assist", line="--fresh", cell="plot df again")
+
+    assisted, fresh = recent.records
+    assert assisted.context_time is not None and assisted.context_time >= 0
+    # Nothing to build without the history
+    assert fresh.context_time is None
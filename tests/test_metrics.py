@@ -0,0 +1,151 @@
+import json
+import time
+from unittest import mock
+
+import pytest
+
+from genai import generate, metrics
+from genai.backends import FakeBackend
+from genai.cache import ResponseCache
+from genai.cancellation import CancellationToken, GenerationCancelled
+from genai.metrics import CallbackSink, GenerationRecord, JSONLSink, RingBufferSink
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+@pytest.fixture
+def recent():
+    sink = RingBufferSink()
+    with mock.patch.object(metrics, "sinks", [sink]):
+        yield sink
+
+
+@pytest.fixture
+def backend():
+    backend = FakeBackend(["Here's", " something", " useful"], time_to_first_token=0.02)
+    with mock.patch.object(generate, "backend", backend):
+        yield backend
+
+
+def make_record(**changes):
+    fields = dict(
+        model="gpt-4",
+        prompt_tokens=10,
+        completion_tokens=3,
+        time_to_first_token=0.5,
+        tokens_per_second=20.0,
+        wall_time=0.6,
+        consumer_time=0.01,
+        cache_hit=False,
+        status="ok",
+        timestamp=1680000000.0,
+    )
+    fields.update(changes)
+    return GenerationRecord(**fields)
+
+
+def test_ring_buffer_keeps_recent_records():
+    sink = RingBufferSink(maxlen=2)
+    for i in range(3):
+        sink.emit(make_record(prompt_tokens=i))
+
+    assert [record.prompt_tokens for record in sink.records] == [1, 2]
+
+
+def test_jsonl_sink_appends_records(tmp_path):
+    sink = JSONLSink(tmp_path / "metrics.jsonl")
+    sink.emit(make_record())
+    sink.emit(make_record(cache_hit=True))
+
+    lines = (tmp_path / "metrics.jsonl").read_text().splitlines()
+    assert [json.loads(line)["cache_hit"] for line in lines] == [False, True]
+    assert json.loads(lines[0]) == make_record().to_dict()
+
+
+def test_failing_sinks_do_not_stop_others():
+    received = []
+    failing = CallbackSink(mock.Mock(side_effect=RuntimeError("metrics are down")))
+
+    with mock.patch.object(metrics, "sinks", []):
+        metrics.add_sink(failing)
+        metrics.add_sink(CallbackSink(received.append))
+        metrics.emit(make_record())
+        metrics.remove_sink(failing)
+
+        assert len(metrics.sinks) == 1
+
+    assert received == [make_record()]
+
+
+def test_generate_records_streams(recent, backend):
+    assert list(generate.generate(MESSAGES, "gpt-4", stream=True)) == [
+        "Here's",
+        " something",
+        " useful",
+    ]
+
+    (record,) = recent.records
+    assert record.model == "gpt-4"
+    assert record.status == "ok"
+    assert not record.cache_hit
+    assert record.prompt_tokens > 0
+    assert record.completion_tokens > 0
+    assert record.time_to_first_token >= 0.02
+    assert record.wall_time >= record.time_to_first_token
+
+
+def test_generate_records_cache_hits(recent, backend):
+    with mock.patch.object(generate, "response_cache", ResponseCache(":memory:")):
+        list(generate.generate(MESSAGES, stream=True))
+        list(generate.generate(MESSAGES, stream=True))
+
+    assert [record.cache_hit for record in recent.records] == [False, True]
+
+
+def test_generate_records_how_generations_end(recent, backend):
+    cancel = CancellationToken()
+    response = generate.generate(MESSAGES, stream=True, cancel=cancel)
+    next(response)
+    cancel.cancel()
+    with pytest.raises(GenerationCancelled):
+        next(response)
+
+    response = generate.generate(MESSAGES, stream=True)
+    next(response)
+    response.close()
+
+    assert [record.status for record in recent.records] == ["cancelled", "closed"]
+
+
+def test_consumer_time_is_measured(recent, backend):
+    for _ in generate.generate(MESSAGES, stream=True):
+        # Rendering each delta takes a while
+        time.sleep(0.01)
+
+    (record,) = recent.records
+    assert record.consumer_time >= 0.03
+
+
+def test_context_time_is_recorded(recent, backend):
+    list(generate.generate(MESSAGES, stream=True))
+    list(generate.generate_next_from_history([], "hello", stream=True, context_time=0.25))
+
+    assert [record.context_time for record in recent.records] == [None, 0.25]
+
+
+def test_nothing_is_recorded_without_sinks(backend):
+    with mock.patch.object(metrics, "sinks", []), mock.patch.object(
+        metrics, "_Measurement", autospec=True
+    ) as measurement:
+        list(generate.generate(MESSAGES, stream=True))
+
+    measurement.assert_not_called()
+
+
+async def test_agenerate_records(recent, backend):
+    response = generate.agenerate(MESSAGES, stream=True)
+
+    assert [delta async for delta in response] == ["Here's", " something", " useful"]
+    (record,) = recent.records
+    assert record.status == "ok"
+    assert record.time_to_first_token >= 0.02
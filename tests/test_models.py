@@ -0,0 +1,28 @@
+from genai.models import DEFAULT_MODEL, MODELS, get_model
+
+
+def test_get_model():
+    model = get_model("gpt-3.5-turbo")
+
+    assert model.context_window == 4096
+    assert model.prompt_budget == 4096 - model.reply_reserve
+    assert model.encoding == "cl100k_base"
+
+
+def test_default_model_is_known():
+    assert DEFAULT_MODEL in MODELS
+
+
+def test_get_model_resolves_snapshots_by_prefix():
+    model = get_model("gpt-4-32k-0999")
+
+    assert model.name == "gpt-4-32k-0999"
+    assert model.context_window == MODELS["gpt-4-32k"].context_window
+
+
+def test_get_model_unknown():
+    model = get_model("my-fine-tuned-model")
+
+    assert model.name == "my-fine-tuned-model"
+    assert model.context_window == 4096
+    assert model.tokens_per_message == 3
@@ -0,0 +1,128 @@
+from unittest import mock
+
+import openai
+import pytest
+
+from genai.scheduler import RequestScheduler, TokenBucket, retry_after
+
+
+class FakeClock:
+    """A clock that only moves when something sleeps"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def rate_limited(headers=None):
+    return openai.error.RateLimitError("Rate limit reached", headers=headers)
+
+
+def test_token_bucket_refills_over_time():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock=clock)
+
+    assert bucket.wait_time(60) == 0
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1)
+
+    clock.now += 30
+    assert bucket.wait_time(30) == 0
+    # Requests larger than the bucket only wait for it to fill up
+    assert bucket.wait_time(1000) == pytest.approx(30)
+
+
+def test_scheduler_paces_requests():
+    clock = FakeClock()
+    scheduler = RequestScheduler(requests_per_minute=2, clock=clock, sleep=clock.sleep)
+
+    for _ in range(3):
+        scheduler.acquire()
+
+    # The first two fit the budget, the third waits for half a minute
+    assert clock.sleeps == [pytest.approx(30)]
+    stats = scheduler.stats()
+    assert stats.admitted == 3
+    assert stats.queue_depth == 0
+    assert stats.max_wait == pytest.approx(30)
+    assert stats.mean_wait == pytest.approx(10)
+
+
+def test_scheduler_budgets_tokens():
+    clock = FakeClock()
+    scheduler = RequestScheduler(tokens_per_minute=1000, clock=clock, sleep=clock.sleep)
+
+    scheduler.acquire(tokens=800)
+    scheduler.acquire(tokens=400)
+
+    assert clock.sleeps == [pytest.approx(12)]
+
+
+def test_scheduler_retries_rate_limited_requests():
+    clock = FakeClock()
+    scheduler = RequestScheduler(clock=clock, sleep=clock.sleep)
+    request = mock.Mock(side_effect=[rate_limited(), rate_limited(), "response"])
+
+    assert scheduler.call(request) == "response"
+    assert request.call_count == 3
+    assert scheduler.stats().retries == 2
+    # Jittered, but within the exponential backoff
+    assert 0 <= clock.sleeps[0] <= 1
+    assert 0 <= clock.sleeps[1] <= 2
+
+
+def test_scheduler_respects_retry_after():
+    clock = FakeClock()
+    scheduler = RequestScheduler(clock=clock, sleep=clock.sleep)
+    request = mock.Mock(side_effect=[rate_limited({"Retry-After": "20"}), "response"])
+
+    assert scheduler.call(request) == "response"
+    assert sum(clock.sleeps) == pytest.approx(20)
+
+
+def test_scheduler_gives_up_after_max_retries():
+    clock = FakeClock()
+    scheduler = RequestScheduler(max_retries=1, clock=clock, sleep=clock.sleep)
+    request = mock.Mock(side_effect=rate_limited())
+
+    with pytest.raises(openai.error.RateLimitError):
+        scheduler.call(request)
+
+    assert request.call_count == 2
+
+
+def test_scheduler_does_not_retry_other_errors():
+    scheduler = RequestScheduler(sleep=mock.Mock())
+    request = mock.Mock(side_effect=openai.error.InvalidRequestError("Bad request", None))
+
+    with pytest.raises(openai.error.InvalidRequestError):
+        scheduler.call(request)
+
+    request.assert_called_once()
+
+
+def test_retry_after():
+    assert retry_after(rate_limited({"retry-after": "1.5"})) == 1.5
+    assert retry_after(rate_limited({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0
+    assert retry_after(rate_limited()) is None
+
+
+async def test_scheduler_acall_retries():
+    scheduler = RequestScheduler(base_delay=0)
+    responses = iter([rate_limited(), "response"])
+
+    async def request():
+        response = next(responses)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert await scheduler.acall(request) == "response"
+    assert scheduler.stats().retries == 1
@@ -0,0 +1,185 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import openai
+import pytest
+
+from genai import session
+from genai.cancellation import CancellationToken, GenerationCancelled
+from genai.generate import generate_next_from_history
+
+COMPLETION = json.dumps(
+    {
+        "id": "chatcmpl-123",
+        "object": "chat.completion",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "Hi there"}}],
+    }
+).encode()
+
+
+class ChatCompletionHandler(BaseHTTPRequestHandler):
+    """Answers every chat completion with the same response, over keep-alive connections"""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_HEAD(self):
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests += 1
+
+        if body.get("stream"):
+            self.stream_completion()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(COMPLETION)))
+        self.end_headers()
+        self.wfile.write(COMPLETION)
+
+    def stream_completion(self):
+        """Send the first delta, then stall until the test is over"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        chunk = {"choices": [{"index": 0, "delta": {"content": "Hi"}}]}
+        event = f"data: {json.dumps(chunk)}\n\n".encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(event), event))
+        self.wfile.flush()
+
+        self.server.stalled.wait(timeout=5)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def api_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ChatCompletionHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.requests = 0
+    server.stalled = threading.Event()
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    api_base = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    # openai caches its session per thread, so start each test from a clean slate
+    with mock.patch.object(openai, "api_base", api_base), mock.patch.object(
+        openai, "api_key", "sk-test"
+    ), mock.patch.object(openai, "requestssession", None), mock.patch.object(
+        openai.api_requestor, "_thread_context", threading.local()
+    ), mock.patch.object(
+        session, "_session", None
+    ):
+        yield server
+
+    server.stalled.set()
+    server.shutdown()
+    server.server_close()
+
+
+def test_requests_reuse_one_connection(api_server):
+    for _ in range(3):
+        response = generate_next_from_history([], "hello")
+        assert list(response) == ["Hi there"]
+
+    assert api_server.requests == 3
+    assert api_server.connections == 1
+
+
+def test_preconnect_warms_the_pool(api_server):
+    session.preconnect(background=False)
+
+    assert api_server.connections == 1
+
+    assert list(generate_next_from_history([], "hello")) == ["Hi there"]
+
+    assert api_server.requests == 1
+    assert api_server.connections == 1
+
+
+def test_install_session_keeps_user_session(api_server):
+    user_session = mock.MagicMock()
+    openai.requestssession = user_session
+
+    session.install_session()
+
+    assert openai.requestssession is user_session
+
+
+def test_configure_session_keeps_the_session_object(api_server):
+    shared = session.get_session()
+
+    configured = session.configure_session(pool_maxsize=2)
+
+    assert configured is shared
+    assert shared.adapters["https://"]._pool_maxsize == 2
+
+
+def test_cancelling_closes_a_stalled_stream(api_server):
+    cancel = CancellationToken()
+    response = generate_next_from_history([], "hello", stream=True, cancel=cancel)
+
+    assert next(response) == "Hi"
+
+    threading.Timer(0.05, cancel.cancel).start()
+    with pytest.raises(GenerationCancelled):
+        next(response)
+
+    # The pool is still usable afterwards
+    assert list(generate_next_from_history([], "hello again")) == ["Hi there"]
+    assert api_server.requests == 2
+
+
+def test_openai_recycling_its_session_keeps_the_pool(api_server):
+    session.install_session()
+    thread_context = openai.api_requestor._thread_context
+
+    for _ in range(3):
+        # Straight through openai, so that every request comes from this thread
+        response = openai.ChatCompletion.create(
+            model="gpt-3.5-turbo", messages=[{"role": "user", "content": "hello"}]
+        )
+        assert response["choices"][0]["message"]["content"] == "Hi there"
+        # openai closes and replaces the session of a thread once it's this old
+        thread_context.session_create_time -= openai.api_requestor.MAX_SESSION_LIFETIME_SECS + 1
+
+    assert api_server.requests == 3
+    assert api_server.connections == 1
+
+
+def test_proxy_set_after_install_is_used(api_server):
+    session.install_session()
+    # Only reachable through the proxy, which is the test server itself
+    proxy = f"http://127.0.0.1:{api_server.server_address[1]}"
+
+    with mock.patch.object(openai, "api_base", "http://api.invalid/v1"), mock.patch.object(
+        openai, "proxy", proxy
+    ):
+        assert list(generate_next_from_history([], "hello")) == ["Hi there"]
+        assert session.get_session().proxies == {"http": proxy, "https": proxy}
+
+    assert api_server.requests == 1
+
+
+def test_shutdown_closes_the_pool(api_server):
+    session.preconnect(background=False)
+    session.get_session().shutdown()
+
+    assert list(generate_next_from_history([], "hello")) == ["Hi there"]
+    assert api_server.connections == 2
@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pytest
+
+from genai.cancellation import CancellationToken, GenerationCancelled
+from genai.singleflight import SharedStream, SingleFlight
+
+
+def test_shared_stream_replays_for_late_subscribers():
+    shared = SharedStream(iter(["a", "b", "c"]))
+
+    first = shared.subscribe()
+    assert next(first) == "a"
+
+    second = shared.subscribe()
+    assert list(second) == ["a", "b", "c"]
+    assert list(first) == ["b", "c"]
+
+
+def test_shared_stream_raises_upstream_errors_for_every_subscriber():
+    def upstream():
+        yield "a"
+        raise RuntimeError("connection reset")
+
+    shared = SharedStream(upstream())
+    first, second = shared.subscribe(), shared.subscribe()
+
+    for subscription in (first, second):
+        assert next(subscription) == "a"
+        with pytest.raises(RuntimeError, match="connection reset"):
+            next(subscription)
+
+
+def test_shared_stream_closes_upstream_when_abandoned():
+    closed = []
+
+    def upstream():
+        try:
+            yield "a"
+            yield "b"
+        finally:
+            closed.append(True)
+
+    finished = []
+    shared = SharedStream(upstream(), on_finish=lambda: finished.append(True))
+
+    subscription = shared.subscribe()
+    assert next(subscription) == "a"
+    subscription.close()
+
+    assert closed == [True]
+    assert finished == [True]
+    # It can't be joined anymore, as the rest will never arrive
+    assert shared.subscribe() is None
+
+
+def test_single_flight_shares_concurrent_streams():
+    started = []
+    release = threading.Event()
+
+    def start():
+        started.append(True)
+
+        def upstream():
+            release.wait(timeout=5)
+            yield "Here's"
+            yield " something"
+
+        return upstream()
+
+    flight = SingleFlight()
+    results = []
+
+    def consume():
+        results.append(list(flight.stream("key", start)))
+
+    threads = [threading.Thread(target=consume) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert started == [True]
+    assert results == [["Here's", " something"]] * 3
+    # Finished flights are forgotten, so the next request starts afresh
+    assert len(flight) == 0
+
+
+def test_single_flight_starts_again_after_abandonment():
+    starts = []
+
+    def start():
+        starts.append(True)
+        return iter(["a", "b"])
+
+    flight = SingleFlight()
+
+    abandoned = flight.stream("key", start)
+    next(abandoned)
+    abandoned.close()
+
+    assert list(flight.stream("key", start)) == ["a", "b"]
+    assert len(starts) == 2
+
+
+def test_cancelled_subscriber_leaves_while_upstream_is_stalled():
+    release = threading.Event()
+
+    def upstream():
+        yield "a"
+        release.wait(timeout=5)
+        yield "b"
+
+    shared = SharedStream(upstream())
+    cancel = CancellationToken()
+    first, second = shared.subscribe(cancel), shared.subscribe()
+    assert next(first) == "a"
+    assert next(second) == "a"
+
+    threading.Timer(0.05, cancel.cancel).start()
+    started = time.monotonic()
+    with pytest.raises(GenerationCancelled):
+        # Waiting on the stalled upstream for the next item
+        next(first)
+    assert time.monotonic() - started < 1
+
+    # The other subscriber still gets the rest
+    release.set()
+    assert list(second) == ["b"]
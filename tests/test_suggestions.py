@@ -1,8 +1,13 @@
 import sys
+import threading
+import time
 from unittest import mock
 
-from genai import suggestions
-from genai.context import PastErrors
+from genai import generate, suggestions
+from genai.backends import FakeBackend
+from genai.context import PastAssists, PastErrors
+from genai.display import Stage
+from genai.fingerprint import SuggestionStore
 from genai.prompts import PromptStore
 from genai.suggestions import can_handle_display_updates
 
@@ -343,3 +348,288 @@ def test_no_IPython_means_no_display_updates():
 def test_can_handle_display_updates_with_other_shell():
     with mock.patch('builtins.__import__', return_value=fake_IPython("SuperCoolInteractiveShell")):
         assert can_handle_display_updates() is True
+
+
+@mock.patch(
+    "IPython.core.display_functions.display",
+    autospec=True,
+)
+@mock.patch("openai.ChatCompletion.create", autospec=True)
+def test_custom_exc_in_background(create, display, ip):
+    release = threading.Event()
+
+    def slow_create(**kwargs):
+        release.wait(timeout=5)
+        return {"choices": [{"message": {"role": "assistant", "content": "Here's a suggestion"}}]}
+
+    create.side_effect = slow_create
+
+    try:
+        raise Exception("this is just a test")
+    except Exception:
+        (etype, evalue, tb) = sys.exc_info()
+
+    ip.showtraceback = mock.MagicMock()
+    ip.execution_count = 2
+    ip.user_ns["In"] = None
+    ip.history_manager.input_hist_raw = ["", "import pandas as pd", "fancy code"]
+
+    worker = suggestions.enable_background_suggestions()
+    try:
+        # Returns while the suggestion is still being generated
+        suggestions.custom_exc(ip, etype, evalue, tb, tb_offset=None)
+
+        ip.showtraceback.assert_called_once_with((etype, evalue, tb), tb_offset=None)
+        gm = PastAssists.get(2)
+        assert gm.message == "Let's see how we can fix this... 🔧"
+
+        release.set()
+        assert worker.wait(timeout=5)
+    finally:
+        suggestions.disable_background_suggestions()
+
+    create.assert_called_once()
+    assert gm.message == "## 💡 Suggestion\nHere's a suggestion"
+    assert gm.stage == Stage.FINISHED
+
+
+@mock.patch(
+    "IPython.core.display_functions.display",
+    autospec=True,
+)
+@mock.patch("openai.ChatCompletion.create", autospec=True, side_effect=Exception("rate limited"))
+def test_custom_exc_in_background_reports_errors(create, display, ip):
+    try:
+        raise Exception("this is just a test")
+    except Exception:
+        (etype, evalue, tb) = sys.exc_info()
+
+    ip.showtraceback = mock.MagicMock()
+    ip.execution_count = 2
+    ip.user_ns["In"] = None
+    ip.history_manager.input_hist_raw = ["", "import pandas as pd", "fancy code"]
+
+    worker = suggestions.enable_background_suggestions()
+    try:
+        suggestions.custom_exc(ip, etype, evalue, tb, tb_offset=None)
+        assert worker.wait(timeout=5)
+    finally:
+        suggestions.disable_background_suggestions()
+
+    gm = PastAssists.get(2)
+    assert gm.message == "Error while trying to provide a suggestion: rate limited"
+    assert gm.stage is None
+
+
+@mock.patch(
+    "IPython.core.display_functions.display",
+    autospec=True,
+)
+def test_new_cell_cancels_stale_suggestions(display, ip):
+    backend = FakeBackend(["Here's", " a", " suggestion"], inter_token_delay=5)
+
+    try:
+        raise Exception("this is just a test")
+    except Exception:
+        (etype, evalue, tb) = sys.exc_info()
+
+    ip.showtraceback = mock.MagicMock()
+    ip.execution_count = 2
+    ip.user_ns["In"] = None
+    ip.history_manager.input_hist_raw = ["", "import pandas as pd", "fancy code"]
+
+    worker = suggestions.enable_background_suggestions(cancel_stale=True)
+    try:
+        with mock.patch.object(generate, "backend", backend), mock.patch.object(
+            suggestions, "can_handle_display_updates", return_value=True
+        ):
+            suggestions.custom_exc(ip, etype, evalue, tb, tb_offset=None)
+            gm = PastAssists.get(2)
+
+            # Wait for the first delta to arrive, then move on to the next cell
+            for _ in range(100):
+                if gm.message.endswith("Here's"):
+                    break
+                time.sleep(0.01)
+            ip.run_cell("1 + 1")
+
+            assert worker.wait(timeout=2)
+    finally:
+        suggestions.disable_background_suggestions()
+
+    assert gm.message == " "
+    assert gm.stage is None
+
+
+@mock.patch(
+    "IPython.core.display_functions.display",
+    autospec=True,
+)
+@mock.patch(
+    "openai.ChatCompletion.create",
+    return_value={"choices": [{"message": {"role": "assistant", "content": "Define it first"}}]},
+    autospec=True,
+)
+def test_custom_exc_reuses_suggestions_for_recurring_errors(create, display, ip):
+    ip.showtraceback = mock.MagicMock()
+    ip.user_ns["In"] = None
+    ip.history_manager.input_hist_raw = ["", "df.head()", "df.head()"]
+
+    def fail():
+        return undefined_frame  # noqa: F821
+
+    with mock.patch.object(suggestions, "suggestion_store", SuggestionStore()):
+        for execution_count in (1, 2):
+            try:
+                fail()
+            except NameError:
+                (etype, evalue, tb) = sys.exc_info()
+
+            ip.execution_count = execution_count
+            suggestions.custom_exc(ip, etype, evalue, tb, tb_offset=None)
+
+    create.assert_called_once()
+    for execution_count in (1, 2):
+        gm = PastAssists.get(execution_count)
+        assert gm.message == "## 💡 Suggestion\nDefine it first"
+        assert gm.stage == Stage.FINISHED
+
+
+@mock.patch(
+    "IPython.core.display_functions.display",
+    autospec=True,
+)
+@mock.patch(
+    "openai.ChatCompletion.create",
+    return_value={"choices": [{"message": {"role": "assistant", "content": "Define it first"}}]},
+    autospec=True,
+)
+def test_custom_exc_asks_again_with_a_new_prompt_or_model(create, display, ip):
+    ip.showtraceback = mock.MagicMock()
+    ip.user_ns["In"] = None
+    ip.history_manager.input_hist_raw = ["", "df.head()", "df.head()", "df.head()"]
+
+    def fail():
+        return undefined_frame  # noqa: F821
+
+    prompt = PromptStore.exception_prompt
+    with mock.patch.object(suggestions, "suggestion_store", SuggestionStore()):
+        try:
+            for execution_count in (1, 2, 3):
+                if execution_count == 2:
+                    PromptStore.exception_prompt = "Explain it like a pirate."
+                if execution_count == 3:
+                    suggestions.exception_model = "gpt-4"
+                try:
+                    fail()
+                except NameError:
+                    (etype, evalue, tb) = sys.exc_info()
+
+                ip.execution_count = execution_count
+                suggestions.custom_exc(ip, etype, evalue, tb, tb_offset=None)
+        finally:
+            PromptStore.exception_prompt = prompt
+            suggestions.exception_model = suggestions.DEFAULT_MODEL
+
+    assert create.call_count == 3
+
+
+def test_remember_closes_abandoned_suggestions():
+    closed = []
+
+    def suggestion():
+        try:
+            yield "Define"
+            yield " it first"
+        finally:
+            closed.append(True)
+
+    store = SuggestionStore()
+    remembering = suggestions._remember(store, "key", suggestion())
+
+    assert next(remembering) == "Define"
+    remembering.close()
+
+    assert closed == [True]
+    assert store.get("key") is None
+
+
+@mock.patch(
+    "IPython.core.display_functions.display",
+    autospec=True,
+)
+@mock.patch("openai.ChatCompletion.create", autospec=True)
+def test_custom_exc_diagnoses_typos_locally(create, display, ip):
+    ip.showtraceback = mock.MagicMock()
+    ip.execution_count = 2
+    ip.user_ns["In"] = None
+    ip.user_ns["data_frame"] = object()
+    ip.history_manager.input_hist_raw = ["", "data_frame = load()", "dataframe.head()"]
+
+    try:
+        exec("dataframe.head()", ip.user_ns)
+    except NameError:
+        (etype, evalue, tb) = sys.exc_info()
+
+    suggestions.custom_exc(ip, etype, evalue, tb, tb_offset=None)
+
+    create.assert_not_called()
+    gm = PastAssists.get(2)
+    assert gm.message == ("## 💡 Suggestion\n`dataframe` isn't defined. Did you mean `data_frame`?")
+    assert gm.stage == Stage.FINISHED
+
+
+@mock.patch(
+    "IPython.core.display_functions.display",
+    autospec=True,
+)
+@mock.patch(
+    "openai.ChatCompletion.create",
+    return_value={"choices": [{"message": {"role": "assistant", "content": "Try `frame`"}}]},
+    autospec=True,
+)
+def test_custom_exc_escalates_unsure_diagnoses(create, display, ip):
+    ip.showtraceback = mock.MagicMock()
+    ip.execution_count = 2
+    ip.user_ns["In"] = None
+    ip.user_ns["frame"] = object()
+    ip.history_manager.input_hist_raw = ["", "frame = load()", "frm.head()"]
+
+    try:
+        exec("frm.head()", ip.user_ns)
+    except NameError:
+        (etype, evalue, tb) = sys.exc_info()
+
+    with mock.patch.object(suggestions, "suggestion_store", None):
+        suggestions.custom_exc(ip, etype, evalue, tb, tb_offset=None)
+
+    create.assert_called_once()
+    assert PastAssists.get(2).message == "## 💡 Suggestion\nTry `frame`"
+
+
+def test_custom_exc_streams_into_the_terminal(ip, capsys):
+    backend = FakeBackend(["Define ", "`undefined_thing`", " first."])
+
+    try:
+        exec("undefined_thing + 1", {})
+    except NameError:
+        (etype, evalue, tb) = sys.exc_info()
+
+    ip.showtraceback = mock.MagicMock()
+    ip.execution_count = 2
+    ip.user_ns["In"] = None
+    ip.history_manager.input_hist_raw = ["", "import pandas as pd", "undefined_thing + 1"]
+
+    with mock.patch.object(generate, "backend", backend), mock.patch.object(
+        suggestions, "is_terminal", return_value=True
+    ), mock.patch.object(suggestions, "suggestion_store", None):
+        suggestions.custom_exc(ip, etype, evalue, tb, tb_offset=None)
+
+    # Streamed, instead of waiting for the whole response
+    assert len(backend.requests) == 1
+    assert capsys.readouterr().out == (
+        "Let's see how we can fix this... 🔧\n"
+        "## 💡 Suggestion\n"
+        "Define `undefined_thing` first.\n"
+    )
+    assert PastAssists.get(2).message == "## 💡 Suggestion\nDefine `undefined_thing` first."
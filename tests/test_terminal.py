@@ -0,0 +1,148 @@
+import io
+import sys
+from unittest import mock
+
+import pytest
+
+from genai import terminal
+from genai.display import Stage
+from genai.terminal import BOLD, CODE, FENCE, RESET, MarkdownHighlighter, TerminalMarkdown
+
+
+class RecordingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.flushed = []
+
+    def flush(self):
+        self.flushed.append(self.getvalue())
+
+
+def test_terminal_markdown_writes_deltas_as_they_arrive():
+    stream = RecordingStream()
+    markdown = TerminalMarkdown(stream=stream, highlight=False)
+    markdown.display()
+
+    markdown.append("Use ")
+    # The first write is flushed right away
+    assert stream.flushed == ["Use "]
+
+    markdown.append("`pd.read_csv`")
+    markdown.append(" to load it.\nThen")
+    # Lines are flushed as they end
+    assert stream.flushed[-1] == "Use `pd.read_csv` to load it.\nThen"
+
+    markdown.stage = Stage.FINISHED
+    assert stream.getvalue() == "Use `pd.read_csv` to load it.\nThen\n"
+    assert markdown.message == "Use `pd.read_csv` to load it.\nThen"
+
+
+def test_terminal_markdown_throttles_flushes_within_a_line():
+    stream = RecordingStream()
+    markdown = TerminalMarkdown(stream=stream, highlight=False, max_updates_per_second=4)
+    markdown.display()
+
+    with mock.patch("genai.display.time.monotonic", return_value=100.0), mock.patch(
+        "genai.terminal.time.monotonic", return_value=100.0
+    ):
+        markdown.append("a")
+        markdown.append("b")
+        markdown.append("c")
+
+    assert stream.flushed == ["a"]
+    markdown.flush()
+    assert stream.flushed[-1] == "abc"
+
+
+def test_terminal_markdown_writes_new_messages_once():
+    stream = RecordingStream()
+    markdown = TerminalMarkdown("Let's see how we can fix this...", stream=stream, highlight=False)
+    markdown.display()
+
+    # A different message starts on a new line
+    markdown.message = "## Suggestion\n"
+    markdown.consume(iter(["Define ", "`df`"]))
+    # One that extends the message only writes the rest
+    markdown.message = markdown.message + " first"
+    markdown.stage = Stage.FINISHED
+
+    assert stream.getvalue() == (
+        "Let's see how we can fix this...\n## Suggestion\nDefine `df` first\n"
+    )
+
+
+def test_terminal_markdown_waits_for_display():
+    stream = RecordingStream()
+    markdown = TerminalMarkdown("Hello", stream=stream, highlight=False)
+    markdown.append(" world")
+    assert stream.getvalue() == ""
+
+    markdown.display()
+    assert stream.getvalue() == "Hello world"
+
+
+def highlight(*deltas):
+    highlighter = MarkdownHighlighter()
+    return "".join(highlighter.feed(delta) for delta in deltas) + highlighter.finish()
+
+
+def test_highlighter_styles_headings():
+    assert highlight("## Sugg", "estion\nText\n") == (
+        BOLD + "## Suggestion" + RESET + "\n" + "Text" + RESET + "\n"
+    )
+    # Not a heading without a space
+    assert highlight("#hashtag\n") == "#hashtag" + RESET + "\n"
+
+
+def test_highlighter_holds_back_ambiguous_line_starts():
+    highlighter = MarkdownHighlighter()
+    assert highlighter.feed("#") == ""
+    assert highlighter.feed("#") == ""
+    assert highlighter.feed(" Title") == BOLD + "## Title"
+    assert highlighter.feed("\nPlain") == RESET + "\nPlain"
+
+
+def test_highlighter_styles_code_blocks():
+    assert highlight("``", "`python\nx = 1\n", "```\nDone\n") == (
+        FENCE
+        + "```python"
+        + RESET
+        + "\n"
+        + CODE
+        + "x = 1"
+        + RESET
+        + "\n"
+        + FENCE
+        + "```"
+        + RESET
+        + "\n"
+        + "Done"
+        + RESET
+        + "\n"
+    )
+
+
+def test_highlighter_styles_inline_code():
+    assert highlight("Call `df.", "head()` now\n") == (
+        "Call " + CODE + "`df.head()`" + RESET + " now" + RESET + "\n"
+    )
+
+
+@pytest.mark.parametrize(
+    "stream_in_terminal,shell,isatty,expected",
+    [
+        (None, "TerminalInteractiveShell", True, True),
+        (None, "TerminalInteractiveShell", False, False),
+        (None, "ZMQInteractiveShell", True, False),
+        (True, "ZMQInteractiveShell", False, True),
+        (False, "TerminalInteractiveShell", True, False),
+    ],
+)
+def test_is_terminal(stream_in_terminal, shell, isatty, expected):
+    ipython = mock.Mock(__class__=mock.Mock(__name__=shell))
+    stdout = mock.Mock(isatty=mock.Mock(return_value=isatty))
+
+    with mock.patch.object(terminal, "stream_in_terminal", stream_in_terminal), mock.patch(
+        "IPython.get_ipython", return_value=ipython
+    ), mock.patch.object(sys, "stdout", stdout):
+        assert terminal.is_terminal() is expected
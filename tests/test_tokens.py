@@ -1,4 +1,71 @@
-from genai.tokens import MAX_TOKENS, num_tokens_from_messages, trim_messages_to_fit_token_limit
+from unittest import mock
+
+from genai.tokens import (
+    ELISION_MARKER,
+    MAX_TOKENS,
+    TokenCountCache,
+    context_token_budget,
+    encoding_for_model,
+    max_token_bytes,
+    num_tokens_bounds,
+    num_tokens_from_messages,
+    prewarm_encodings,
+    token_count_cache,
+    trim_messages_to_fit_token_limit,
+    truncate_message,
+    truncate_text,
+)
+
+
+class CountingEncoding:
+    """Whitespace "tokenizer" that records how often it was asked to encode"""
+
+    name = "counting"
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text):
+        self.calls += 1
+        return text.split()
+
+
+class CharacterEncoding:
+    """One token per character"""
+
+    name = "characters"
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, text):
+        self.encoded.append(len(text))
+        return list(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+    def decode_bytes(self, tokens):
+        return "".join(tokens).encode("utf-8")
+
+    def token_byte_values(self):
+        # Any one character, up to four bytes long
+        return [b"a", "é".encode(), "😀".encode()]
+
+
+class ByteEncoding:
+    """One token per UTF-8 byte, so tokens can split characters"""
+
+    name = "bytes"
+
+    def encode(self, text):
+        return list(text.encode("utf-8"))
+
+    def decode_bytes(self, tokens):
+        return bytes(tokens)
+
+    def token_byte_values(self):
+        return [bytes([i]) for i in range(256)]
 
 
 def test_num_tokens_from_messages():
@@ -52,3 +119,219 @@ def test_trim_messages_to_fit_token_limit():
     ]
 
     assert trimmed_messages == expected_messages
+
+
+def test_token_count_cache_hits_and_misses():
+    cache = TokenCountCache()
+    encoding = CountingEncoding()
+
+    assert cache.count("one two three", encoding) == 3
+    assert cache.count("one two three", encoding) == 3
+    assert cache.count("four", encoding) == 1
+
+    assert encoding.calls == 2
+    assert cache.hits == 1
+    assert cache.misses == 2
+
+
+def test_token_count_cache_keys_on_encoding():
+    cache = TokenCountCache()
+    encoding = CountingEncoding()
+    other_encoding = CountingEncoding()
+    other_encoding.name = "other"
+
+    cache.count("same text", encoding)
+    cache.count("same text", other_encoding)
+
+    assert cache.misses == 2
+    assert len(cache) == 2
+
+
+def test_token_count_cache_evicts_least_recently_used():
+    cache = TokenCountCache(maxsize=2)
+    encoding = CountingEncoding()
+
+    cache.count("a", encoding)
+    cache.count("b", encoding)
+    # Touch "a" so that "b" becomes the least recently used entry
+    cache.count("a", encoding)
+    cache.count("c", encoding)
+
+    assert len(cache) == 2
+
+    cache.count("a", encoding)
+    assert encoding.calls == 3
+
+    cache.count("b", encoding)
+    assert encoding.calls == 4
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.hits == 0
+    assert cache.misses == 0
+
+
+def test_trim_messages_matches_pop_and_recount():
+    messages = [
+        {"role": "user" if i % 2 == 0 else "system", "content": f"print({i} * 'genai')"}
+        for i in range(50)
+    ]
+    model = "gpt-3.5-turbo-0301"
+
+    expected = list(messages)
+    while num_tokens_from_messages(expected, model=model) > 200:
+        expected.pop(0)
+
+    assert trim_messages_to_fit_token_limit(list(messages), model=model, max_tokens=200) == expected
+
+
+def test_trim_messages_encodes_each_message_once():
+    token_count_cache.clear()
+    encoding = CountingEncoding()
+    messages = [{"role": "user", "content": f"message number {i}"} for i in range(20)]
+
+    with mock.patch("genai.tokens.encoding_for_model", return_value=encoding):
+        trimmed = trim_messages_to_fit_token_limit(messages, model="gpt-4", max_tokens=40)
+
+    # 4 + 1 (role) + 3 (content) tokens per message, plus 2 to prime the reply
+    assert len(trimmed) == 4
+    assert trimmed[0]["content"] == "message number 16"
+    # One encode for the "user" role and one per distinct content
+    assert encoding.calls == 21
+
+
+@mock.patch.dict("genai.tokens._encodings", clear=True)
+@mock.patch("tiktoken.get_encoding", autospec=True)
+def test_encoding_for_model_resolves_once(get_encoding):
+    get_encoding.return_value = CountingEncoding()
+
+    first = encoding_for_model("gpt-4")
+    second = encoding_for_model("gpt-4")
+
+    assert first is second
+    get_encoding.assert_called_once_with("cl100k_base")
+
+
+@mock.patch.dict("genai.tokens._encodings", clear=True)
+@mock.patch("tiktoken.get_encoding", autospec=True)
+def test_prewarm_encodings_in_background(get_encoding):
+    encoding = CountingEncoding()
+    get_encoding.return_value = encoding
+
+    thread = prewarm_encodings(["gpt-4", "gpt-3.5-turbo"])
+    thread.join(timeout=5)
+
+    assert get_encoding.call_count == 2
+    assert encoding_for_model("gpt-4") is encoding
+    assert get_encoding.call_count == 2
+
+
+@mock.patch.dict("genai.tokens._encodings", clear=True)
+@mock.patch("tiktoken.get_encoding", autospec=True, side_effect=OSError("offline"))
+def test_prewarm_encodings_ignores_failures(get_encoding):
+    assert prewarm_encodings(["gpt-4"], background=False) is None
+    get_encoding.assert_called_once_with("cl100k_base")
+
+
+def test_num_tokens_from_messages_uses_model_overheads():
+    messages = [{"role": "user", "content": "one two three"}]
+
+    with mock.patch("genai.tokens.encoding_for_model", return_value=CountingEncoding()):
+        # 4 per message, 1 for the role, 3 for the content, and 2 to prime the reply
+        assert num_tokens_from_messages(messages, model="gpt-4-0314") == 10
+        # 3 per message, 1 for the role, 3 for the content, and 3 to prime the reply
+        assert num_tokens_from_messages(messages, model="gpt-4-0613") == 10
+        # Unknown models no longer raise
+        assert num_tokens_from_messages(messages, model="gpt-5") == 10
+        assert num_tokens_from_messages(messages + messages, model="gpt-4-0613") == 17
+
+
+def test_context_token_budget():
+    messages = [{"role": "system", "content": "one two three"}]
+
+    with mock.patch("genai.tokens.encoding_for_model", return_value=CountingEncoding()):
+        # 8192 window, 1024 kept for the reply, 8 for the system message
+        assert context_token_budget("gpt-4", messages) == 8192 - 1024 - 8
+        assert context_token_budget("gpt-4") == 8192 - 1024
+
+
+def test_truncate_text_keeps_head_and_tail():
+    encoding = CharacterEncoding()
+    text = "a" * 50 + "b" * 100 + "c" * 50
+
+    truncated = truncate_text(text, 25, encoding)
+
+    # The 5 character marker leaves room for 10 characters on each side
+    assert truncated == "a" * 10 + ELISION_MARKER + "c" * 10
+    assert len(encoding.encode(truncated)) <= 25
+
+
+def test_truncate_text_within_limit_is_unchanged():
+    encoding = CharacterEncoding()
+
+    assert truncate_text("short", 25, encoding) == "short"
+
+
+def test_truncate_text_encodes_oversized_text_once():
+    encoding = CharacterEncoding()
+    text = "d" * 1500 + "e" * 1500
+
+    truncated = truncate_text(text, 512, encoding)
+
+    assert truncated.startswith("d") and truncated.endswith("e")
+    assert encoding.encoded.count(3000) == 1
+
+
+def test_truncate_text_within_limit_is_counted_for_later():
+    encoding = CharacterEncoding()
+    # Up to 1200 tokens, going by the bounds alone
+    text = "é" * 300
+
+    assert truncate_text(text, 400, encoding) == text
+    assert truncate_text(text, 400, encoding) == text
+    assert encoding.encoded == [300]
+    assert token_count_cache.get(text, encoding) == 300
+
+
+def test_truncate_text_does_not_split_characters():
+    # Every character is two bytes, and the cuts fall in the middle of one
+    truncated = truncate_text("é" * 100, 16, ByteEncoding())
+
+    assert "\ufffd" not in truncated
+    assert truncated == "é" * 3 + ELISION_MARKER + "é" * 2
+
+
+def test_truncate_message():
+    encoding = CharacterEncoding()
+    message = {"role": "system", "content": "x" * 100}
+
+    truncated = truncate_message(message, 15, encoding)
+
+    assert truncated == {"role": "system", "content": "xxxxx" + ELISION_MARKER + "xxxxx"}
+    # The original message is left alone
+    assert message["content"] == "x" * 100
+
+
+def test_max_token_bytes():
+    assert max_token_bytes(CharacterEncoding()) == 4
+    # Nothing to go on without a vocabulary
+    assert max_token_bytes(CountingEncoding()) is None
+
+
+def test_num_tokens_bounds():
+    encoding = CharacterEncoding()
+
+    assert num_tokens_bounds("", encoding) == (0, 0)
+    assert num_tokens_bounds("a" * 100, encoding) == (25, 100)
+    assert num_tokens_bounds("é" * 10, encoding) == (3, 40)
+    assert num_tokens_bounds("a" * 100, CountingEncoding()) == (0, 100)
+
+
+def test_truncate_text_only_encodes_head_and_tail_of_huge_text():
+    encoding = CharacterEncoding()
+    text = "a" * 1000 + "b" * 1_000_000 + "c" * 1000
+
+    truncated = truncate_text(text, 25, encoding)
+
+    assert truncated == "a" * 10 + ELISION_MARKER + "c" * 10
+    assert max(encoding.encoded) <= 2 * 25 * max_token_bytes(encoding)
@@ -0,0 +1,83 @@
+import threading
+
+from genai.worker import BackgroundWorker, QueuePolicy
+
+
+def test_background_worker_runs_jobs_in_order():
+    worker = BackgroundWorker()
+    ran = []
+
+    for i in range(3):
+        worker.submit(lambda i=i: ran.append(i))
+
+    assert worker.wait(timeout=5)
+    assert ran == [0, 1, 2]
+    assert not worker.busy
+
+
+def blocking_job(worker):
+    """Submit a job that holds up the worker until the returned event is set"""
+    started = threading.Event()
+    release = threading.Event()
+
+    def run():
+        started.set()
+        release.wait(timeout=5)
+
+    worker.submit(run)
+    started.wait(timeout=5)
+    return release
+
+
+def test_background_worker_drops_oldest_when_full():
+    worker = BackgroundWorker(max_pending=2, policy=QueuePolicy.QUEUE)
+    ran, dropped = [], []
+
+    release = blocking_job(worker)
+    for i in range(4):
+        worker.submit(lambda i=i: ran.append(i), on_drop=lambda i=i: dropped.append(i))
+
+    assert worker.pending == 2
+    release.set()
+
+    assert worker.wait(timeout=5)
+    assert dropped == [0, 1]
+    assert ran == [2, 3]
+
+
+def test_background_worker_latest_policy():
+    worker = BackgroundWorker(policy="latest")
+    ran, dropped = [], []
+
+    release = blocking_job(worker)
+    for i in range(3):
+        worker.submit(lambda i=i: ran.append(i), on_drop=lambda i=i: dropped.append(i))
+
+    release.set()
+
+    assert worker.wait(timeout=5)
+    assert dropped == [0, 1]
+    assert ran == [2]
+
+
+def test_background_worker_survives_failing_jobs():
+    worker = BackgroundWorker()
+    ran = []
+
+    worker.submit(lambda: 1 / 0)
+    worker.submit(lambda: ran.append("after"))
+
+    assert worker.wait(timeout=5)
+    assert ran == ["after"]
+
+
+def test_background_worker_runs_jobs_concurrently():
+    worker = BackgroundWorker(max_workers=2)
+    both_started = threading.Barrier(2, timeout=5)
+    ran = []
+
+    for i in range(2):
+        worker.submit(lambda i=i: (both_started.wait(), ran.append(i)))
+
+    assert worker.wait(timeout=5)
+    assert sorted(ran) == [0, 1]